@@ -25,6 +25,7 @@ CREATE TABLE locations (
     pincode VARCHAR(10),
     latitude DECIMAL(10, 8),
     longitude DECIMAL(11, 8),
+    canonical_key VARCHAR(255) UNIQUE, -- normalized (country, state, district, city, pincode)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -89,6 +90,50 @@ CREATE TABLE weather_data (
     UNIQUE KEY unique_location_date (location_id, date)
 );
 
+-- Weather Rollups (weekly, monthly and seasonal summaries of weather_data)
+CREATE TABLE weather_rollups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    location_id INTEGER NOT NULL,
+    period_type ENUM('week', 'month', 'season') NOT NULL,
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    label VARCHAR(20), -- e.g. 2025-W23, 2025-06, kharif 2025
+    season ENUM('kharif', 'rabi', 'zaid'), -- season rollups only
+    days INTEGER NOT NULL, -- daily readings aggregated
+    temperature_avg DECIMAL(5, 2),
+    temperature_min DECIMAL(5, 2),
+    temperature_max DECIMAL(5, 2),
+    rainfall_total DECIMAL(8, 2), -- in mm
+    humidity_avg DECIMAL(5, 2),
+    evapotranspiration_total DECIMAL(8, 2), -- in mm
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (location_id) REFERENCES locations(id),
+    UNIQUE KEY unique_weather_rollup (location_id, period_type, period_start)
+);
+
+-- Farm Features (crop model input assembled from soil tests and local weather)
+CREATE TABLE farm_features (
+    farm_id INTEGER PRIMARY KEY,
+    location_id INTEGER NOT NULL,
+    weather_location_id INTEGER, -- a nearby location when the farm's has no weather
+    soil_data_id INTEGER, -- latest soil test used
+    soil_test_date DATE,
+    nitrogen DECIMAL(5, 2),
+    phosphorus DECIMAL(5, 2),
+    potassium DECIMAL(5, 2),
+    ph DECIMAL(3, 1),
+    temperature DECIMAL(5, 2), -- mean over the climate window
+    humidity DECIMAL(5, 2), -- mean over the climate window
+    rainfall DECIMAL(8, 2), -- annual, in mm
+    weather_days INTEGER NOT NULL DEFAULT 0, -- daily readings in the rainfall window
+    weather_start DATE,
+    weather_end DATE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (farm_id) REFERENCES farms(id) ON DELETE CASCADE,
+    FOREIGN KEY (location_id) REFERENCES locations(id),
+    FOREIGN KEY (weather_location_id) REFERENCES locations(id)
+);
+
 -- Crop Master Data
 CREATE TABLE crops (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -130,6 +175,13 @@ CREATE TABLE crop_requirements (
     FOREIGN KEY (crop_id) REFERENCES crops(id) ON DELETE CASCADE
 );
 
+-- Data Versions (bumped by every commit changing a dataset that workers cache)
+CREATE TABLE data_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Fertilizer Master Data
 CREATE TABLE fertilizers (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -210,6 +262,23 @@ CREATE TABLE market_prices (
     FOREIGN KEY (location_id) REFERENCES locations(id)
 );
 
+-- Price Forecasts (latest batch forecast per crop/location series)
+CREATE TABLE price_forecasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    crop_id INTEGER NOT NULL,
+    location_id INTEGER NOT NULL,
+    forecast_date DATE NOT NULL,
+    horizon_days INTEGER NOT NULL,
+    price_per_quintal DECIMAL(10, 2) NOT NULL,
+    lower_bound DECIMAL(10, 2),
+    upper_bound DECIMAL(10, 2),
+    model VARCHAR(30), -- e.g. ses(0.3), holt(0.5,0.1), seasonal_naive
+    holdout_mae DECIMAL(10, 2),
+    generated_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (crop_id) REFERENCES crops(id),
+    FOREIGN KEY (location_id) REFERENCES locations(id)
+);
+
 -- Crop Recommendations History
 CREATE TABLE crop_recommendations (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -230,6 +299,22 @@ CREATE TABLE crop_recommendations (
     FOREIGN KEY (farm_id) REFERENCES farms(id)
 );
 
+-- Batch Job Checkpoints (one row per shard of a resumable run)
+CREATE TABLE batch_checkpoints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job VARCHAR(50) NOT NULL,
+    shard INTEGER NOT NULL,
+    start_id INTEGER NOT NULL, -- exclusive
+    end_id INTEGER NOT NULL, -- inclusive
+    last_id INTEGER NOT NULL, -- last id committed
+    processed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    run_started_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
+    UNIQUE(job, shard)
+);
+
 -- Fertilizer Recommendations History
 CREATE TABLE fertilizer_recommendations (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -287,9 +372,11 @@ CREATE TABLE notifications (
     expiry_date DATE,
     location_specific BOOLEAN DEFAULT FALSE,
     location_id INTEGER,
+    idempotency_key VARCHAR(64), -- set by fan-outs; one notification per user and key
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id),
-    FOREIGN KEY (location_id) REFERENCES locations(id)
+    FOREIGN KEY (location_id) REFERENCES locations(id),
+    UNIQUE(user_id, idempotency_key)
 );
 
 -- Farm Activities Log
@@ -353,6 +440,9 @@ CREATE TABLE knowledge_base (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Knowledge base search index (rowid = knowledge_base.id, published articles only; see knowledge_search.py)
+CREATE VIRTUAL TABLE knowledge_base_fts USING fts5(title, content, tags, tokenize = 'unicode61 remove_diacritics 2');
+
 -- User Preferences and Settings
 CREATE TABLE user_preferences (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -373,8 +463,13 @@ CREATE INDEX idx_users_username ON users(username);
 CREATE INDEX idx_farms_user_id ON farms(user_id);
 CREATE INDEX idx_soil_data_farm_id ON soil_data(farm_id);
 CREATE INDEX idx_weather_data_location_date ON weather_data(location_id, date);
+CREATE INDEX idx_farm_features_location ON farm_features(location_id);
+CREATE INDEX idx_farm_features_weather_location ON farm_features(weather_location_id);
 CREATE INDEX idx_market_prices_crop_location_date ON market_prices(crop_id, location_id, date);
+CREATE UNIQUE INDEX unique_market_price ON market_prices(crop_id, location_id, market_name, date, quality_grade);
+CREATE INDEX idx_price_forecasts_crop_location_date ON price_forecasts(crop_id, location_id, forecast_date);
 CREATE INDEX idx_crop_recommendations_user_farm ON crop_recommendations(user_id, farm_id);
 CREATE INDEX idx_notifications_user_read ON notifications(user_id, is_read);
+CREATE INDEX idx_notifications_location_type ON notifications(location_id, notification_type, expiry_date);
 CREATE INDEX idx_farm_activities_farm_date ON farm_activities(farm_id, activity_date);
 CREATE INDEX idx_yield_records_farm_year_season ON yield_records(farm_id, year, season);
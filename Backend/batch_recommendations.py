@@ -0,0 +1,306 @@
+"""
+Batch Crop Recommendations
+For Agriculture Advisory System
+
+Precomputes a crop recommendation for every farm, so recommendations are
+ready before farmers log in. Run it nightly, after weather ingest:
+
+    python batch_recommendations.py --workers 4
+
+The farm id range is split into shards (SHARDS_PER_WORKER per worker), and
+each shard is streamed in chunks of CHUNK_SIZE farms by id. Per chunk:
+- the feature vectors are read from farm_features; farms without a row yet
+  are assembled first
+- the crop model scores the whole chunk with one predict_proba call
+- the top TOP_CROPS crops of every farm are bulk-inserted as
+  crop_recommendations rows
+
+A chunk's rows and its shard's checkpoint (batch_checkpoints) are committed
+in the same transaction, so after an interruption
+
+    python batch_recommendations.py --resume
+
+continues every shard after its last committed chunk, without duplicates.
+Farms missing a soil test or weather are skipped and counted.
+
+Batch rows are marked source='batch'. The same transaction deletes the
+farm's earlier batch rows for the season and year that are still pending,
+so a farm has one current batch recommendation however often the job runs.
+Recommendations farmers requested, and batch rows they acted on, are kept.
+Databases from before the marker lack the source column and its index,
+which create_all does not add to an existing table; warmup and the job add
+them (ensure_recommendation_source).
+
+Workers are spawned processes, each with its own database connection. The
+forest artifact is memory-mapped, so they share the model's pages.
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import Float, func, inspect, select, type_coerce
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from flask_models import db, BatchCheckpoint, CropRecommendation, Farm, FarmFeature
+from farm_features import FEATURES, refresh_farm_features
+from model_registry import ModelRegistry
+from weather_rollups import season_of
+
+JOB = 'crop_recommendations'
+CHUNK_SIZE = 1000
+SHARDS_PER_WORKER = 4
+TOP_CROPS = 3
+SOURCE = 'batch'
+
+INSERT_COLUMNS = ('user_id', 'farm_id', 'recommended_crops', 'input_parameters', 'model_version',
+                  'confidence_score', 'season', 'year', 'implementation_status', 'source', 'created_at')
+
+# Per-process state of pool workers, set by _init_worker
+_worker_model = None
+
+
+def _has_source_column(connection):
+    return any(column['name'] == 'source' for column in inspect(connection).get_columns('crop_recommendations'))
+
+
+def ensure_recommendation_source():
+    """Add source and its farm/season index to a crop_recommendations table created before them
+
+    Run at warmup and before each batch, like ensure_canonical_key_column; a
+    worker racing another to add the column finds it already there. Returns
+    True when the column was added.
+    """
+    try:
+        with db.engine.begin() as connection:
+            added = not _has_source_column(connection)
+            if added:
+                connection.exec_driver_sql("ALTER TABLE crop_recommendations ADD COLUMN source VARCHAR(20)")
+    except (OperationalError, ProgrammingError):
+        with db.engine.connect() as connection:
+            if not _has_source_column(connection):
+                raise
+        added = False
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_crop_recommendations_farm_season "
+                                   "ON crop_recommendations (farm_id, season, year)")
+    return added
+
+
+def load_crop_model(models_dir='models'):
+    """The current crop model, or None when none has been trained"""
+    registry = ModelRegistry(models_dir)
+    registry.load_all()
+    return registry.get('crop')
+
+
+def plan_shards(shards, run_started_at):
+    """Replace the job's checkpoints with `shards` fresh ones over the current farm ids"""
+    BatchCheckpoint.query.filter_by(job=JOB).delete(synchronize_session=False)
+    first, last = db.session.query(func.min(Farm.id), func.max(Farm.id)).one()
+    if first is None:
+        db.session.commit()
+        return []
+    bounds = np.unique(np.linspace(first - 1, last, shards + 1).round().astype(int)).tolist()
+    for shard, (start_id, end_id) in enumerate(zip(bounds, bounds[1:])):
+        db.session.add(BatchCheckpoint(job=JOB, shard=shard, start_id=start_id, end_id=end_id, last_id=start_id,
+                                       run_started_at=run_started_at))
+    db.session.commit()
+    return pending_shards()
+
+
+def pending_shards():
+    """Shards of the job not yet completed"""
+    return [shard for shard, in db.session.query(BatchCheckpoint.shard).filter(
+        BatchCheckpoint.job == JOB, BatchCheckpoint.completed_at.is_(None)).order_by(BatchCheckpoint.shard)]
+
+
+def _features(farm_ids):
+    table = FarmFeature.__table__
+    query = select(table.c.farm_id, *[type_coerce(table.c[name], Float) for name in FEATURES]).where(
+        table.c.farm_id.in_(farm_ids))
+    return pd.DataFrame(db.session.connection().execute(query).fetchall(),
+                        columns=('farm_id',) + FEATURES).set_index('farm_id')
+
+
+def load_chunk(after_id, end_id, chunk_size=CHUNK_SIZE):
+    """The next farms after after_id (up to end_id), with their feature vectors"""
+    farms = pd.DataFrame(db.session.query(Farm.id, Farm.user_id).filter(
+        Farm.id > after_id, Farm.id <= end_id).order_by(Farm.id).limit(chunk_size).all(),
+        columns=['farm_id', 'user_id'])
+    if not len(farms):
+        return farms
+    features = _features(farms['farm_id'].tolist())
+    missing = farms.loc[~farms['farm_id'].isin(features.index), 'farm_id'].tolist()
+    if missing:
+        refresh_farm_features(missing)
+        features = pd.concat([features, _features(missing)])
+    return farms.join(features.astype(float), on='farm_id')
+
+
+def score_chunk(model, farms, top=TOP_CROPS):
+    """Recommendation rows (minus run fields) for the farms with every feature known"""
+    inputs = farms[list(FEATURES)].to_numpy(dtype=float)
+    complete = ~np.isnan(inputs).any(axis=1)
+    farms, inputs = farms[complete], inputs[complete]
+    if not len(farms):
+        return []
+
+    probabilities = np.asarray(model.predict_proba(inputs))
+    best = np.argsort(probabilities, axis=1)[:, ::-1][:, :top]
+    confidence = np.take_along_axis(probabilities, best, axis=1)
+    names = np.array([str(name).title() for name in model.classes], dtype=object)[best].tolist()
+    percents = np.round(confidence * 100, 2).tolist()
+    yields = np.random.randint(35, 56, size=best.shape).tolist()
+
+    rows = []
+    for index, (farm_id, user_id) in enumerate(zip(farms['farm_id'].tolist(), farms['user_id'].tolist())):
+        crops = [{'name': name, 'confidence': percent, 'expected_yield': f'{expected} quintals/acre'}
+                 for name, percent, expected in zip(names[index], percents[index], yields[index])]
+        rows.append((user_id, farm_id, json.dumps(crops),
+                     json.dumps(dict(zip(FEATURES, inputs[index].tolist()))),
+                     model.model_version, round(float(confidence[index, 0]), 4)))
+    return rows
+
+
+def replace_recommendations(rows, season, year):
+    """Insert batch rows in place of the same farms' earlier pending batch rows for the season"""
+    table = CropRecommendation.__table__
+    db.session.execute(table.delete().where(
+        table.c.farm_id.in_([row[1] for row in rows]), table.c.season == season, table.c.year == year,
+        table.c.source == SOURCE, table.c.implementation_status == 'pending'))
+    insert_recommendations(rows)
+
+
+def insert_recommendations(rows):
+    connection = db.session.connection()
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    connection.exec_driver_sql(
+        f"INSERT INTO {CropRecommendation.__tablename__} ({', '.join(INSERT_COLUMNS)}) "
+        f"VALUES ({', '.join([placeholder] * len(INSERT_COLUMNS))})", rows)
+
+
+def process_shard(shard, model, chunk_size=CHUNK_SIZE):
+    """Recommend for the rest of a shard, committing each chunk with the checkpoint
+
+    Returns (farms recommended, farms skipped) by this call.
+    """
+    checkpoint = BatchCheckpoint.query.filter_by(job=JOB, shard=shard).one()
+    season = str(season_of([checkpoint.run_started_at.month])[0])
+    year = checkpoint.run_started_at.year
+    processed = skipped = 0
+    while checkpoint.completed_at is None:
+        try:
+            farms = load_chunk(checkpoint.last_id, checkpoint.end_id, chunk_size)
+            if len(farms):
+                created_at = datetime.utcnow().isoformat(' ')
+                rows = [row + (season, year, 'pending', SOURCE, created_at) for row in score_chunk(model, farms)]
+                if rows:
+                    replace_recommendations(rows, season, year)
+                checkpoint.last_id = int(farms['farm_id'].iloc[-1])
+                checkpoint.processed += len(rows)
+                checkpoint.skipped += len(farms) - len(rows)
+                processed += len(rows)
+                skipped += len(farms) - len(rows)
+            if len(farms) < chunk_size or checkpoint.last_id >= checkpoint.end_id:
+                checkpoint.completed_at = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return processed, skipped
+
+
+def _init_worker(models_dir):
+    global _worker_model
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    app.app_context().push()
+    _worker_model = load_crop_model(models_dir)
+
+
+def _run_shard(args):
+    shard, chunk_size = args
+    return (shard,) + process_shard(shard, _worker_model, chunk_size)
+
+
+def run_batch(workers=1, chunk_size=CHUNK_SIZE, resume=False, models_dir='models'):
+    """Recommend for every farm; returns a summary of the run
+
+    With workers > 1 the shards are spread over a spawned process pool,
+    which must be able to import complete_app.
+    """
+    started = time.perf_counter()
+    model = load_crop_model(models_dir)
+    if model is None:
+        raise RuntimeError(f"No crop model found in {models_dir}; run train_models.py first")
+    ensure_recommendation_source()
+
+    shards = pending_shards() if resume else []
+    resumed = bool(shards)
+    if not resumed:
+        shards = plan_shards(max(workers, 1) * SHARDS_PER_WORKER, datetime.utcnow())
+
+    processed = skipped = 0
+    if workers > 1 and len(shards) > 1:
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(min(workers, len(shards)), initializer=_init_worker, initargs=(models_dir,)) as pool:
+            for shard, shard_processed, shard_skipped in pool.imap_unordered(
+                    _run_shard, [(shard, chunk_size) for shard in shards]):
+                processed += shard_processed
+                skipped += shard_skipped
+                print(f"   • shard {shard}: {shard_processed:,} farms")
+    else:
+        for shard in shards:
+            shard_processed, shard_skipped = process_shard(shard, model, chunk_size)
+            processed += shard_processed
+            skipped += shard_skipped
+            print(f"   • shard {shard}: {shard_processed:,} farms")
+
+    seconds = time.perf_counter() - started
+    return {
+        'resumed': resumed,
+        'shards': len(shards),
+        'farms': processed,
+        'skipped': skipped,
+        'model_version': model.model_version,
+        'seconds': round(seconds, 3),
+        'farms_per_second': round((processed + skipped) / seconds, 1) if seconds else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute crop recommendations for every farm')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Farms scored per model call')
+    parser.add_argument('--resume', action='store_true', help='Continue the last interrupted run')
+    parser.add_argument('--models-dir', default='models', help='Directory of trained models')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        try:
+            summary = run_batch(args.workers, args.chunk_size, args.resume, args.models_dir)
+        except RuntimeError as e:
+            print(f"❌ {str(e)}")
+            return
+        except KeyboardInterrupt:
+            print("⚠️ Interrupted; committed chunks are kept, rerun with --resume to finish")
+            return
+    if args.resume and not summary['resumed']:
+        print("⚠️ No interrupted run found; started a new one")
+    print(f"✅ Recommended crops for {summary['farms']:,} farms in {summary['seconds']}s "
+          f"({summary['farms_per_second']:,} farms/s, model {summary['model_version']}), "
+          f"skipped {summary['skipped']:,} without soil or weather data")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Model Server Benchmark
+For Agriculture Advisory System
+
+Compares in-worker inference (every worker maps its own model) with the
+shared model server sidecar. It starts N worker processes that each fire
+single-row crop predictions, then reports p50/p99 latency and the total
+proportional set size (PSS) of all processes involved.
+
+Usage:
+    python benchmark_model_server.py --workers 4 --requests 500 --models-dir models
+"""
+
+import numpy as np
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from model_artifacts import load_model_bundle
+from model_server import ModelServer, ModelServerClient, load_server_models
+
+
+def read_pss_kb(pid='self'):
+    """Proportional set size of a process in kB (Linux only, 0 elsewhere)"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _sample_rows(n, seed):
+    rng = np.random.RandomState(seed)
+    low = np.array([0, 5, 5, 8.8, 14, 3.5, 20])
+    high = np.array([140, 145, 205, 43.7, 100, 9.9, 300])
+    return rng.uniform(low, high, size=(n, len(low)))
+
+
+def _worker(mode, models_dir, socket_path, n_requests, seed, start_event, results):
+    if mode == 'in-worker':
+        model = load_model_bundle(os.path.join(models_dir, 'crop_recommendation'),
+                                  os.path.join(models_dir, 'crop_recommendation_model.pkl'))
+        predict = model.predict_proba
+    else:
+        client = ModelServerClient(socket_path)
+        predict = lambda rows: client.predict_proba('crop', rows)
+
+    rows = _sample_rows(n_requests, seed)
+    predict(rows[:1])
+    start_event.wait()
+
+    latencies = []
+    for i in range(n_requests):
+        started = time.perf_counter()
+        predict(rows[i:i + 1])
+        latencies.append((time.perf_counter() - started) * 1000.0)
+
+    results.put({'latencies': latencies, 'pss_kb': read_pss_kb()})
+
+
+def _serve(models_dir, socket_path, ready_event):
+    server = ModelServer(socket_path, load_server_models(models_dir))
+    ready_event.set()
+    server.serve_forever()
+
+
+def run_mode(mode, models_dir, n_workers, n_requests):
+    """Run one benchmark mode and return its latency and memory summary"""
+    ctx = multiprocessing.get_context('spawn')
+    socket_path = os.path.join(tempfile.mkdtemp(), 'models.sock')
+    server_process = None
+
+    if mode == 'sidecar':
+        ready = ctx.Event()
+        server_process = ctx.Process(target=_serve, args=(models_dir, socket_path, ready), daemon=True)
+        server_process.start()
+        ready.wait(30)
+
+    start_event = ctx.Event()
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(mode, models_dir, socket_path, n_requests, seed, start_event, results))
+               for seed in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.0)
+
+    started = time.perf_counter()
+    start_event.set()
+    collected = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+
+    server_pss = read_pss_kb(server_process.pid) if server_process else 0
+    for worker in workers:
+        worker.join()
+    if server_process:
+        server_process.terminate()
+        server_process.join()
+
+    latencies = np.concatenate([r['latencies'] for r in collected])
+    return {
+        'mode': mode,
+        'workers': n_workers,
+        'requests': int(latencies.size),
+        'throughput_rps': round(latencies.size / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'total_pss_mb': round((sum(r['pss_kb'] for r in collected) + server_pss) / 1024.0, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare in-worker inference with the shared model server')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args.models_dir, args.workers, args.requests) for mode in ('in-worker', 'sidecar')]
+    for result in results:
+        print(f"📊 {result['mode']:<10} p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+              f"throughput={result['throughput_rps']}/s total PSS={result['total_pss_mb']}MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
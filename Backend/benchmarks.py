@@ -0,0 +1,573 @@
+"""
+Benchmark Suite
+For Agriculture Advisory System
+
+Times the advisory hot paths against synthetic databases at several scale
+factors and writes the results as JSON. Each scale factor runs in its own
+process with a fresh SQLite database, so results do not depend on whatever
+is in the development database.
+
+Two result files can be compared. A case whose median time grows by more
+than the threshold is reported as a regression, and the command then exits
+non-zero, so it can gate CI.
+
+The import command measures mandi price import throughput on a generated
+Agmarknet-style feed: one fresh pass, then a repeat pass where every row is
+a duplicate.
+
+Usage:
+    python benchmarks.py run --scales 1 10 --repeat 50 --output results.json
+    python benchmarks.py compare baseline.json results.json --threshold 0.15
+    python benchmarks.py import --rows 1000000
+"""
+
+import numpy as np
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BENCHMARK_USERNAME = 'farmer1'
+SAMPLE_QUERIES = [
+    'My crop leaves are turning yellow',
+    'Which fertilizer should I use for wheat?',
+    'Will it rain this week, what temperature is expected?',
+    'Insects are eating my cotton, how to control the pest?',
+    'My plants look sick, what disease is this?',
+    'When should I sell my onions?'
+]
+SAMPLE_DISEASES = ['Late Blight', 'early blight', 'Aphid Infestation', 'Rust', 'Mosaic Virus', '']
+# Synthetic data generated per unit of benchmark scale (see populate_database.generate_synthetic_data)
+BACKGROUND_SCALE = 0.1
+# Regressions smaller than this many milliseconds are treated as noise
+MIN_REGRESSION_MS = 0.05
+
+CASES = []
+
+
+def benchmark(name, kind='function'):
+    """Register a case; the decorated setup function returns the callable to time"""
+    def decorator(setup):
+        CASES.append({'name': name, 'kind': kind, 'setup': setup})
+        return setup
+    return decorator
+
+
+def summarize(samples_ms):
+    samples = np.asarray(samples_ms)
+    median = float(np.median(samples))
+    return {
+        'iterations': int(samples.size),
+        'min_ms': round(float(samples.min()), 4),
+        'median_ms': round(median, 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'mean_ms': round(float(samples.mean()), 4),
+        'ops_per_sec': round(1000.0 / median, 1) if median else None
+    }
+
+
+def measure(func, repeat, warmup=3):
+    """Time repeat calls of func after a few untimed warmup calls"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return summarize(samples)
+
+
+def seed_benchmark_data(scale, seed):
+    """Synthetic data for the scale factor, plus a benchmark user whose history grows with it"""
+    from sqlalchemy import insert
+    from flask_models import db, User, Farm, Location, Crop, SoilData, FarmActivity, CropRecommendation, Notification
+    from populate_database import generate_synthetic_data
+
+    generate_synthetic_data(scale * BACKGROUND_SCALE, seed=seed, years=1)
+
+    rng = np.random.RandomState(seed)
+    user = User.query.filter_by(username=BENCHMARK_USERNAME).first()
+    location_ids = [location.id for location in Location.query.all()]
+    crop_ids = [crop.id for crop in Crop.query.all()]
+    today = date.today()
+
+    # Extra farms for the benchmark user, so per-farm loops grow with the scale
+    db.session.execute(insert(Farm.__table__), [{
+        'user_id': user.id, 'farm_name': f'Benchmark Farm {i}',
+        'location_id': location_ids[i % len(location_ids)], 'total_area': round(float(rng.uniform(2, 40)), 2),
+        'farm_type': 'conventional', 'irrigation_type': 'drip', 'soil_type': 'Loamy',
+        'created_at': datetime.utcnow()
+    } for i in range(4 * scale)])
+    farm_ids = [farm.id for farm in Farm.query.filter_by(user_id=user.id).all()]
+
+    db.session.execute(insert(SoilData.__table__), [{
+        'farm_id': farm_id, 'nitrogen_content': round(float(rng.uniform(20, 80)), 2),
+        'phosphorus_content': round(float(rng.uniform(15, 60)), 2),
+        'potassium_content': round(float(rng.uniform(25, 70)), 2), 'ph_level': round(float(rng.uniform(6, 8)), 1),
+        'test_date': today - timedelta(days=int(rng.randint(1, 365))), 'created_at': datetime.utcnow()
+    } for farm_id in farm_ids for _ in range(3)])
+
+    db.session.execute(insert(FarmActivity.__table__), [{
+        'farm_id': farm_id, 'crop_id': crop_ids[int(rng.randint(len(crop_ids)))], 'activity_type': 'irrigation',
+        'activity_description': 'Scheduled irrigation', 'activity_date': today - timedelta(days=int(rng.randint(1, 365))),
+        'created_at': datetime.utcnow()
+    } for farm_id in farm_ids for _ in range(10)])
+
+    db.session.execute(insert(CropRecommendation.__table__), [{
+        'user_id': user.id, 'farm_id': farm_ids[i % len(farm_ids)],
+        'recommended_crops': json.dumps([{'name': 'Rice', 'confidence': 85.2, 'expected_yield': '45 quintals/acre'},
+                                         {'name': 'Wheat', 'confidence': 78.6, 'expected_yield': '42 quintals/acre'}]),
+        'input_parameters': json.dumps({'nitrogen': 65, 'phosphorus': 45, 'potassium': 55, 'temperature': 28,
+                                        'humidity': 70, 'ph': 6.8, 'rainfall': 800}),
+        'season': 'kharif', 'year': today.year, 'created_at': datetime.utcnow()
+    } for i in range(20 * scale)])
+
+    db.session.execute(insert(Notification.__table__), [{
+        'user_id': user.id, 'notification_type': 'market_price', 'title': f'Price update {i}',
+        'message': 'Prices changed in your local market.', 'priority': 'low', 'is_read': False,
+        'created_at': datetime.utcnow()
+    } for i in range(10 * scale)])
+
+    db.session.commit()
+    return {table.name: db.session.query(table).count() for table in db.metadata.sorted_tables}
+
+
+@benchmark('predict_crops')
+def _predict_crops(app_module, context):
+    row = np.array([[50.0, 40.0, 40.0, 25.0, 70.0, 6.5, 100.0]])
+    return lambda: app_module.predict_crops(row)
+
+
+@benchmark('predict_fertilizer')
+def _predict_fertilizer(app_module, context):
+    crop_id = context['crop_id']
+    return lambda: app_module.predict_fertilizer(crop_id, 40.0, 25.0, 30.0, 6.5)
+
+
+@benchmark('process_agricultural_query')
+def _process_query(app_module, context):
+    process = app_module.voice_assistant.process_agricultural_query
+    return lambda: [process(query) for query in SAMPLE_QUERIES]
+
+
+@benchmark('get_pesticide_recommendations')
+def _pesticide_recommendations(app_module, context):
+    lookup = app_module.get_pesticide_recommendations
+    return lambda: [lookup(disease) for disease in SAMPLE_DISEASES]
+
+
+@benchmark('json_column_parsing')
+def _json_columns(app_module, context):
+    recommendations = app_module.CropRecommendation.query.all()
+    context['rows'] = len(recommendations)
+    return lambda: [(r.get_recommended_crops(), r.get_input_parameters()) for r in recommendations]
+
+
+@benchmark('market_analytics_compute')
+def _market_analytics(app_module, context):
+    from market_analytics import compute_market_analytics
+    return compute_market_analytics
+
+
+@benchmark('price_forecast_fit')
+def _price_forecast(app_module, context):
+    from market_analytics import load_prices, price_matrix
+    from price_forecast import HISTORY_DAYS, fit_forecasts
+    as_of, prices = load_prices(HISTORY_DAYS)
+    matrix = price_matrix(prices, as_of, HISTORY_DAYS)
+    context['rows'] = matrix.shape[1]
+    return lambda: fit_forecasts(matrix)
+
+
+@benchmark('crop_suitability_rank')
+def _crop_suitability(app_module, context):
+    from crop_suitability import FEATURES, SuitabilityMatrix
+    rng = np.random.default_rng(context['seed'])
+    low = rng.uniform([10, 30, 4.5, 300], [25, 60, 6.0, 900], size=(100, 4))
+    high = low + rng.uniform([5, 15, 0.5, 200], [15, 35, 2.5, 1500], size=(100, 4))
+    matrix = SuitabilityMatrix(np.arange(1, 101), [f'crop {i}' for i in range(1, 101)], low,
+                               (low + high) / 2, high, rng.uniform(20, 150, size=(100, 3)))
+    farms = rng.uniform([0, 0, 0, 5, 20, 4, 100], [200, 100, 200, 40, 95, 9, 3000], size=(10000, len(FEATURES)))
+    context['rows'] = len(farms)
+    return lambda: matrix.top(farms, top=5)
+
+
+@benchmark('batch_recommendations_chunk')
+def _batch_recommendations(app_module, context):
+    import pandas as pd
+    from batch_recommendations import CHUNK_SIZE, FEATURES, score_chunk
+    model = app_module.model_registry.get('crop')
+    if model is None:
+        raise RuntimeError('no crop model loaded')
+    rng = np.random.default_rng(context['seed'])
+    farms = pd.DataFrame(rng.uniform([0, 5, 5, 8, 14, 3.5, 20], [140, 145, 205, 44, 100, 10, 300],
+                                     size=(CHUNK_SIZE, len(FEATURES))), columns=FEATURES)
+    farms['farm_id'] = np.arange(1, CHUNK_SIZE + 1)
+    farms['user_id'] = 1
+    context['rows'] = CHUNK_SIZE
+    return lambda: score_chunk(model, farms)
+
+
+@benchmark('disease_risk_evaluate')
+def _disease_risk(app_module, context):
+    from disease_risk import MAX_WINDOW_DAYS, WEATHER_VARIABLES, RuleSet
+    rng = np.random.default_rng(context['seed'])
+    rules = RuleSet([{'conditions': {
+        'temperature': {'min': low, 'max': low + width}, 'humidity': {'min': humidity},
+        'min_days': int(rng.integers(2, 6)), 'window_days': int(rng.integers(5, 15))
+    }} for low, width, humidity in zip(rng.uniform(10, 25, 50), rng.uniform(5, 12, 50), rng.uniform(60, 90, 50))])
+    weather = rng.normal([25, 30, 20, 75, 3, 10], [6, 6, 6, 15, 5, 4],
+                         size=(2000, MAX_WINDOW_DAYS, len(WEATHER_VARIABLES)))
+    context['rows'] = len(weather)
+    return lambda: rules.favorable_days(weather)
+
+
+@benchmark('location_index_nearest')
+def _location_index(app_module, context):
+    from location_index import SpatialIndex
+    rng = np.random.default_rng(context['seed'])
+    index = SpatialIndex()
+    points = rng.uniform([8, 68], [37, 97], size=(100000, 2))
+    index.add(np.arange(len(points)), points[:, 0], points[:, 1])
+    # A handful of late additions stay in the pending buffer, as between rebuilds
+    index.add(np.arange(len(points), len(points) + 100), *rng.uniform([8, 68], [37, 97], size=(100, 2)).T)
+    queries = rng.uniform([8, 68], [37, 97], size=(100, 2))
+    context['rows'] = len(queries)
+    return lambda: [index.nearest(latitude, longitude, k=5, max_km=50) for latitude, longitude in queries]
+
+
+def _route(path):
+    def setup(app_module, context):
+        client = context['client']
+
+        def call():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return call
+    return setup
+
+
+for _name, _path in (('route_index', '/'), ('route_weather_alerts', '/weather-alerts'),
+                     ('route_farm_management', '/farm-management'), ('route_market_prices', '/market-prices'),
+                     ('route_market_analytics', '/api/market-prices/analytics'),
+                     ('route_crop_suitability', '/api/crops/suitability?nitrogen=50&phosphorus=40&potassium=40'
+                                                '&temperature=25&humidity=70&ph=6.5&rainfall=100')):
+    benchmark(_name, kind='route')(_route(_path))
+
+
+@benchmark('route_weather_rollups', kind='route')
+def _weather_rollups(app_module, context):
+    location_id = app_module.db.session.query(app_module.WeatherRollup.location_id).order_by(
+        app_module.WeatherRollup.location_id.desc()).limit(1).scalar()
+    start = (date.today() - timedelta(days=3 * 365)).isoformat()
+    return _route(f'/api/weather/{location_id}/rollups?period=month&start={start}')(app_module, context)
+
+
+@benchmark('route_farm_features', kind='route')
+def _farm_features(app_module, context):
+    farm_id = app_module.Farm.query.join(app_module.User).filter(
+        app_module.User.username == BENCHMARK_USERNAME).order_by(app_module.Farm.id).first().id
+    return _route(f'/api/farms/{farm_id}/features')(app_module, context)
+
+
+def run_scale(scale, seed, repeat, selected=None):
+    """Build a database for one scale factor and time every case against it
+
+    Must run in a fresh process: the app binds its database at import time.
+    """
+    os.environ['SKIP_WARMUP'] = '1'
+    os.environ['MODEL_RELOAD_INTERVAL'] = '0'
+    import complete_app as app_module
+    from sql_instrumentation import collect_queries
+
+    app = app_module.app
+    results = []
+    with app.app_context():
+        app_module.db.create_all()
+        row_counts = seed_benchmark_data(scale, seed)
+        app_module.load_ml_models()
+        app_module.build_pesticide_index()
+
+        user = app_module.User.query.filter_by(username=BENCHMARK_USERNAME).first()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+        base_context = {'client': client, 'crop_id': app_module.Crop.query.first().id, 'seed': seed}
+
+        for case in CASES:
+            if selected and case['name'] not in selected:
+                continue
+            context = dict(base_context)
+            result = {'case': case['name'], 'kind': case['kind'], 'scale': scale}
+            try:
+                func = case['setup'](app_module, context)
+                with collect_queries(case['name']) as stats:
+                    func()
+                result.update(measure(func, repeat))
+                result['queries_per_call'] = stats.count
+                if 'rows' in context:
+                    result['rows'] = context['rows']
+            except Exception as e:
+                result['error'] = str(e)
+                print(f"⚠️ {case['name']} (scale {scale}) failed: {str(e)}")
+            app_module.db.session.remove()
+            results.append(result)
+
+        model = app_module.model_registry.get('crop')
+        model_version = getattr(model, 'model_version', app_module.FALLBACK_MODEL_VERSION)
+    return {'scale': scale, 'row_counts': row_counts, 'model_version': model_version, 'results': results}
+
+
+def _isolated_worker(target, args, database_path, queue):
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    try:
+        queue.put(target(*args))
+    except Exception as e:
+        queue.put({'error': str(e)})
+
+
+def run_isolated(target, *args):
+    """Run target(*args) in a spawned process bound to a fresh temporary SQLite database"""
+    ctx = multiprocessing.get_context('spawn')
+    database_path = os.path.join(tempfile.mkdtemp(prefix='agri-bench-'), 'benchmark.db')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_isolated_worker, args=(target, args, database_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if os.path.exists(database_path):
+        os.unlink(database_path)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_metadata(seed, **extra):
+    return dict({
+        'created_at': datetime.now().isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed
+    }, **extra)
+
+
+def write_mandi_feed(path, rows, seed):
+    """Agmarknet-style price CSV over the crops and locations in the database
+
+    Keys are unique except for 5% late re-reported rows and 1% unknown
+    commodities, so the import has real deduplication and rejection work to do.
+    """
+    import pandas as pd
+    from flask_models import Crop, Location
+
+    rng = np.random.RandomState(seed)
+    crops = np.array([crop.crop_name for crop in Crop.query.all()])
+    locations = Location.query.all()
+    states = np.array([location.state for location in locations])
+    districts = np.array([location.district for location in locations])
+    markets = np.array([f"{location.city or location.district} Mandi" for location in locations])
+    grades = np.array(['FAQ', 'A', 'B', 'C'])
+
+    # Walk the (date, location, crop, grade) key space so every base row is
+    # unique; days run oldest first, the way daily arrival reports accumulate
+    unique_rows = int(rows * 0.95)
+    key, grade = np.divmod(np.arange(unique_rows), len(grades))
+    key, crop = np.divmod(key, len(crops))
+    day, location = np.divmod(key, len(locations))
+    dates = pd.Timestamp(date.today()) - pd.to_timedelta(day.max() - day, unit='D')
+    frame = pd.DataFrame({
+        'State': states[location],
+        'District': districts[location],
+        'Market': markets[location],
+        'Commodity': crops[crop],
+        'Grade': grades[grade],
+        'Arrival_Date': dates.strftime('%d/%m/%Y'),
+        'Modal_Price': np.round(rng.uniform(1000, 8000, unique_rows), 2)
+    })
+    frame.loc[frame.sample(frac=0.01, random_state=seed).index, 'Commodity'] = 'Dragon Fruit'
+    frame = pd.concat([frame, frame.sample(n=rows - unique_rows, random_state=seed)], ignore_index=True)
+    frame.to_csv(path, index=False)
+    return path
+
+
+def run_import_benchmark(rows, seed, chunk_size):
+    """Time a fresh mandi price import and a repeat import that is all duplicates"""
+    os.environ['SKIP_WARMUP'] = '1'
+    os.environ['MODEL_RELOAD_INTERVAL'] = '0'
+    import complete_app as app_module
+    return _import_benchmark(app_module.app, rows, seed, chunk_size)
+
+
+def _import_benchmark(app, rows, seed, chunk_size):
+    from flask_models import db, MarketPrice
+    from market_import import import_market_prices
+    from populate_database import populate_sample_data
+
+    feed_path = os.path.join(tempfile.mkdtemp(prefix='agri-bench-'), 'mandi_prices.csv')
+    with app.app_context():
+        db.create_all()
+        populate_sample_data()
+        write_mandi_feed(feed_path, rows, seed)
+        passes = []
+        for name in ('fresh', 'repeat'):
+            stats = import_market_prices(feed_path, 'csv', chunk_size, progress=None).to_dict()
+            stats.pop('reject_examples')
+            passes.append(dict(stats, name=name))
+        stored = db.session.query(MarketPrice).count()
+    os.unlink(feed_path)
+    return {'rows': rows, 'chunk_size': chunk_size, 'stored_rows': stored, 'passes': passes}
+
+
+def run_suite(scales, seed=42, repeat=50, selected=None):
+    """Run every case at every scale factor and return the full result document"""
+    runs = []
+    for scale in scales:
+        run = run_isolated(run_scale, scale, seed, repeat, selected)
+        if run.get('error'):
+            print(f"❌ Scale {scale} failed: {run['error']}")
+            run = {'scale': scale, 'error': run['error'], 'results': []}
+        runs.append(run)
+
+    return {'meta': _run_metadata(seed, repeat=repeat, scales=list(scales)), 'runs': runs}
+
+
+def _index_results(document):
+    return {(result['case'], result['scale']): result
+            for run in document['runs'] for result in run['results'] if 'median_ms' in result}
+
+
+def compare(baseline, current, threshold=0.10):
+    """Pair up cases by (name, scale) and flag median slowdowns beyond threshold"""
+    before = _index_results(baseline)
+    after = _index_results(current)
+    rows = []
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key]['median_ms'], after[key]['median_ms']
+        change = (new - old) / old if old else 0.0
+        rows.append({
+            'case': key[0],
+            'scale': key[1],
+            'baseline_ms': old,
+            'current_ms': new,
+            'change': round(change, 4),
+            'regression': change > threshold and new - old > MIN_REGRESSION_MS,
+            'improvement': change < -threshold and old - new > MIN_REGRESSION_MS
+        })
+    return {
+        'threshold': threshold,
+        'comparisons': rows,
+        'regressions': [row for row in rows if row['regression']],
+        'missing': [list(key) for key in sorted(set(before) - set(after))]
+    }
+
+
+def print_results(document):
+    for run in document['runs']:
+        print(f"\n📊 Scale {run['scale']}  rows={run.get('row_counts')}  model={run.get('model_version')}")
+        for result in run['results']:
+            if 'error' in result:
+                print(f"   {result['case']:<32} ERROR {result['error']}")
+                continue
+            print(f"   {result['case']:<32} median={result['median_ms']:>9.3f}ms  p95={result['p95_ms']:>9.3f}ms  "
+                  f"queries={result['queries_per_call']}")
+
+
+def print_comparison(report):
+    for row in report['comparisons']:
+        flag = '🔴 REGRESSION' if row['regression'] else ('🟢 faster' if row['improvement'] else '')
+        print(f"   {row['case']:<32} x{row['scale']:<4} {row['baseline_ms']:>9.3f}ms -> {row['current_ms']:>9.3f}ms "
+              f"({row['change'] * 100:+.1f}%) {flag}")
+    for case, scale in report['missing']:
+        print(f"   {case:<32} x{scale:<4} missing from current run")
+    if report['regressions']:
+        print(f"\n❌ {len(report['regressions'])} regression(s) above {report['threshold'] * 100:.0f}%")
+    else:
+        print("\n✅ No regressions")
+
+
+def print_import_results(document):
+    if document.get('error'):
+        print(f"❌ Import benchmark failed: {document['error']}")
+        return
+    print(f"\n📦 Mandi import: {document['rows']:,} feed rows, chunk size {document['chunk_size']:,}, "
+          f"{document['stored_rows']:,} stored")
+    print(f"   {'pass':<8} {'rows/s':>10} {'seconds':>9} {'inserted':>10} {'duplicate':>10} {'rejected':>9}")
+    for result in document['passes']:
+        print(f"   {result['name']:<8} {result['rows_per_sec']:>10,.0f} {result['seconds']:>9.2f} "
+              f"{result['rows_written']:>10,} {result['rows_duplicate']:>10,} {result['rows_rejected']:>9,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the advisory hot paths')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmark suite')
+    run_parser.add_argument('--scales', type=int, nargs='+', default=[1, 10])
+    run_parser.add_argument('--repeat', type=int, default=50)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--case', action='append', help='Only run this case (repeatable)')
+    run_parser.add_argument('--output', help='Write results as JSON to this file')
+    run_parser.add_argument('--baseline', help='Compare against this earlier result file')
+    run_parser.add_argument('--threshold', type=float, default=0.10)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+
+    import_parser = subparsers.add_parser('import', help='Measure mandi price import throughput')
+    import_parser.add_argument('--rows', type=int, default=1000000)
+    import_parser.add_argument('--chunk-size', type=int, default=50000)
+    import_parser.add_argument('--seed', type=int, default=42)
+    import_parser.add_argument('--output', help='Write results as JSON to this file')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        document = run_isolated(run_import_benchmark, args.rows, args.seed, args.chunk_size)
+        document['meta'] = _run_metadata(args.seed)
+        print_import_results(document)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(document, f, indent=2)
+        return 1 if document.get('error') else 0
+
+    if args.command == 'run':
+        document = run_suite(args.scales, args.seed, args.repeat, args.case)
+        print_results(document)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(document, f, indent=2)
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            document = json.load(f)
+
+    report = compare(baseline, document, args.threshold)
+    print_comparison(report)
+    return 1 if report['regressions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
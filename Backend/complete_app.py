@@ -3,13 +3,12 @@ Complete Agriculture Advisory System with Voice Assistant
 Multilingual voice support for farmers in local languages
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import pandas as pd
 import numpy as np
-import pickle
 import json
 from datetime import datetime, date, timedelta
 import os
@@ -22,14 +21,38 @@ import pygame
 import tempfile
 import threading
 import base64
+import random
+import time
 
 # Import our models
 from flask_models import *
+from model_artifacts import load_model_bundle
+from model_server import ModelServerClient, RemoteModel
+from model_registry import ModelRegistry
+from weather_ingest import FeedTooLargeError, detect_format, ingest_weather, spool_feed
+from weather_rollups import get_rollups, season_of
+from market_analytics import market_analytics
+from price_forecast import get_forecasts
+from crop_suitability import DEFAULT_TOP, FEATURES, requirements_signature, suitability_engine
+from farm_features import get_farm_features
+from location_index import location_index
+from location_resolver import ensure_canonical_key_column, resolve_location
+from knowledge_search import PER_PAGE, article_summary, knowledge_search
+from knowledge_counters import knowledge_counters
+from notification_fanout import ensure_notification_keys, fan_out
+from batch_recommendations import ensure_recommendation_source
+import notification_stream
+import metrics
+import sql_instrumentation
+import profiling
+import tracing
+from tracing import traced
+from metrics import timed, record_cache, INFERENCE_DURATION, EXTERNAL_CALL_DURATION
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///agriculture_advisory.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///agriculture_advisory.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
@@ -40,6 +63,11 @@ migrate = Migrate(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+metrics.init_app(app)
+sql_instrumentation.init_app(app)
+profiling.init_app(app)
+tracing.init_app(app)
+knowledge_counters.init_app(app)
 
 # Initialize translator and speech recognition
 translator = Translator()
@@ -62,35 +90,97 @@ LANGUAGE_CODES = {
     'অসমীয়া': 'as'
 }
 
+# Optional shared model server; when set, workers do not load models themselves
+app.config['MODEL_SERVER_SOCKET'] = os.environ.get('MODEL_SERVER_SOCKET')
+# Seconds between checks of models/ for newly trained versions (0 disables hot reload)
+app.config['MODEL_RELOAD_INTERVAL'] = float(os.environ.get('MODEL_RELOAD_INTERVAL', 30))
+
+# Languages whose canned advice is pre-translated during warmup, as comma-separated codes, and the
+# seconds that step may take. Off by default: every worker calls the translation API on every restart
+app.config['WARMUP_ADVICE_LANGUAGES'] = [
+    code.strip() for code in os.environ.get('WARMUP_ADVICE_LANGUAGES', '').split(',')
+    if code.strip() in LANGUAGE_CODES.values()
+]
+app.config['WARMUP_ADVICE_SECONDS'] = float(os.environ.get('WARMUP_ADVICE_SECONDS', 10))
+
+# Largest weather feed accepted by the ingest API; bulk feeds go through weather_ingest.py
+app.config['WEATHER_INGEST_MAX_ROWS'] = int(os.environ.get('WEATHER_INGEST_MAX_ROWS', 250000))
+
+# Notification streams hold their request handler open, so they need threaded workers (gthread); off otherwise
+app.config['NOTIFICATION_STREAM'] = os.environ.get('NOTIFICATION_STREAM') == '1'
+# Open streams per worker; keep well below gunicorn --threads so ordinary requests always get a thread
+app.config['NOTIFICATION_STREAM_MAX'] = int(os.environ.get('NOTIFICATION_STREAM_MAX', notification_stream.MAX_STREAMS))
+notification_stream.stream_slots.limit = app.config['NOTIFICATION_STREAM_MAX']
+# Redis pub/sub shares notification wake-ups between workers; without it streams are per process
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')
+notification_stream.set_broker(notification_stream.create_broker(app.config['REDIS_URL']))
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# Global variables for ML models
-crop_model = None
-fertilizer_model = None
+# ML models live in a registry so retrained versions can be swapped in without a restart
+model_registry = ModelRegistry('models', poll_interval=app.config['MODEL_RELOAD_INTERVAL'])
 disease_model = None
+FALLBACK_MODEL_VERSION = 'fallback'
+
+# Warmup state and caches primed before the worker accepts traffic
+warmup_state = {'ready': False, 'started_at': None, 'finished_at': None, 'steps': {}}
+crop_list_cache = None  # (crop catalog signature, crop list)
+pesticide_index = {}
 
 def load_ml_models():
     """Load pre-trained ML models"""
-    global crop_model, fertilizer_model, disease_model
     try:
-        if os.path.exists('models/crop_recommendation_model.pkl'):
-            with open('models/crop_recommendation_model.pkl', 'rb') as f:
-                crop_model = pickle.load(f)
-        if os.path.exists('models/fertilizer_recommendation_model.pkl'):
-            with open('models/fertilizer_recommendation_model.pkl', 'rb') as f:
-                fertilizer_model = pickle.load(f)
-        print("✅ ML Models loaded successfully")
+        load_crop = lambda: load_model_bundle('models/crop_recommendation', 'models/crop_recommendation_model.pkl')
+        load_fertilizer = lambda: load_model_bundle('models/fertilizer_recommendation', 'models/fertilizer_recommendation_model.pkl')
+
+        if app.config['MODEL_SERVER_SOCKET']:
+            # The model server runs its own registry and hot-reloads there
+            client = ModelServerClient(app.config['MODEL_SERVER_SOCKET'])
+            model_registry.set('crop', RemoteModel(client, 'crop', fallback_loader=load_crop), pinned=True)
+            model_registry.set('fertilizer', RemoteModel(client, 'fertilizer', fallback_loader=load_fertilizer),
+                               pinned=True)
+            print(f"✅ Using model server at {app.config['MODEL_SERVER_SOCKET']}")
+            return
+
+        versions = model_registry.load_all()
+        model_registry.start_watcher()
+        print(f"✅ ML Models loaded successfully: {versions}")
     except Exception as e:
         print(f"⚠️ Error loading ML models: {str(e)}")
 
+# Canned advice returned by the rule-based query processor
+ADVICE_RESPONSES = {
+    'crop_yellowing': ("Your crops showing yellowing leaves may indicate nutrient deficiency, particularly nitrogen. "
+                       "I recommend soil testing and application of nitrogen-rich fertilizers like urea. "
+                       "Also check for pest infestation or water logging issues."),
+    'crop_disease': ("Based on your description, your crops may be experiencing disease or pest issues. "
+                     "I recommend taking photos of affected plants for detailed analysis, and consider "
+                     "consulting with your local agricultural extension officer for immediate assistance."),
+    'crop_general': ("For crop recommendations, I need information about your soil type, climate, and season. "
+                     "Generally, consider crops suitable for your region's rainfall and temperature patterns."),
+    'fertilizer': ("For optimal fertilizer application, conduct soil testing first. Based on your crop type, "
+                   "apply balanced NPK fertilizers. For organic farming, use compost and vermicompost. "
+                   "Follow recommended dosages to avoid over-fertilization."),
+    'weather': ("Monitor weather forecasts regularly for farming decisions. Avoid spraying during windy conditions. "
+                "Plan irrigation based on rainfall predictions. Protect crops during extreme weather events."),
+    'pest': ("For pest management, use integrated pest management (IPM) approach. Start with biological "
+             "control methods, then organic pesticides if needed. Apply chemical pesticides as last resort "
+             "following safety guidelines."),
+    'default': ("I'm here to help with your agricultural queries. You can ask about crops, fertilizers, "
+                "pest management, weather conditions, or any farming-related questions. Please provide "
+                "more specific details for better advice.")
+}
+
 # Voice Assistant Functions
 class VoiceAssistant:
     def __init__(self):
         self.translator = Translator()
         self.recognizer = sr.Recognizer()
+        self.advice_cache = {}  # (english advice, language code) -> translated advice
 
+    @timed(EXTERNAL_CALL_DURATION, service='google_speech', operation='recognize')
     def listen_to_audio(self, language_code='en'):
         """Listen to audio and convert to text"""
         try:
@@ -110,8 +200,11 @@ class VoiceAssistant:
         except Exception as e:
             return {"success": False, "error": f"Error: {str(e)}"}
 
+    @timed(EXTERNAL_CALL_DURATION, service='gtts', operation='synthesize')
+    @traced('voice.text_to_speech')
     def text_to_speech(self, text, language_code='en'):
         """Convert text to speech"""
+        tracing.set_attribute('language', language_code)
         try:
             tts = gTTS(text=text, lang=language_code, slow=False)
 
@@ -131,8 +224,12 @@ class VoiceAssistant:
         except Exception as e:
             return {"success": False, "error": f"TTS Error: {str(e)}"}
 
+    @timed(EXTERNAL_CALL_DURATION, service='googletrans', operation='translate')
+    @traced('voice.translate')
     def translate_text(self, text, target_language='en'):
         """Translate text to target language"""
+        tracing.set_attribute('target_language', target_language)
+        tracing.set_attribute('chars', len(text))
         try:
             if target_language == 'auto':
                 detection = self.translator.detect(text)
@@ -151,8 +248,10 @@ class VoiceAssistant:
         except Exception as e:
             return {"success": False, "error": f"Translation error: {str(e)}"}
 
+    @traced('voice.advice')
     def get_agricultural_advice(self, query, language_code='en'):
         """Get agricultural advice based on query"""
+        tracing.set_attribute('language', language_code)
         try:
             # Translate query to English for processing
             if language_code != 'en':
@@ -168,15 +267,23 @@ class VoiceAssistant:
 
             # Translate advice back to user's language
             if language_code != 'en':
-                translated_advice = self.translate_text(advice, language_code)
-                if translated_advice['success']:
-                    advice = translated_advice['translated_text']
+                cached_advice = self.advice_cache.get((advice, language_code))
+                record_cache('advice_translation', cached_advice is not None)
+                tracing.set_attribute('translation_cache_hit', cached_advice is not None)
+                if cached_advice is not None:
+                    advice = cached_advice
+                else:
+                    translated_advice = self.translate_text(advice, language_code)
+                    if translated_advice['success']:
+                        self.advice_cache[(advice, language_code)] = translated_advice['translated_text']
+                        advice = translated_advice['translated_text']
 
             return {"success": True, "advice": advice, "original_query": query}
 
         except Exception as e:
             return {"success": False, "error": f"Error processing query: {str(e)}"}
 
+    @traced('voice.process_query')
     def process_agricultural_query(self, query):
         """Process agricultural queries and provide advice"""
         query_lower = query.lower()
@@ -184,40 +291,50 @@ class VoiceAssistant:
         # Crop-related queries
         if any(word in query_lower for word in ['crop', 'sow', 'plant', 'grow']):
             if any(word in query_lower for word in ['yellow', 'पीली', 'yellowing']):
-                return ("Your crops showing yellowing leaves may indicate nutrient deficiency, particularly nitrogen. "
-                       "I recommend soil testing and application of nitrogen-rich fertilizers like urea. "
-                       "Also check for pest infestation or water logging issues.")
+                return ADVICE_RESPONSES['crop_yellowing']
 
             elif any(word in query_lower for word in ['disease', 'sick', 'problem']):
-                return ("Based on your description, your crops may be experiencing disease or pest issues. "
-                       "I recommend taking photos of affected plants for detailed analysis, and consider "
-                       "consulting with your local agricultural extension officer for immediate assistance.")
+                return ADVICE_RESPONSES['crop_disease']
 
             else:
-                return ("For crop recommendations, I need information about your soil type, climate, and season. "
-                       "Generally, consider crops suitable for your region's rainfall and temperature patterns.")
+                return ADVICE_RESPONSES['crop_general']
 
         # Fertilizer queries
         elif any(word in query_lower for word in ['fertilizer', 'nutrient', 'manure']):
-            return ("For optimal fertilizer application, conduct soil testing first. Based on your crop type, "
-                   "apply balanced NPK fertilizers. For organic farming, use compost and vermicompost. "
-                   "Follow recommended dosages to avoid over-fertilization.")
+            return ADVICE_RESPONSES['fertilizer']
 
         # Weather queries
         elif any(word in query_lower for word in ['weather', 'rain', 'temperature']):
-            return ("Monitor weather forecasts regularly for farming decisions. Avoid spraying during windy conditions. "
-                   "Plan irrigation based on rainfall predictions. Protect crops during extreme weather events.")
+            return ADVICE_RESPONSES['weather']
 
         # Pest queries
         elif any(word in query_lower for word in ['pest', 'insect', 'bug']):
-            return ("For pest management, use integrated pest management (IPM) approach. Start with biological "
-                   "control methods, then organic pesticides if needed. Apply chemical pesticides as last resort "
-                   "following safety guidelines.")
+            return ADVICE_RESPONSES['pest']
 
         else:
-            return ("I'm here to help with your agricultural queries. You can ask about crops, fertilizers, "
-                   "pest management, weather conditions, or any farming-related questions. Please provide "
-                   "more specific details for better advice.")
+            return ADVICE_RESPONSES['default']
+
+    def warm_advice_cache(self, language_codes, max_seconds=None):
+        """Pre-translate the canned advice responses into the given languages
+
+        Stops once max_seconds have passed; what is left is translated on first use.
+        """
+        deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+        translated = 0
+        for language_code in language_codes:
+            if language_code == 'en':
+                continue
+            for advice in ADVICE_RESPONSES.values():
+                if (advice, language_code) in self.advice_cache:
+                    continue
+                if deadline is not None and time.monotonic() > deadline:
+                    print(f"⚠️ Advice pre-translation stopped after {max_seconds:g}s ({translated} translated)")
+                    return translated
+                result = self.translate_text(advice, language_code)
+                if result['success']:
+                    self.advice_cache[(advice, language_code)] = result['translated_text']
+                    translated += 1
+        return translated
 
 # Initialize voice assistant
 voice_assistant = VoiceAssistant()
@@ -244,6 +361,7 @@ def index():
                              recommendations=recent_recommendations,
                              farms=user_farms,
                              notifications=notifications,
+                             notification_stream=app.config['NOTIFICATION_STREAM'],
                              languages=LANGUAGE_CODES)
     return render_template('index.html', languages=LANGUAGE_CODES)
 
@@ -370,20 +488,15 @@ def crop_recommendation():
     """Crop recommendation page"""
     if request.method == 'POST':
         try:
-            # Get input data
+            # Get input data; fields left blank come from the farm's stored soil and weather data
             farm_id = request.form['farm_id']
-            nitrogen = float(request.form['nitrogen'])
-            phosphorus = float(request.form['phosphorus'])
-            potassium = float(request.form['potassium'])
-            temperature = float(request.form['temperature'])
-            humidity = float(request.form['humidity'])
-            ph = float(request.form['ph'])
-            rainfall = float(request.form['rainfall'])
-            season = request.form['season']
+            inputs = _farm_inputs(int(farm_id), request.form)
+            nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall = [inputs[name] for name in FEATURES]
+            season = request.form.get('season') or str(season_of([date.today().month])[0])
 
             # Make prediction
             input_data = np.array([[nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall]])
-            recommended_crops = predict_crops(input_data)
+            recommended_crops, model_version = predict_crops(input_data)
 
             # Save recommendation to database
             recommendation = CropRecommendation(
@@ -401,12 +514,13 @@ def crop_recommendation():
                 }),
                 season=season,
                 year=datetime.now().year,
-                model_version='1.0',
+                model_version=model_version,
                 confidence_score=0.85
             )
 
             db.session.add(recommendation)
-            db.session.commit()
+            with tracing.span('db.commit', table='crop_recommendations'):
+                db.session.commit()
 
             flash('Crop recommendation generated successfully!', 'success')
             return render_template('crop_recommendation_result.html', 
@@ -429,6 +543,23 @@ def crop_recommendation():
     user_farms = Farm.query.filter_by(user_id=current_user.id).all()
     return render_template('crop_recommendation.html', farms=user_farms)
 
+def _farm_inputs(farm_id, overrides):
+    """Crop model inputs for one of the current user's farms
+
+    Values given in overrides (a form or JSON object) win; the rest come
+    from the farm's assembled features. Raises ValueError when the farm is
+    not the user's or a value is missing from both.
+    """
+    if Farm.query.filter_by(id=farm_id, user_id=current_user.id).first() is None:
+        raise ValueError('Farm not found')
+    stored = get_farm_features(farm_id)['features']
+    inputs = {name: float(overrides[name]) if overrides.get(name) not in (None, '') else stored[name]
+              for name in FEATURES}
+    missing = [name for name in FEATURES if inputs[name] is None]
+    if missing:
+        raise ValueError(f"No stored data for {', '.join(missing)}; please enter them")
+    return inputs
+
 @app.route('/fertilizer-recommendation', methods=['GET', 'POST'])
 @login_required
 def fertilizer_recommendation():
@@ -539,6 +670,14 @@ def weather_alerts():
             location_id=farm.location_id
         ).order_by(WeatherData.date.desc()).first()
 
+        if latest_weather is None:
+            # Nearest location with weather stands in for one that has none
+            source = location_index.weather_source(farm.location_id)
+            if source:
+                latest_weather = WeatherData.query.filter_by(
+                    location_id=source[0]
+                ).order_by(WeatherData.date.desc()).first()
+
         if latest_weather:
             weather_data.append({
                 'farm_name': farm.farm_name,
@@ -560,6 +699,28 @@ def market_prices():
 
     return render_template('market_prices.html', prices=recent_prices)
 
+@app.route('/api/market-prices/analytics')
+def api_market_analytics():
+    """Rolling means, volatility, 30-day range and inter-market spreads
+
+    Optional crop_id and location_id narrow the result; with both, the daily
+    history behind the rolling means is included.
+    """
+    analytics = market_analytics.get()
+    return jsonify(analytics.to_dict(request.args.get('crop_id', type=int), request.args.get('location_id', type=int)))
+
+@app.route('/api/market-prices/forecast')
+def api_price_forecast():
+    """Stored price forecasts for a crop, optionally for one location
+
+    Served from price_forecasts, which the nightly price_forecast.py job
+    refreshes; nothing is fitted per request.
+    """
+    crop_id = request.args.get('crop_id', type=int)
+    if crop_id is None:
+        return jsonify({"success": False, "error": "crop_id is required"}), 400
+    return jsonify(get_forecasts(crop_id, request.args.get('location_id', type=int)))
+
 @app.route('/farm-management')
 @login_required
 def farm_management():
@@ -590,8 +751,8 @@ def add_farm():
     """Add new farm"""
     if request.method == 'POST':
         try:
-            # Create location first
-            location = Location(
+            # Farms in the same place share one location, and with it its weather and market data
+            location = resolve_location(
                 country=request.form['country'],
                 state=request.form['state'],
                 district=request.form['district'],
@@ -600,7 +761,6 @@ def add_farm():
                 latitude=float(request.form['latitude']) if request.form.get('latitude') else None,
                 longitude=float(request.form['longitude']) if request.form.get('longitude') else None
             )
-            db.session.add(location)
             db.session.flush()
 
             # Create farm
@@ -626,25 +786,112 @@ def add_farm():
     return render_template('add_farm.html')
 
 # API Endpoints
+@app.route('/health')
+def health():
+    """Readiness probe polled by the container HEALTHCHECK"""
+    if not warmup_state['ready']:
+        return jsonify({'status': 'warming_up', 'steps': warmup_state['steps']}), 503
+    return jsonify({
+        'status': 'ready',
+        'models_loaded': {name: model_registry.get(name) is not None for name in ('crop', 'fertilizer')},
+        'warmup_seconds': round((warmup_state['finished_at'] - warmup_state['started_at']).total_seconds(), 3)
+    })
+
 @app.route('/api/crops', methods=['GET'])
 def api_get_crops():
     """Get all crops API"""
-    crops = Crop.query.all()
-    return jsonify([{
-        'id': crop.id,
-        'name': crop.crop_name,
-        'category': crop.crop_category,
-        'season': crop.growing_season
-    } for crop in crops])
+    return jsonify(get_crop_list())
+
+@app.route('/api/crops/suitability', methods=['GET', 'POST'])
+def api_crop_suitability():
+    """Rank every crop by how well its requirements fit the given conditions
+
+    GET takes one set of conditions as query parameters (nitrogen,
+    phosphorus, potassium, temperature, humidity, ph, rainfall); POST takes
+    {"farms": [{...}, ...]} and ranks them all in one pass. Missing values
+    are left out of the score. top (default 5) limits the crops per farm.
+    """
+    try:
+        if request.method == 'POST':
+            payload = request.get_json(silent=True) or {}
+            farms, top = payload.get('farms'), payload.get('top', DEFAULT_TOP)
+            if not isinstance(farms, list) or not farms:
+                raise ValueError('farms must be a non-empty list')
+        else:
+            farms, top = [request.args], request.args.get('top', DEFAULT_TOP)
+        features = [[float(farm[name]) if farm.get(name) not in (None, '') else np.nan for name in FEATURES]
+                    for farm in farms]
+        top = int(top)
+        if top < 1:
+            raise ValueError('top must be at least 1')
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    rankings = suitability_engine.rank(features, top)
+    return jsonify(rankings[0] if request.method == 'GET' else rankings)
+
+@app.route('/api/farms/<int:farm_id>/features')
+@login_required
+def api_farm_features(farm_id):
+    """A farm's crop model inputs, assembled from its soil tests and local weather"""
+    if Farm.query.filter_by(id=farm_id, user_id=current_user.id).first() is None:
+        return jsonify({"success": False, "error": "Farm not found"}), 404
+    return jsonify(get_farm_features(farm_id))
+
+@app.route('/api/farms/<int:farm_id>/crop-recommendation', methods=['POST'])
+@login_required
+def api_farm_crop_recommendation(farm_id):
+    """Recommend crops for a farm from its stored data alone
+
+    An optional JSON body may override any input (nitrogen, ..., rainfall)
+    and set the season; the recommendation is saved like the form's.
+    """
+    overrides = request.get_json(silent=True) or {}
+    try:
+        inputs = _farm_inputs(farm_id, overrides)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    recommended_crops, model_version = predict_crops(np.array([[inputs[name] for name in FEATURES]]))
+
+    season = overrides.get('season') or str(season_of([date.today().month])[0])
+    db.session.add(CropRecommendation(
+        user_id=current_user.id,
+        farm_id=farm_id,
+        recommended_crops=json.dumps(recommended_crops),
+        input_parameters=json.dumps(inputs),
+        season=season,
+        year=datetime.now().year,
+        model_version=model_version,
+        confidence_score=0.85
+    ))
+    with tracing.span('db.commit', table='crop_recommendations'):
+        db.session.commit()
+    return jsonify({"success": True, "crops": recommended_crops, "input_data": inputs, "season": season,
+                    "model_version": model_version})
 
 @app.route('/api/weather/<int:location_id>')
 def api_get_weather(location_id):
-    """Get weather data for location"""
+    """Get weather data for location
+
+    A location without weather gets the nearest location's within
+    WEATHER_FALLBACK_KM; each item names the location it came from.
+    """
     weather = WeatherData.query.filter_by(
         location_id=location_id
     ).order_by(WeatherData.date.desc()).limit(7).all()
+    distance_km = 0.0
+
+    if not weather:
+        source = location_index.weather_source(location_id)
+        if source:
+            weather = WeatherData.query.filter_by(
+                location_id=source[0]
+            ).order_by(WeatherData.date.desc()).limit(7).all()
+            distance_km = source[1]
 
     return jsonify([{
+        'location_id': w.location_id,
+        'distance_km': distance_km,
         'date': w.date.strftime('%Y-%m-%d'),
         'temperature_max': float(w.temperature_max) if w.temperature_max else None,
         'temperature_min': float(w.temperature_min) if w.temperature_min else None,
@@ -652,50 +899,236 @@ def api_get_weather(location_id):
         'rainfall': float(w.rainfall) if w.rainfall else None
     } for w in weather])
 
+@app.route('/api/weather/<int:location_id>/rollups')
+def api_get_weather_rollups(location_id):
+    """Weekly, monthly or seasonal weather summaries for a date range
+
+    Query parameters: period (week, month or season; default month) and
+    optional start/end dates as YYYY-MM-DD.
+    """
+    try:
+        start, end = [datetime.strptime(request.args[name], '%Y-%m-%d').date() if request.args.get(name) else None
+                      for name in ('start', 'end')]
+        rollups = get_rollups(location_id, request.args.get('period', 'month'), start, end)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify(rollups)
+
+@app.route('/api/knowledge/search')
+def api_knowledge_search():
+    """Search published knowledge base articles
+
+    Query parameters: q (required), optional category, language,
+    difficulty and tag filters, page and per_page. Results are ranked
+    best first; facets count tags and categories over every match.
+    """
+    try:
+        results = knowledge_search.search(
+            request.args.get('q', ''), category=request.args.get('category'),
+            language=request.args.get('language'), difficulty=request.args.get('difficulty'),
+            tag=request.args.get('tag'), page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', PER_PAGE, type=int))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, **results})
+
+def _published_article(article_id):
+    article = db.session.get(KnowledgeBase, article_id)
+    return article if article is not None and article.is_published else None
+
+def _with_pending_counts(article):
+    """Article summary with counts including this worker's unflushed increments"""
+    pending = knowledge_counters.pending(article.id)
+    data = article_summary(article)
+    data['views_count'] = (article.views_count or 0) + pending['views_count']
+    data['likes_count'] = (article.likes_count or 0) + pending['likes_count']
+    return data
+
+@app.route('/api/knowledge/<int:article_id>')
+def api_knowledge_article(article_id):
+    """A published article; the view is counted in memory and flushed in batches"""
+    article = _published_article(article_id)
+    if article is None:
+        return jsonify({"success": False, "error": "Article not found"}), 404
+    knowledge_counters.increment(article.id, 'views_count')
+    return jsonify({"success": True, "article": dict(_with_pending_counts(article), content=article.content)})
+
+@app.route('/api/knowledge/<int:article_id>/like', methods=['POST'])
+@login_required
+def api_knowledge_like(article_id):
+    """Like an article; counted like views"""
+    article = _published_article(article_id)
+    if article is None:
+        return jsonify({"success": False, "error": "Article not found"}), 404
+    knowledge_counters.increment(article.id, 'likes_count')
+    return jsonify({"success": True, "likes_count": _with_pending_counts(article)['likes_count']})
+
+@app.route('/admin/models/reload', methods=['POST'])
+@login_required
+def admin_reload_models():
+    """Ask this worker to pick up newly trained model versions now
+
+    Models served by the model server are skipped (listed under "remote");
+    the server picks up new versions itself.
+    """
+    if current_user.user_type != 'admin':
+        return jsonify({"success": False, "error": "Admin access required"}), 403
+    started = model_registry.check_for_updates(background=True)
+    return jsonify({
+        "success": True,
+        "reloading": [{'model': name, 'version': version} for name, version in started],
+        "remote": model_registry.pinned(),
+        "versions": model_registry.versions()
+    })
+
+@app.route('/api/weather/ingest', methods=['POST'])
+@login_required
+def api_ingest_weather():
+    """Upsert a daily weather feed (CSV or NDJSON) sent as a file upload or the raw request body
+
+    Feeds over WEATHER_INGEST_MAX_ROWS rows are refused with 413 before any
+    row is written; those belong to the weather_ingest.py command line.
+    """
+    if current_user.user_type != 'admin':
+        return jsonify({"success": False, "error": "Admin access required"}), 403
+
+    upload = request.files.get('file')
+    if upload is not None:
+        source = upload.stream
+        fmt = request.form.get('format') or detect_format(upload.filename)
+        compression = 'gzip' if (upload.filename or '').endswith('.gz') else None
+    else:
+        source = request.stream
+        fmt = request.args.get('format') or ('ndjson' if 'json' in (request.mimetype or '') else 'csv')
+        compression = 'gzip' if request.headers.get('Content-Encoding') == 'gzip' else None
+
+    try:
+        with spool_feed(source, compression, app.config['WEATHER_INGEST_MAX_ROWS']) as feed:
+            stats = ingest_weather(feed, fmt, progress=None, compression=None)
+    except FeedTooLargeError as e:
+        return jsonify({"success": False, "error": str(e)}), 413
+    except (ValueError, OSError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, **stats.to_dict()})
+
+@app.route('/api/notifications/stream')
+@login_required
+def api_notification_stream():
+    """Server-sent events: new notifications and unread counts as they are committed
+
+    Only served when NOTIFICATION_STREAM is enabled, and while this worker
+    has fewer than NOTIFICATION_STREAM_MAX streams open; clients poll
+    /api/notifications/unread-count otherwise.
+    """
+    if not app.config['NOTIFICATION_STREAM']:
+        return jsonify({"success": False, "error": "Notification stream is disabled"}), 503
+    if not notification_stream.stream_slots.acquire():
+        retry_after = notification_stream.STREAM_MAX_SECONDS
+        return jsonify({"success": False, "error": "Too many open notification streams",
+                        "retry_after": retry_after}), 503, {'Retry-After': str(retry_after)}
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    response = Response(notification_stream.event_stream(app, current_user.id, last_event_id),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Released when the server closes the response, even if the client left before the first frame
+    response.call_on_close(notification_stream.stream_slots.release)
+    return response
+
+@app.route('/api/notifications/unread-count')
+@login_required
+def api_unread_notification_count():
+    """Number of unread notifications, for badges"""
+    return jsonify({"count": notification_stream.unread_count(current_user.id)})
+
+@app.route('/api/notifications/<int:notification_id>/read', methods=['POST'])
+@login_required
+def api_mark_notification_read(notification_id):
+    """Mark one of the user's notifications read; open streams get the new unread count"""
+    notification = Notification.query.filter_by(id=notification_id, user_id=current_user.id).first()
+    if notification is None:
+        return jsonify({"success": False, "error": "Notification not found"}), 404
+    notification.is_read = True
+    db.session.commit()
+    return jsonify({"success": True, "unread": notification_stream.unread_count(current_user.id)})
+
+@app.route('/api/notifications/fanout', methods=['POST'])
+@login_required
+def api_notification_fanout():
+    """Notify every farmer in a state, district or radius
+
+    JSON body: target ({"state"}, {"state", "district"} or {"latitude",
+    "longitude", "radius_km"}), title, message and optionally
+    notification_type, priority, action_required and expiry_date. An
+    Idempotency-Key header (or idempotency_key field) makes retries safe.
+    """
+    if current_user.user_type not in ('admin', 'advisor'):
+        return jsonify({"success": False, "error": "Admin or advisor access required"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        expiry_date = datetime.strptime(data['expiry_date'], '%Y-%m-%d').date() if data.get('expiry_date') else None
+        summary = fan_out(data.get('target') or {}, data.get('notification_type', 'weather_alert'), data.get('title'),
+                          data.get('message'), data.get('priority', 'medium'), bool(data.get('action_required')),
+                          expiry_date, request.headers.get('Idempotency-Key') or data.get('idempotency_key'))
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, **summary})
+
 # Helper functions for ML predictions
+@timed(INFERENCE_DURATION, function='predict_crops')
+@traced('crop.predict')
 def predict_crops(input_data):
-    """Predict suitable crops based on soil and weather data"""
+    """Predict suitable crops based on soil and weather data
+
+    Returns (recommendations, model_version); the version is the one that
+    actually produced the recommendations.
+    """
+    # One snapshot per call, so a concurrent hot reload cannot mix versions
+    crop_model = model_registry.get('crop')
     try:
-        if crop_model and 'model' in crop_model:
+        if crop_model is not None:
             # Use actual trained model
-            model = crop_model['model']
-            scaler = crop_model['scaler']
-            label_encoder = crop_model['label_encoder']
-
-            # Scale input data
-            input_scaled = scaler.transform(input_data)
-
-            # Make prediction
-            probabilities = model.predict_proba(input_scaled)
+            tracing.set_attribute('model_version', crop_model.model_version)
+            tracing.set_attribute('rows', len(input_data))
+            if hasattr(crop_model, 'predict_proba_scaled'):
+                with tracing.span('model.scale'):
+                    input_scaled = crop_model.transform(input_data)
+                with tracing.span('model.forest'):
+                    probabilities = crop_model.predict_proba_scaled(input_scaled)
+            else:
+                with tracing.span('model.remote_predict'):
+                    probabilities = crop_model.predict_proba(input_data)
 
             # Get top 3 predictions
             top_indices = np.argsort(probabilities[0])[-3:][::-1]
             recommendations = []
 
             for idx in top_indices:
-                crop_name = label_encoder.inverse_transform([idx])[0]
+                crop_name = str(crop_model.classes[idx])
                 confidence = probabilities[0][idx]
                 recommendations.append({
                     'name': crop_name.title(),
-                    'confidence': round(confidence * 100, 2),
+                    'confidence': round(float(confidence) * 100, 2),
                     'expected_yield': f'{random.randint(35, 55)} quintals/acre'
                 })
 
-            return recommendations
+            return recommendations, crop_model.model_version
         else:
             # Fallback sample recommendations
             return [
                 {'name': 'Rice', 'confidence': 85.2, 'expected_yield': '45 quintals/acre'},
                 {'name': 'Wheat', 'confidence': 78.6, 'expected_yield': '42 quintals/acre'},
                 {'name': 'Maize', 'confidence': 72.4, 'expected_yield': '38 quintals/acre'}
-            ]
+            ], FALLBACK_MODEL_VERSION
     except Exception as e:
         print(f"Prediction error: {str(e)}")
         return [
             {'name': 'Rice', 'confidence': 85.2, 'expected_yield': '45 quintals/acre'},
             {'name': 'Wheat', 'confidence': 78.6, 'expected_yield': '42 quintals/acre'}
-        ]
+        ], FALLBACK_MODEL_VERSION
 
+@timed(INFERENCE_DURATION, function='predict_fertilizer')
+@traced('fertilizer.predict')
 def predict_fertilizer(crop_id, nitrogen, phosphorus, potassium, ph):
     """Predict fertilizer recommendations"""
     crop = Crop.query.get(crop_id)
@@ -740,6 +1173,8 @@ def predict_fertilizer(crop_id, nitrogen, phosphorus, potassium, ph):
 
     return recommendations
 
+@timed(INFERENCE_DURATION, function='detect_disease_from_image')
+@traced('disease.detect')
 def detect_disease_from_image(image_path):
     """Detect disease from uploaded image"""
     # Placeholder - replace with actual image processing and ML model
@@ -761,56 +1196,125 @@ def detect_disease_from_image(image_path):
         'image_path': image_path
     }
 
+PESTICIDE_RECOMMENDATIONS = {
+    'Late Blight': [
+        {
+            'name': 'Copper Oxychloride 50% WP',
+            'dosage': '2.5-3g/liter water',
+            'application_method': 'Foliar spray',
+            'frequency': 'Every 7-10 days',
+            'safety_period': '7 days before harvest',
+            'cost': '₹450/kg'
+        }
+    ],
+    'Early Blight': [
+        {
+            'name': 'Mancozeb 75% WP',
+            'dosage': '2g/liter water',
+            'application_method': 'Foliar spray',
+            'frequency': 'Every 10-14 days',
+            'safety_period': '5 days before harvest',
+            'cost': '₹320/kg'
+        }
+    ],
+    'Aphid Infestation': [
+        {
+            'name': 'Neem Oil',
+            'dosage': '5ml/liter water',
+            'application_method': 'Foliar spray',
+            'frequency': 'Every 5-7 days',
+            'safety_period': '1 day before harvest',
+            'cost': '₹180/liter'
+        }
+    ]
+}
+
+DEFAULT_PESTICIDE_RECOMMENDATION = [{
+    'name': 'Contact Local Agricultural Officer',
+    'dosage': 'As per expert advice',
+    'application_method': 'Professional consultation',
+    'frequency': 'Immediate',
+    'safety_period': 'Follow expert guidelines',
+    'cost': 'Consultation fee may apply'
+}]
+
+def build_pesticide_index():
+    """Build a case-insensitive lookup from disease name to pesticide recommendations"""
+    global pesticide_index
+    pesticide_index = {name.lower(): recs for name, recs in PESTICIDE_RECOMMENDATIONS.items()}
+    return pesticide_index
+
 def get_pesticide_recommendations(disease_name):
     """Get pesticide recommendations for detected disease"""
-    pesticide_db = {
-        'Late Blight': [
-            {
-                'name': 'Copper Oxychloride 50% WP',
-                'dosage': '2.5-3g/liter water',
-                'application_method': 'Foliar spray',
-                'frequency': 'Every 7-10 days',
-                'safety_period': '7 days before harvest',
-                'cost': '₹450/kg'
-            }
-        ],
-        'Early Blight': [
-            {
-                'name': 'Mancozeb 75% WP',
-                'dosage': '2g/liter water',
-                'application_method': 'Foliar spray',
-                'frequency': 'Every 10-14 days',
-                'safety_period': '5 days before harvest',
-                'cost': '₹320/kg'
-            }
-        ],
-        'Aphid Infestation': [
-            {
-                'name': 'Neem Oil',
-                'dosage': '5ml/liter water',
-                'application_method': 'Foliar spray',
-                'frequency': 'Every 5-7 days',
-                'safety_period': '1 day before harvest',
-                'cost': '₹180/liter'
-            }
-        ]
-    }
-
-    return pesticide_db.get(disease_name, [{
-        'name': 'Contact Local Agricultural Officer',
-        'dosage': 'As per expert advice',
-        'application_method': 'Professional consultation',
-        'frequency': 'Immediate',
-        'safety_period': 'Follow expert guidelines',
-        'cost': 'Consultation fee may apply'
-    }])
-
-# Create database tables and load models
-@app.before_first_request
-def create_tables():
-    """Create database tables and load models"""
-    db.create_all()
-    load_ml_models()
+    index = pesticide_index or build_pesticide_index()
+    return index.get((disease_name or '').strip().lower(), DEFAULT_PESTICIDE_RECOMMENDATION)
+
+def get_crop_list():
+    """Return the cached crop list, reloaded whenever crops change in any worker
+
+    Uses the crop suitability signature: commits touching crops bump its data
+    version, and rows written without the ORM change its counts and max ids.
+    """
+    global crop_list_cache
+    signature = requirements_signature()
+    hit = crop_list_cache is not None and crop_list_cache[0] == signature
+    record_cache('crop_list', hit)
+    if not hit:
+        crop_list_cache = (signature, [{
+            'id': crop.id,
+            'name': crop.crop_name,
+            'category': crop.crop_category,
+            'season': crop.growing_season
+        } for crop in Crop.query.all()])
+    return crop_list_cache[1]
+
+def _run_warmup_step(name, func):
+    """Run one warmup step, recording its outcome without aborting the warmup"""
+    started = datetime.now()
+    try:
+        result = func()
+        warmup_state['steps'][name] = {'ok': True, 'seconds': round((datetime.now() - started).total_seconds(), 3)}
+        return result
+    except Exception as e:
+        warmup_state['steps'][name] = {'ok': False, 'error': str(e)}
+        print(f"⚠️ Warmup step '{name}' failed: {str(e)}")
+        return None
+
+def warmup_app(flask_app):
+    """Create tables, load models, prime caches and run a dummy inference
+
+    Runs once per worker process at import time, so the first real request
+    never pays for schema checks, model unpickling or cold caches.
+    """
+    warmup_state['ready'] = False
+    warmup_state['started_at'] = datetime.now()
+
+    with flask_app.app_context():
+        _run_warmup_step('create_tables', db.create_all)
+        _run_warmup_step('location_keys', ensure_canonical_key_column)
+        _run_warmup_step('notification_keys', ensure_notification_keys)
+        _run_warmup_step('recommendation_source', ensure_recommendation_source)
+        _run_warmup_step('load_models', load_ml_models)
+        _run_warmup_step('crop_list', get_crop_list)
+        _run_warmup_step('pesticide_index', build_pesticide_index)
+        _run_warmup_step('market_analytics', market_analytics.get)
+        _run_warmup_step('crop_suitability', suitability_engine.get)
+        _run_warmup_step('location_index', location_index.refresh)
+        _run_warmup_step('knowledge_search', knowledge_search.ensure)
+        if flask_app.config['WARMUP_ADVICE_LANGUAGES']:
+            _run_warmup_step('advice_translations', lambda: voice_assistant.warm_advice_cache(
+                flask_app.config['WARMUP_ADVICE_LANGUAGES'], flask_app.config['WARMUP_ADVICE_SECONDS']))
+        _run_warmup_step('dummy_inference', lambda: predict_crops(
+            np.array([[50.0, 40.0, 40.0, 25.0, 70.0, 6.5, 100.0]])))
+
+    warmup_state['finished_at'] = datetime.now()
+    warmup_state['ready'] = True
+    elapsed = (warmup_state['finished_at'] - warmup_state['started_at']).total_seconds()
+    print(f"✅ Warmup completed in {elapsed:.2f}s")
+
+# Warm each worker before it serves traffic (set SKIP_WARMUP=1 for one-off scripts)
+if os.environ.get('SKIP_WARMUP') != '1':
+    warmup_app(app)
 
 if __name__ == '__main__':
     # Create necessary directories
@@ -0,0 +1,240 @@
+"""
+Crop Suitability Scoring
+For Agriculture Advisory System
+
+Scores every crop against farm conditions using the CropRequirement ranges.
+All requirements are packed once into crops x factors NumPy matrices. Scoring
+F farms is then a few broadcast operations over farms x crops x factors
+arrays, a block of farms at a time. There is no per-crop or per-farm Python
+loop.
+
+Factor scores are in [0, 1]:
+- temperature, humidity, pH, rainfall: 1 at the optimum, falling linearly
+  to EDGE_SCORE at the crop's min/max, then to 0 once the distance past
+  min/max reaches TOLERANCE times the optimum-to-edge distance on that side
+- nitrogen, phosphorus, potassium: soil supply / crop requirement, capped at 1
+
+A crop's score is the FACTOR_WEIGHTS-weighted mean of the factors known on
+both sides, scaled to 0-100.
+
+The matrices are rebuilt only after a commit touches crops or
+crop_requirements. Every such ORM commit also bumps the crop_requirements
+data version (data_versions.py) in the same transaction, so edits made by
+other processes are picked up through that version; rows they add or
+remove without the ORM, through a row count and max id check on both tables.
+"""
+
+import numpy as np
+import pandas as pd
+import threading
+
+from sqlalchemy import Float, func, select, type_coerce
+
+from data_versions import track, version_of
+from flask_models import db, Crop, CropRequirement
+from metrics import record_cache
+
+# Same order as the crop model's input vector: nutrients first, then the ranged factors
+FEATURES = ('nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall')
+NUTRIENT_FACTORS = FEATURES[:3]
+RANGE_FACTORS = FEATURES[3:]
+
+FACTOR_WEIGHTS = {'nitrogen': 0.1, 'phosphorus': 0.1, 'potassium': 0.1, 'temperature': 0.2,
+                  'humidity': 0.1, 'ph': 0.2, 'rainfall': 0.2}
+EDGE_SCORE = 0.5
+# Must stay <= EDGE_SCORE / (1 - EDGE_SCORE) for the score to fall faster outside the range than inside
+TOLERANCE = 0.25
+DEFAULT_TOP = 5
+# Farms scored per pass; keeps the farms x crops x factors temporaries small
+BLOCK_FARMS = 256
+# data_versions row bumped by commits changing crops or crop_requirements
+REQUIREMENTS_VERSION = 'crop_requirements'
+
+
+class SuitabilityMatrix:
+    """Crop requirements packed as arrays, with broadcast scoring"""
+
+    def __init__(self, crop_ids, crop_names, minimum, optimal, maximum, need):
+        self.crop_ids = np.asarray(crop_ids)
+        self.crop_names = list(crop_names)
+        minimum, maximum = np.asarray(minimum, dtype=np.float32), np.asarray(maximum, dtype=np.float32)
+        self.minimum = np.fmin(minimum, maximum)
+        self.maximum = np.fmax(minimum, maximum)
+        self.optimal = np.clip(np.asarray(optimal, dtype=np.float32), self.minimum, self.maximum)
+        self.need = np.asarray(need, dtype=np.float32)
+        self.weights = np.array([FACTOR_WEIGHTS[name] for name in FEATURES], dtype=np.float32)
+
+        # crops x FEATURES: which requirements are known
+        self.known = np.concatenate([~np.isnan(self.need), ~np.isnan(self.minimum + self.optimal + self.maximum)],
+                                    axis=1)
+        # Scoring parameters as factors x crops, contiguous along crops. The distance from the optimum
+        # is a fraction of the way to min (negative side) or max; unknown requirements give NaN, scored 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            below_slope = -1 / np.maximum(self.optimal - self.minimum, 1e-6)
+            above_slope = 1 / np.maximum(self.maximum - self.optimal, 1e-6)
+            need_scale = np.where(self.need > 0, 1 / self.need, np.where(self.need == 0, 0, np.nan))
+        self._optimal, self._below_slope, self._above_slope, self._need_scale = [
+            np.ascontiguousarray(values.T, dtype=np.float32) for values in (self.optimal, below_slope, above_slope,
+                                                                            need_scale)]
+        # A zero requirement is always met
+        self._need_free = np.ascontiguousarray((self.need == 0).T, dtype=np.float32)
+
+    @classmethod
+    def from_database(cls):
+        """One row per crop; crops without requirements score NaN and are never ranked"""
+        table = CropRequirement.__table__
+        value_columns = [f'{bound}_{name}' for bound in ('min', 'optimal', 'max') for name in RANGE_FACTORS] + \
+                        [f'{name}_requirement' for name in NUTRIENT_FACTORS]
+        query = select(Crop.id, Crop.crop_name, *[type_coerce(table.c[column], Float) for column in value_columns]
+                       ).outerjoin(table, table.c.crop_id == Crop.id).order_by(Crop.id)
+        rows = db.session.execute(query).fetchall()
+        crops = pd.DataFrame(rows, columns=['crop_id', 'crop_name'] + value_columns).drop_duplicates('crop_id')
+        values = crops[value_columns].astype(float).to_numpy()
+        ranges = values[:, :3 * len(RANGE_FACTORS)].reshape(len(crops), 3, len(RANGE_FACTORS))
+        return cls(crops['crop_id'].to_numpy(), crops['crop_name'].tolist(),
+                   ranges[:, 0], ranges[:, 1], ranges[:, 2], values[:, 3 * len(RANGE_FACTORS):])
+
+    def _factor_block(self, features, crops=slice(None)):
+        """Nutrient and range scores of a block of farms, farms x factors x crops, 0 where either side is unknown
+
+        crops is a slice over all crops, or a farms x k array of crop positions
+        to score each farm against its own k crops. Crops are the last axis so
+        every operation runs along contiguous crops.
+        """
+        def crop_values(values):
+            return values[None, :, crops] if isinstance(crops, slice) else values[:, crops].transpose(1, 0, 2)
+
+        features = features[:, :, None]
+        # Nutrients: supply / need, capped at 1; fmax turns NaN into 0
+        nutrients = features[:, :len(NUTRIENT_FACTORS)] * crop_values(self._need_scale)
+        nutrients += crop_values(self._need_free)
+        np.fmax(nutrients, 0, out=nutrients)
+        np.minimum(nutrients, 1, out=nutrients)
+
+        # Ranges: d is 0 at the optimum and 1 at min/max; the score is the lower of the inside
+        # line (1 at d=0, EDGE_SCORE at d=1) and the outside line (EDGE_SCORE at d=1, 0 at d=1+TOLERANCE)
+        offset = features[:, len(NUTRIENT_FACTORS):] - crop_values(self._optimal)
+        distance = offset * crop_values(self._above_slope)
+        offset *= crop_values(self._below_slope)
+        np.maximum(distance, offset, out=distance)
+        inside = np.multiply(distance, EDGE_SCORE - 1, out=offset)
+        inside += 1
+        distance *= -EDGE_SCORE / TOLERANCE
+        distance += EDGE_SCORE * (1 + TOLERANCE) / TOLERANCE
+        np.minimum(inside, distance, out=inside)
+        np.fmax(inside, 0, out=inside)
+        return nutrients, inside
+
+    def _blocks(self, features):
+        features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        for start in range(0, len(features), BLOCK_FARMS):
+            yield features[start:start + BLOCK_FARMS]
+
+    def factor_scores(self, features, crops=slice(None)):
+        """farms x crops x FEATURES scores in [0, 1], NaN where unknown
+
+        crops as in _factor_block; by default every crop.
+        """
+        blocks = []
+        for index, block in enumerate(self._blocks(features)):
+            block_crops = crops if isinstance(crops, slice) else crops[index * BLOCK_FARMS:][:len(block)]
+            scores = np.concatenate(self._factor_block(block, block_crops), axis=1).transpose(0, 2, 1)
+            known = (~np.isnan(block))[:, None, :] & (
+                self.known[None, block_crops] if isinstance(block_crops, slice) else self.known[block_crops])
+            blocks.append(np.where(known, scores, np.nan))
+        return np.concatenate(blocks) if blocks else np.empty((0, len(self.crop_ids), len(FEATURES)), np.float32)
+
+    def _score_block(self, block):
+        total = np.zeros((len(block), len(self.crop_ids)), dtype=np.float32)
+        for scores, weights in zip(self._factor_block(block), np.split(self.weights, [len(NUTRIENT_FACTORS)])):
+            for factor, weight in enumerate(weights):
+                total += weight * scores[:, factor]
+        # Total weight of the factors known on both sides
+        weight = (~np.isnan(block) * self.weights).dot(self.known.T.astype(np.float32))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(weight > 0, total * 100 / weight, np.nan)
+
+    def score(self, features):
+        """farms x crops overall scores (0-100), NaN when no factor is known on both sides"""
+        blocks = [self._score_block(block) for block in self._blocks(features)]
+        return np.concatenate(blocks) if blocks else np.empty((0, len(self.crop_ids)), np.float32)
+
+    def top(self, features, top=DEFAULT_TOP):
+        """(crop positions, scores) of the best `top` crops per farm, best first; scores of -1 mark unscored crops"""
+        top = min(top, len(self.crop_ids))
+        positions, best_scores = [], []
+        for block in self._blocks(features):
+            scores = np.nan_to_num(self._score_block(block), nan=-1)
+            if top:
+                best = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+                best = np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+            else:
+                best = np.empty((len(block), 0), dtype=int)
+            positions.append(best)
+            best_scores.append(np.take_along_axis(scores, best, axis=1))
+        if not positions:
+            return np.empty((0, top), dtype=int), np.empty((0, top), dtype=np.float32)
+        return np.concatenate(positions), np.concatenate(best_scores)
+
+    def rank(self, features, top=DEFAULT_TOP, breakdown=True):
+        """Best `top` crops per farm, as lists of dicts with optional per-factor scores"""
+        best, scores = self.top(features, top)
+        crop_ids = self.crop_ids[best].tolist()
+        rounded = np.round(scores.astype(float), 1).tolist()
+        if breakdown:
+            factors = np.round(self.factor_scores(features, best).astype(float) * 100, 1).tolist()
+
+        rankings = []
+        for farm, crops in enumerate(best.tolist()):
+            ranked = []
+            for position, crop in enumerate(crops):
+                if rounded[farm][position] < 0:
+                    continue
+                entry = {'crop_id': crop_ids[farm][position], 'name': self.crop_names[crop],
+                         'score': rounded[farm][position]}
+                if breakdown:
+                    entry['factors'] = {name: None if value != value else value
+                                        for name, value in zip(FEATURES, factors[farm][position])}
+                ranked.append(entry)
+            rankings.append(ranked)
+        return rankings
+
+
+def requirements_signature():
+    """Data version, row counts and max ids of crops and crop_requirements; changes with any of them"""
+    return tuple(db.session.execute(select(
+        version_of(REQUIREMENTS_VERSION),
+        select(func.count(Crop.id)).scalar_subquery(), select(func.max(Crop.id)).scalar_subquery(),
+        select(func.count(CropRequirement.id)).scalar_subquery(),
+        select(func.max(CropRequirement.id)).scalar_subquery())).one())
+
+
+class SuitabilityEngine:
+    """Per-process SuitabilityMatrix, rebuilt when crops or requirements change"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._signature = None
+
+    def get(self):
+        signature = requirements_signature()
+        with self._lock:
+            hit = self._matrix is not None and signature == self._signature
+            record_cache('crop_suitability', hit)
+            if not hit:
+                self._matrix = SuitabilityMatrix.from_database()
+                self._signature = signature
+            return self._matrix
+
+    def invalidate(self):
+        with self._lock:
+            self._matrix = None
+
+    def rank(self, features, top=DEFAULT_TOP, breakdown=True):
+        return self.get().rank(features, top, breakdown)
+
+
+suitability_engine = SuitabilityEngine()
+
+track(REQUIREMENTS_VERSION, Crop, CropRequirement, on_commit=suitability_engine.invalidate)
@@ -0,0 +1,113 @@
+"""
+Data Versions
+For Agriculture Advisory System
+
+One counter per cached dataset in the data_versions table. Per-process
+caches (crop suitability matrices, market analytics, the location index)
+store the version they were built from and rebuild when it changes, so an
+edit or delete committed by any worker invalidates every worker's copy.
+
+ORM commits bump the counters of the datasets they touch in the same
+transaction (session events below), once per commit. Bulk writers that
+bypass the ORM name the tables they wrote with mark_changed, and their
+datasets are bumped the same way at commit.
+
+Usage:
+    track('market_prices', MarketPrice)
+    track('locations', Location, fields=('latitude', 'longitude'))
+    mark_changed(db.session, 'market_prices')  # after a raw INSERT, before commit
+    signature = db.session.execute(select(version_of('market_prices'))).scalar()
+"""
+
+from itertools import chain
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from flask_models import DataVersion
+
+# model -> [(dataset name, fields whose update counts, or None for any)]
+_tracked = {}
+# dataset name -> callbacks run in this process after a commit that bumped it
+_listeners = {}
+
+
+def track(name, *models, fields=None, on_commit=None):
+    """Bump name whenever instances of models are inserted, deleted or (given fields) have them updated"""
+    for model in models:
+        _tracked.setdefault(model, []).append((name, fields))
+    if on_commit is not None:
+        _listeners.setdefault(name, []).append(on_commit)
+
+
+def mark_changed(session, *tables):
+    """Record writes that bypassed the ORM; datasets tracking these tables are bumped at commit"""
+    session.info.setdefault('data_versions_tables', set()).update(tables)
+
+
+def version_of(name):
+    """Scalar subquery of a dataset's version (NULL until first bumped)"""
+    return select(DataVersion.version).where(DataVersion.name == name).scalar_subquery()
+
+
+def bump_data_version(session, name):
+    """Increment a data_versions counter in the session's transaction, creating it if missing"""
+    bump = update(DataVersion).where(DataVersion.name == name).values(
+        version=DataVersion.version + 1, updated_at=func.current_timestamp())
+    if session.execute(bump).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(DataVersion.__table__.insert().values(name=name, version=1))
+    except IntegrityError:
+        # Created concurrently by another process
+        session.execute(bump)
+
+
+def _changed(obj, fields, dirty):
+    if not dirty or fields is None:
+        return True
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_changes(session, flush_context, instances):
+    changed = set()
+    for dirty, objects in ((False, chain(session.new, session.deleted)), (True, session.dirty)):
+        for obj in objects:
+            for name, fields in _tracked.get(type(obj), ()):
+                if _changed(obj, fields, dirty):
+                    changed.add(name)
+    if changed:
+        session.info.setdefault('data_versions_changed', set()).update(changed)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_on_commit(session):
+    # Also fired when a savepoint is released; only the outermost commit bumps versions
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    names = session.info.pop('data_versions_changed', set())
+    tables = session.info.pop('data_versions_tables', ())
+    names.update(name for model, entries in _tracked.items() if model.__tablename__ in tables for name, _ in entries)
+    if names:
+        # Sorted, so concurrent commits lock the rows in the same order
+        for name in sorted(names):
+            bump_data_version(session, name)
+        session.info['data_versions_bumped'] = names
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_on_commit(session):
+    for name in session.info.pop('data_versions_bumped', ()):
+        for callback in _listeners.get(name, ()):
+            callback()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    for key in ('data_versions_changed', 'data_versions_tables', 'data_versions_bumped'):
+        session.info.pop(key, None)
@@ -0,0 +1,296 @@
+"""
+Disease and Pest Risk Alerts
+For Agriculture Advisory System
+
+Turns the favorable_conditions of every crop_diseases_pests row into
+disease_outbreak notifications for the farmers growing an affected crop
+where recent weather favoured it.
+
+favorable_conditions is a JSON object of daily weather ranges plus how
+many favourable days within a window raise the alarm, e.g. for late blight:
+
+    {"temperature": {"min": 10, "max": 25}, "humidity": {"min": 90},
+     "min_days": 2, "window_days": 5}
+
+Ranges may be given for any of WEATHER_VARIABLES (temperature is the daily
+mean); a day is favourable when it falls in all of them. affected_crops is
+a JSON array of crop names.
+
+All rules are compiled into rules x variables bound arrays (RuleSet), and
+the recent weather of every location is packed into one locations x days x
+variables array, so evaluating every rule at every location is a handful of
+broadcast comparisons. Triggered (location, rule) pairs are joined with the
+crops currently grown on farms there (sown within GROWING_DAYS and not yet
+harvested). The result is one notification per user, location and rule,
+naming all of that user's affected crops. Alerts stay active for ALERT_DAYS,
+and a user is not alerted again for a rule and location while one is
+active. New alerts are bulk-inserted, then the recipients' notification
+streams are woken.
+
+Run it after weather ingest:
+
+    python disease_risk.py
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Float, func, select, type_coerce
+
+from flask_models import db, Crop, CropDiseasePest, Farm, FarmActivity, Notification, WeatherData
+from notification_stream import publish
+from weather_rollups import LOCATION_BATCH
+
+WEATHER_VARIABLES = ('temperature', 'temperature_max', 'temperature_min', 'humidity', 'rainfall', 'wind_speed')
+DEFAULT_MIN_DAYS = 3
+DEFAULT_WINDOW_DAYS = 7
+MAX_WINDOW_DAYS = 30
+GROWING_DAYS = 180
+ALERT_DAYS = 3
+
+NOTIFICATION_COLUMNS = ('user_id', 'notification_type', 'title', 'message', 'priority', 'is_read', 'action_required',
+                        'expiry_date', 'location_specific', 'location_id', 'created_at')
+
+
+def _crop_names(value):
+    try:
+        names = json.loads(value) if value else []
+    except ValueError:
+        return []
+    return [str(name).strip().lower() for name in names] if isinstance(names, list) else []
+
+
+class RuleSet:
+    """Favorable-condition rules packed as bound arrays, with vectorized evaluation"""
+
+    def __init__(self, rules):
+        # rules: dicts with id, name, type, severity, prevention, crop_ids and conditions
+        self.rules = list(rules)
+        count = len(self.rules)
+        self.lower = np.full((count, len(WEATHER_VARIABLES)), -np.inf)
+        self.upper = np.full((count, len(WEATHER_VARIABLES)), np.inf)
+        self.min_days = np.empty(count, dtype=int)
+        self.window_days = np.empty(count, dtype=int)
+        for index, rule in enumerate(self.rules):
+            conditions = rule['conditions']
+            for position, variable in enumerate(WEATHER_VARIABLES):
+                bounds = conditions.get(variable) or {}
+                if bounds.get('min') is not None:
+                    self.lower[index, position] = float(bounds['min'])
+                if bounds.get('max') is not None:
+                    self.upper[index, position] = float(bounds['max'])
+            self.window_days[index] = min(int(conditions.get('window_days', DEFAULT_WINDOW_DAYS)), MAX_WINDOW_DAYS)
+            self.min_days[index] = min(int(conditions.get('min_days', DEFAULT_MIN_DAYS)), self.window_days[index])
+        # variables x rules, for broadcasting against locations x days x 1
+        self._lower, self._upper = self.lower.T.copy(), self.upper.T.copy()
+        self._constrained = np.isfinite(self._lower) | np.isfinite(self._upper)
+
+    @classmethod
+    def from_database(cls):
+        """Rules with usable conditions and at least one known affected crop; returns (rule set, rows skipped)"""
+        crop_ids = {name.lower(): crop_id for crop_id, name in db.session.query(Crop.id, Crop.crop_name)}
+        rules, skipped = [], 0
+        for row in CropDiseasePest.query.order_by(CropDiseasePest.id):
+            try:
+                conditions = json.loads(row.favorable_conditions) if row.favorable_conditions else None
+            except ValueError:
+                conditions = None
+            affected = [crop_ids[name] for name in _crop_names(row.affected_crops) if name in crop_ids]
+            if not isinstance(conditions, dict) or not affected or \
+                    not any(isinstance(conditions.get(variable), dict) for variable in WEATHER_VARIABLES):
+                skipped += 1
+                continue
+            rules.append({'id': row.id, 'name': row.name, 'type': row.type, 'severity': row.severity_level or 'medium',
+                          'prevention': row.prevention_methods, 'crop_ids': affected, 'conditions': conditions})
+        return cls(rules), skipped
+
+    @property
+    def max_window(self):
+        return int(self.window_days.max()) if len(self.rules) else 0
+
+    def favorable_days(self, weather):
+        """locations x rules count of favourable days, from a locations x days x WEATHER_VARIABLES array
+
+        Day 0 is the latest; each rule counts only its own window. A missing
+        reading of a constrained variable makes the day unfavourable.
+        """
+        weather = np.asarray(weather, dtype=float)
+        favorable = np.ones(weather.shape[:2] + (len(self.rules),), dtype=bool)
+        for position in range(len(WEATHER_VARIABLES)):
+            constrained = self._constrained[position]
+            if not constrained.any():
+                continue
+            values = weather[:, :, position, None]
+            with np.errstate(invalid='ignore'):
+                inside = (values >= self._lower[position]) & (values <= self._upper[position])
+            favorable &= inside | ~constrained
+        in_window = np.arange(weather.shape[1])[:, None] < self.window_days[None, :]
+        return (favorable & in_window).sum(axis=1)
+
+
+def recent_weather(as_of, days):
+    """(location ids, locations x days x WEATHER_VARIABLES array) for the `days` days ending at as_of"""
+    table = WeatherData.__table__
+    temperature = func.coalesce(table.c.temperature_avg, (table.c.temperature_max + table.c.temperature_min) / 2)
+    query = select(table.c.location_id, table.c.date, type_coerce(temperature, Float),
+                   *[type_coerce(table.c[variable], Float) for variable in WEATHER_VARIABLES[1:]]).where(
+        table.c.date > as_of - timedelta(days=days), table.c.date <= as_of)
+    frame = pd.DataFrame(db.session.connection().execute(query).fetchall(),
+                         columns=('location_id', 'date') + WEATHER_VARIABLES)
+    location_ids = np.unique(frame['location_id'].to_numpy()).astype(int)
+    cube = np.full((len(location_ids), days, len(WEATHER_VARIABLES)), np.nan)
+    if len(frame):
+        days_ago = (pd.Timestamp(as_of) - pd.to_datetime(frame['date'])).dt.days.to_numpy()
+        cube[np.searchsorted(location_ids, frame['location_id'].to_numpy()), days_ago] = \
+            frame[list(WEATHER_VARIABLES)].to_numpy(dtype=float)
+    return location_ids, cube
+
+
+def growing_crops(location_ids, as_of):
+    """(user_id, location_id, farm_id, crop_id) for crops sown within GROWING_DAYS and not harvested since"""
+    frames = []
+    for offset in range(0, len(location_ids), LOCATION_BATCH):
+        batch = [int(location_id) for location_id in location_ids[offset:offset + LOCATION_BATCH]]
+        query = select(Farm.user_id, Farm.location_id, FarmActivity.farm_id, FarmActivity.crop_id,
+                       FarmActivity.activity_type, func.max(FarmActivity.activity_date)).join(
+            Farm, Farm.id == FarmActivity.farm_id).where(
+            Farm.location_id.in_(batch), FarmActivity.crop_id.isnot(None),
+            FarmActivity.activity_type.in_(('sowing', 'harvesting')),
+            FarmActivity.activity_date > as_of - timedelta(days=GROWING_DAYS),
+            FarmActivity.activity_date <= as_of).group_by(
+            Farm.user_id, Farm.location_id, FarmActivity.farm_id, FarmActivity.crop_id, FarmActivity.activity_type)
+        frames.append(pd.DataFrame(db.session.connection().execute(query).fetchall(),
+                                   columns=['user_id', 'location_id', 'farm_id', 'crop_id', 'activity_type', 'date']))
+    columns = ['user_id', 'location_id', 'farm_id', 'crop_id']
+    activity = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns + ['activity_type',
+                                                                                                     'date'])
+    dates = activity.pivot_table(index=columns, columns='activity_type', values='date', aggfunc='max')
+    if 'sowing' not in dates:
+        return pd.DataFrame(columns=columns)
+    sown = dates['sowing'].notna()
+    if 'harvesting' in dates:
+        sown &= ~(dates['harvesting'] >= dates['sowing'])
+    return dates[sown].reset_index()[columns]
+
+
+def _active_alerts(location_ids, today):
+    """(user_id, location_id, title) of disease alerts not yet expired"""
+    keys = set()
+    for offset in range(0, len(location_ids), LOCATION_BATCH):
+        batch = [int(location_id) for location_id in location_ids[offset:offset + LOCATION_BATCH]]
+        keys.update(db.session.query(Notification.user_id, Notification.location_id, Notification.title).filter(
+            Notification.notification_type == 'disease_outbreak', Notification.location_id.in_(batch),
+            Notification.expiry_date >= today).distinct())
+    return keys
+
+
+def _title(rule):
+    return f"{'Pest' if rule['type'] == 'pest' else 'Disease'} risk: {rule['name']}"
+
+
+def _message(rule, days, window, crops):
+    message = f"Weather on {days} of the last {window} days has favoured {rule['name']}. Crops at risk: {crops}."
+    if rule['prevention']:
+        message += f" Prevention: {rule['prevention']}"
+    return message
+
+
+def find_risks(as_of=None, rules=None):
+    """Farm crops at risk: a DataFrame with user, location, farm, crop, rule and favourable days"""
+    if rules is None:
+        rules, _ = RuleSet.from_database()
+    columns = ['user_id', 'location_id', 'farm_id', 'crop_id', 'rule', 'favorable_days']
+    if as_of is None:
+        as_of = db.session.query(func.max(WeatherData.date)).scalar()
+    if not len(rules.rules) or as_of is None:
+        return pd.DataFrame(columns=columns)
+
+    location_ids, weather = recent_weather(as_of, rules.max_window)
+    counts = rules.favorable_days(weather)
+    location_index, rule_index = np.nonzero(counts >= rules.min_days)
+    triggered = pd.DataFrame({'location_id': location_ids[location_index], 'rule': rule_index,
+                              'favorable_days': counts[location_index, rule_index]})
+    if not len(triggered):
+        return pd.DataFrame(columns=columns)
+
+    affected = pd.DataFrame([(index, crop_id) for index, rule in enumerate(rules.rules) for crop_id in rule['crop_ids']],
+                            columns=['rule', 'crop_id'])
+    crops = growing_crops(np.unique(triggered['location_id'].to_numpy()), as_of)
+    return triggered.merge(affected, on='rule').merge(crops, on=['location_id', 'crop_id'])[columns]
+
+
+def generate_disease_alerts(as_of=None):
+    """Evaluate every rule everywhere and insert the new alerts; returns a summary of the run"""
+    started = time.perf_counter()
+    rules, skipped_rules = RuleSet.from_database()
+    risks = find_risks(as_of, rules)
+    summary = {'rules': len(rules.rules), 'rules_skipped': skipped_rules, 'farm_crops_at_risk': len(risks),
+               'alerts': 0, 'duplicates': 0}
+    if not len(risks):
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        return summary
+
+    crop_names = dict(db.session.query(Crop.id, Crop.crop_name))
+    risks['crop'] = risks['crop_id'].map(crop_names)
+    alerts = risks.groupby(['user_id', 'location_id', 'rule'], as_index=False).agg(
+        favorable_days=('favorable_days', 'max'), crops=('crop', lambda names: ', '.join(sorted(set(names)))))
+    alerts['title'] = [_title(rules.rules[rule]) for rule in alerts['rule']]
+
+    today = date.today()
+    active = _active_alerts(np.unique(alerts['location_id'].to_numpy()), today)
+    new = [(user_id, location_id, title) not in active for user_id, location_id, title in
+           zip(alerts['user_id'].tolist(), alerts['location_id'].tolist(), alerts['title'].tolist())]
+    summary['duplicates'] = len(alerts) - sum(new)
+    alerts = alerts[new]
+
+    created_at = datetime.utcnow().isoformat(' ')
+    expiry = (today + timedelta(days=ALERT_DAYS)).isoformat()
+    rows = []
+    for user_id, location_id, rule, days, crops, title in zip(
+            alerts['user_id'].tolist(), alerts['location_id'].tolist(), alerts['rule'].tolist(),
+            alerts['favorable_days'].tolist(), alerts['crops'].tolist(), alerts['title'].tolist()):
+        rule_data = rules.rules[rule]
+        rows.append((user_id, 'disease_outbreak', title, _message(rule_data, days, int(rules.window_days[rule]), crops),
+                     rule_data['severity'], False, True, expiry, True, location_id, created_at))
+    if rows:
+        connection = db.session.connection()
+        placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+        try:
+            connection.exec_driver_sql(
+                f"INSERT INTO {Notification.__tablename__} ({', '.join(NOTIFICATION_COLUMNS)}) "
+                f"VALUES ({', '.join([placeholder] * len(NOTIFICATION_COLUMNS))})", rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        publish(alerts['user_id'].tolist())
+    summary['alerts'] = len(rows)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Alert farmers to weather-driven disease and pest risk')
+    parser.add_argument('--date', help='Evaluate the weather up to this date (YYYY-MM-DD); defaults to the latest')
+    args = parser.parse_args()
+    as_of = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else None
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        summary = generate_disease_alerts(as_of)
+    print(f"✅ Evaluated {summary['rules']} rules in {summary['seconds']}s: {summary['alerts']:,} new alerts for "
+          f"{summary['farm_crops_at_risk']:,} farm crops at risk, {summary['duplicates']:,} already active")
+    if summary['rules_skipped']:
+        print(f"⚠️ Skipped {summary['rules_skipped']} diseases/pests without usable favorable_conditions "
+              f"or known affected_crops")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+Farm Feature Vectors
+For Agriculture Advisory System
+
+Assembles each farm's crop model input (N, P, K, temperature, humidity, pH,
+rainfall) from stored data, so a recommendation needs only a farm_id:
+- N, P, K and pH from the farm's latest soil test
+- temperature and humidity: means over the last CLIMATE_WINDOW_DAYS of
+  weather at the farm's location
+- rainfall: annual rainfall at the location, the mean daily rainfall over
+  the last RAINFALL_WINDOW_DAYS times 365, so locations with under a year
+  of readings still get an annual figure
+
+A location without weather of its own borrows that of the nearest location
+with weather within WEATHER_FALLBACK_KM (see location_index); the row's
+weather_location_id records which one was used.
+
+Vectors are kept in farm_features, one row per farm, and read with a single
+primary key lookup. They are maintained incrementally:
+- committing soil tests, farms or weather rows through the ORM refreshes the
+  affected farms (session events below)
+- weather_ingest refreshes the locations in each chunk before committing it;
+  farms that borrowed a neighbour's weather switch to their own location's
+  as soon as it has some
+- a farm without a row yet is assembled on first use
+
+Usage:
+    python farm_features.py --rebuild
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from itertools import chain
+
+from sqlalchemy import Float, String, case, event, func, or_, select, type_coerce
+from sqlalchemy.orm import Session
+
+from flask_models import db, Farm, FarmFeature, SoilData, WeatherData
+from location_index import location_index
+from weather_rollups import LOCATION_BATCH
+
+FEATURES = ('nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall')
+CLIMATE_WINDOW_DAYS = 90
+RAINFALL_WINDOW_DAYS = 365
+
+SOIL_COLUMNS = ('soil_data_id', 'soil_test_date', 'nitrogen', 'phosphorus', 'potassium', 'ph')
+WEATHER_COLUMNS = ('temperature', 'humidity', 'rainfall', 'weather_days', 'weather_start', 'weather_end')
+FEATURE_COLUMNS = ('farm_id', 'location_id', 'weather_location_id') + SOIL_COLUMNS + WEATHER_COLUMNS + ('updated_at',)
+
+
+def _batches(ids):
+    ids = sorted(set(ids))
+    for offset in range(0, len(ids), LOCATION_BATCH):
+        yield ids[offset:offset + LOCATION_BATCH]
+
+
+def _latest_soil(farm_ids):
+    """Latest soil test per farm, indexed by farm_id"""
+    table = SoilData.__table__
+    columns = ['farm_id'] + list(SOIL_COLUMNS)
+    frames = []
+    for batch in _batches(farm_ids):
+        query = select(table.c.farm_id, table.c.id, type_coerce(table.c.test_date, String),
+                       type_coerce(table.c.nitrogen_content, Float), type_coerce(table.c.phosphorus_content, Float),
+                       type_coerce(table.c.potassium_content, Float), type_coerce(table.c.ph_level, Float)).where(
+            table.c.farm_id.in_(batch))
+        frames.append(pd.DataFrame(db.session.connection().execute(query).fetchall(), columns=columns))
+    soil = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    # Latest test date wins; the higher id breaks ties between tests on the same day
+    soil = soil.sort_values(['soil_test_date', 'soil_data_id']).drop_duplicates('farm_id', keep='last')
+    return soil.set_index('farm_id')
+
+
+def location_weather(location_ids):
+    """Climate and annual rainfall per location, indexed by location_id
+
+    Windows end at each location's latest reading, so a feed that lags by a
+    few days still gives a full window. Aggregated in SQL, one query per
+    distinct latest date (usually one or two per batch).
+    """
+    table = WeatherData.__table__
+    temperature = func.coalesce(table.c.temperature_avg, (table.c.temperature_max + table.c.temperature_min) / 2)
+    rows = []
+    for batch in _batches(location_ids):
+        latest = select(table.c.location_id, func.max(table.c.date)).where(
+            table.c.location_id.in_(batch)).group_by(table.c.location_id)
+        by_latest = {}
+        for location_id, latest_date in db.session.connection().execute(latest):
+            by_latest.setdefault(latest_date, []).append(location_id)
+        for latest_date, ids in by_latest.items():
+            climate = table.c.date > latest_date - timedelta(days=CLIMATE_WINDOW_DAYS)
+            query = select(
+                table.c.location_id,
+                type_coerce(func.avg(case((climate, temperature))), Float),
+                type_coerce(func.avg(case((climate, table.c.humidity))), Float),
+                type_coerce(func.avg(table.c.rainfall) * 365, Float),
+                func.count(),
+                type_coerce(func.min(table.c.date), String),
+                type_coerce(func.max(table.c.date), String)
+            ).where(table.c.location_id.in_(ids),
+                    table.c.date > latest_date - timedelta(days=RAINFALL_WINDOW_DAYS)).group_by(table.c.location_id)
+            rows.extend(db.session.connection().execute(query).fetchall())
+    return pd.DataFrame(rows, columns=('location_id',) + WEATHER_COLUMNS).set_index('location_id')
+
+
+def _weather_locations(location_ids, weather):
+    """location_id -> location whose weather stands in for it: its own, else the nearest with weather"""
+    sources = {location_id: location_id for location_id in location_ids if location_id in weather.index}
+    missing = [location_id for location_id in location_ids if location_id not in sources]
+    if missing:
+        sources.update((location_id, source[0]) for location_id, source in
+                       location_index.weather_sources(missing).items() if source is not None)
+    return sources
+
+
+def upsert_sql(dialect_name, paramstyle):
+    """Batched upsert of whole farm_features rows on farm_id"""
+    placeholders = ', '.join(['?' if paramstyle == 'qmark' else '%s'] * len(FEATURE_COLUMNS))
+    columns = ', '.join(FEATURE_COLUMNS)
+    table = FarmFeature.__tablename__
+    if dialect_name == 'sqlite' and sqlite3.sqlite_version_info < (3, 24, 0):
+        return f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})"
+    updates = ', '.join(f"{column} = excluded.{column}" for column in FEATURE_COLUMNS[1:])
+    return f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) ON CONFLICT (farm_id) DO UPDATE SET {updates}"
+
+
+def _rows(frame, columns):
+    """Rows of plain Python values (None for missing) for executemany"""
+    values = []
+    for column in columns:
+        series = frame[column]
+        if series.dtype.kind == 'f':
+            series = series.round(2)
+        values.append(series.astype(object).where(series.notna(), None).tolist())
+    return list(zip(*values))
+
+
+def refresh_farm_features(farm_ids):
+    """Rebuild the feature rows of these farms; the caller commits. Returns the row count."""
+    farm_ids = list(farm_ids)
+    frames = []
+    for batch in _batches(farm_ids):
+        frames.append(pd.DataFrame(db.session.query(Farm.id, Farm.location_id).filter(Farm.id.in_(batch)).all(),
+                                   columns=['farm_id', 'location_id']))
+    farms = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['farm_id', 'location_id'])
+    if not len(farms):
+        return 0
+
+    locations = farms['location_id'].unique().tolist()
+    weather = location_weather(locations)
+    sources = _weather_locations(locations, weather)
+    borrowed = set(sources.values()) - set(weather.index)
+    if borrowed:
+        weather = pd.concat([weather, location_weather(borrowed)])
+    farms['weather_location_id'] = farms['location_id'].map(sources).astype('Int64')
+    features = farms.join(_latest_soil(farms['farm_id']), on='farm_id').join(weather, on='weather_location_id')
+    features['soil_data_id'] = features['soil_data_id'].astype('Int64')
+    features['weather_days'] = features['weather_days'].fillna(0).astype(int)
+    features['updated_at'] = datetime.utcnow().isoformat(' ')
+    connection = db.session.connection()
+    connection.exec_driver_sql(upsert_sql(connection.dialect.name, connection.dialect.paramstyle),
+                               _rows(features, FEATURE_COLUMNS))
+    return len(features)
+
+
+def update_farm_weather(location_ids):
+    """Refresh the weather part of every stored farm row using these locations' weather; the caller commits
+
+    Farms without a row are left alone; they are assembled on first use.
+    Returns the number of weather locations refreshed.
+    """
+    # Only locations whose weather is in use need aggregating
+    stored = [location_id for batch in _batches(location_ids) for location_id, in
+              db.session.query(FarmFeature.weather_location_id).filter(
+                  FarmFeature.weather_location_id.in_(batch)).distinct()]
+    weather = location_weather(stored)
+    if len(weather):
+        weather['updated_at'] = datetime.utcnow().isoformat(' ')
+        weather['location_id'] = weather.index
+        columns = WEATHER_COLUMNS + ('updated_at',)
+        connection = db.session.connection()
+        placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+        connection.exec_driver_sql(
+            f"UPDATE {FarmFeature.__tablename__} SET {', '.join(f'{column} = {placeholder}' for column in columns)} "
+            f"WHERE weather_location_id = {placeholder}", _rows(weather, columns + ('location_id',)))
+
+    # Farms at these locations that borrowed a neighbour's weather, or had none, now have their own
+    borrowing = [farm_id for batch in _batches(location_ids) for farm_id, in
+                 db.session.query(FarmFeature.farm_id).filter(
+                     FarmFeature.location_id.in_(batch),
+                     or_(FarmFeature.weather_location_id.is_(None),
+                         FarmFeature.weather_location_id != FarmFeature.location_id))]
+    if borrowing:
+        refresh_farm_features(borrowing)
+    return len(weather)
+
+
+def rebuild_farm_features():
+    """Recompute every farm's row"""
+    FarmFeature.query.delete(synchronize_session=False)
+    written = refresh_farm_features([row[0] for row in db.session.query(Farm.id)])
+    db.session.commit()
+    return written
+
+
+def get_farm_features(farm_id):
+    """A farm's assembled features, or None for an unknown farm
+
+    Returns a dict with the FEATURES values (None where no data exists),
+    the soil test and weather window they came from, and which are missing.
+    """
+    row = db.session.get(FarmFeature, farm_id)
+    if row is None:
+        if not refresh_farm_features([farm_id]):
+            return None
+        db.session.commit()
+        row = db.session.get(FarmFeature, farm_id)
+
+    features = {name: float(getattr(row, name)) if getattr(row, name) is not None else None for name in FEATURES}
+    return {
+        'farm_id': row.farm_id,
+        'location_id': row.location_id,
+        'features': features,
+        'missing': [name for name in FEATURES if features[name] is None],
+        'soil_test_date': row.soil_test_date.strftime('%Y-%m-%d') if row.soil_test_date else None,
+        'weather': {
+            'location_id': row.weather_location_id,
+            'days': row.weather_days,
+            'start': row.weather_start.strftime('%Y-%m-%d') if row.weather_start else None,
+            'end': row.weather_end.strftime('%Y-%m-%d') if row.weather_end else None
+        },
+        'updated_at': row.updated_at.isoformat()
+    }
+
+
+def feature_vector(features):
+    """Model input row, in the crop model's feature order"""
+    return np.array([[features[name] for name in FEATURES]], dtype=float)
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_feature_changes(session, flush_context):
+    farms = session.info.setdefault('farm_feature_farms', set())
+    locations = session.info.setdefault('farm_feature_locations', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, SoilData):
+            farms.add(obj.farm_id)
+        elif isinstance(obj, Farm):
+            farms.add(obj.id)
+        elif isinstance(obj, WeatherData):
+            locations.add(obj.location_id)
+
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_on_commit(session):
+    # Flush first so pending objects are noted, then write in the same transaction
+    session.flush()
+    farms = session.info.pop('farm_feature_farms', set())
+    locations = session.info.pop('farm_feature_locations', set())
+    if farms:
+        existing = [farm_id for farm_id, in session.query(Farm.id).filter(Farm.id.in_(farms))]
+        session.query(FarmFeature).filter(FarmFeature.farm_id.in_(farms - set(existing))).delete(
+            synchronize_session=False)
+        refresh_farm_features(existing)
+    if locations:
+        update_farm_weather(locations)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('farm_feature_farms', None)
+    session.info.pop('farm_feature_locations', None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain per-farm crop model feature vectors')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute every farm from soil and weather data')
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        written = rebuild_farm_features()
+    print(f"✅ Rebuilt feature vectors for {written:,} farms")
+
+
+if __name__ == '__main__':
+    main()
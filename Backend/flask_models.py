@@ -56,6 +56,7 @@ class Location(db.Model):
     pincode = db.Column(db.String(10))
     latitude = db.Column(db.Numeric(10, 8))
     longitude = db.Column(db.Numeric(11, 8))
+    canonical_key = db.Column(db.String(255), unique=True)  # normalized place; see location_resolver
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -141,6 +142,60 @@ class WeatherData(db.Model):
 
     __table_args__ = (db.UniqueConstraint('location_id', 'date', name='unique_location_date'),)
 
+# Weather Rollup Model (weekly, monthly and seasonal summaries of WeatherData)
+class WeatherRollup(db.Model):
+    __tablename__ = 'weather_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
+    period_type = db.Column(db.Enum('week', 'month', 'season', name='rollup_period'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    period_end = db.Column(db.Date, nullable=False)
+    label = db.Column(db.String(20))  # e.g. 2025-W23, 2025-06, kharif 2025
+    season = db.Column(db.Enum('kharif', 'rabi', 'zaid', name='season'))  # season rollups only
+    days = db.Column(db.Integer, nullable=False)  # daily readings aggregated
+    temperature_avg = db.Column(db.Numeric(5, 2))
+    temperature_min = db.Column(db.Numeric(5, 2))
+    temperature_max = db.Column(db.Numeric(5, 2))
+    rainfall_total = db.Column(db.Numeric(8, 2))  # in mm
+    humidity_avg = db.Column(db.Numeric(5, 2))
+    evapotranspiration_total = db.Column(db.Numeric(8, 2))  # in mm
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    location = relationship("Location")
+
+    __table_args__ = (db.UniqueConstraint('location_id', 'period_type', 'period_start', name='unique_weather_rollup'),)
+
+# Farm Feature Model (crop model input assembled from soil tests and local weather)
+class FarmFeature(db.Model):
+    __tablename__ = 'farm_features'
+
+    farm_id = db.Column(db.Integer, db.ForeignKey('farms.id', ondelete='CASCADE'), primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
+    weather_location_id = db.Column(db.Integer, db.ForeignKey('locations.id'))  # a nearby location when the farm's has no weather
+    soil_data_id = db.Column(db.Integer)  # latest soil test used
+    soil_test_date = db.Column(db.Date)
+    nitrogen = db.Column(db.Numeric(5, 2))
+    phosphorus = db.Column(db.Numeric(5, 2))
+    potassium = db.Column(db.Numeric(5, 2))
+    ph = db.Column(db.Numeric(3, 1))
+    temperature = db.Column(db.Numeric(5, 2))  # mean over the climate window
+    humidity = db.Column(db.Numeric(5, 2))  # mean over the climate window
+    rainfall = db.Column(db.Numeric(8, 2))  # annual, in mm
+    weather_days = db.Column(db.Integer, nullable=False, default=0)  # daily readings in the rainfall window
+    weather_start = db.Column(db.Date)
+    weather_end = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    farm = relationship("Farm")
+    location = relationship("Location", foreign_keys=[location_id])
+    weather_location = relationship("Location", foreign_keys=[weather_location_id])
+
+    __table_args__ = (db.Index('idx_farm_features_location', 'location_id'),
+                      db.Index('idx_farm_features_weather_location', 'weather_location_id'))
+
 # Crop Master Data Model
 class Crop(db.Model):
     __tablename__ = 'crops'
@@ -200,6 +255,14 @@ class CropRequirement(db.Model):
     # Relationships
     crop = relationship("Crop", back_populates="requirements")
 
+# Data Version Model (counters bumped by every commit changing a cached dataset)
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # Fertilizer Model
 class Fertilizer(db.Model):
     __tablename__ = 'fertilizers'
@@ -289,6 +352,31 @@ class MarketPrice(db.Model):
     crop = relationship("Crop", back_populates="market_prices")
     location = relationship("Location", back_populates="market_prices")
 
+    __table_args__ = (db.Index('unique_market_price', 'crop_id', 'location_id', 'market_name', 'date', 'quality_grade',
+                               unique=True),)
+
+# Price Forecast Model (latest batch forecast per crop/location series)
+class PriceForecast(db.Model):
+    __tablename__ = 'price_forecasts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    crop_id = db.Column(db.Integer, db.ForeignKey('crops.id'), nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
+    forecast_date = db.Column(db.Date, nullable=False)
+    horizon_days = db.Column(db.Integer, nullable=False)
+    price_per_quintal = db.Column(db.Numeric(10, 2), nullable=False)
+    lower_bound = db.Column(db.Numeric(10, 2))
+    upper_bound = db.Column(db.Numeric(10, 2))
+    model = db.Column(db.String(30))  # e.g. ses(0.3), holt(0.5,0.1), seasonal_naive
+    holdout_mae = db.Column(db.Numeric(10, 2))
+    generated_at = db.Column(db.DateTime, nullable=False)
+
+    # Relationships
+    crop = relationship("Crop")
+    location = relationship("Location")
+
+    __table_args__ = (db.Index('idx_price_forecasts_crop_location_date', 'crop_id', 'location_id', 'forecast_date'),)
+
 # Crop Recommendation Model
 class CropRecommendation(db.Model):
     __tablename__ = 'crop_recommendations'
@@ -306,18 +394,39 @@ class CropRecommendation(db.Model):
     actual_yield = db.Column(db.Numeric(10, 2))
     feedback_rating = db.Column(db.Integer)
     feedback_comments = db.Column(db.Text)
+    source = db.Column(db.String(20))  # 'batch' when precomputed by batch_recommendations; NULL when requested
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
     user = relationship("User", back_populates="crop_recommendations")
     farm = relationship("Farm", back_populates="crop_recommendations")
 
+    __table_args__ = (db.Index('idx_crop_recommendations_farm_season', 'farm_id', 'season', 'year'),)
+
     def get_recommended_crops(self):
         return json.loads(self.recommended_crops) if self.recommended_crops else []
 
     def get_input_parameters(self):
         return json.loads(self.input_parameters) if self.input_parameters else {}
 
+# Batch Checkpoint Model (progress of each shard of a resumable batch job)
+class BatchCheckpoint(db.Model):
+    __tablename__ = 'batch_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    shard = db.Column(db.Integer, nullable=False)
+    start_id = db.Column(db.Integer, nullable=False)  # exclusive
+    end_id = db.Column(db.Integer, nullable=False)  # inclusive
+    last_id = db.Column(db.Integer, nullable=False)  # last id committed
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    run_started_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.UniqueConstraint('job', 'shard', name='unique_batch_checkpoint'),)
+
 # Fertilizer Recommendation Model
 class FertilizerRecommendation(db.Model):
     __tablename__ = 'fertilizer_recommendations'
@@ -383,12 +492,16 @@ class Notification(db.Model):
     expiry_date = db.Column(db.Date)
     location_specific = db.Column(db.Boolean, default=False)
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'))
+    idempotency_key = db.Column(db.String(64))  # set by fan-outs; one notification per user and key
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
     user = relationship("User", back_populates="notifications")
     location = relationship("Location", back_populates="notifications")
 
+    __table_args__ = (db.Index('idx_notifications_location_type', 'location_id', 'notification_type', 'expiry_date'),
+                      db.UniqueConstraint('user_id', 'idempotency_key', name='unique_notification_key'))
+
 # Farm Activity Model
 class FarmActivity(db.Model):
     __tablename__ = 'farm_activities'
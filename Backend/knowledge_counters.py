@@ -0,0 +1,127 @@
+"""
+Knowledge Base Counters
+For Agriculture Advisory System
+
+Article views and likes are counted in memory and written to knowledge_base
+every FLUSH_SECONDS by a background thread, so serving an article never
+writes to the database and popular articles do not queue on SQLite's single
+writer.
+
+A flush adds each article's accumulated increments in one statement per
+FLUSH_BATCH articles, all in one transaction:
+
+    UPDATE knowledge_base
+    SET views_count = COALESCE(views_count, 0) + CASE id WHEN 7 THEN 12 WHEN 9 THEN 3 ELSE 0 END,
+        likes_count = COALESCE(likes_count, 0) + CASE id WHEN 7 THEN 1 ELSE 0 END
+    WHERE id IN (7, 9)
+
+Writing deltas rather than totals keeps the counts right whatever order the
+workers flush in.
+
+Counts survive worker recycling: each worker flushes on exit (gunicorn's
+--max-requests restarts exit normally, so atexit runs), and a failed flush
+puts its increments back for the next attempt. Only a crash loses the last
+FLUSH_SECONDS of counts.
+"""
+
+import atexit
+import threading
+
+from flask_models import db, KnowledgeBase
+
+FIELDS = ('views_count', 'likes_count')
+FLUSH_SECONDS = 5.0
+FLUSH_BATCH = 500
+
+
+def update_sql(batch):
+    """One batched UPDATE adding the increments of a {article_id: {field: delta}} batch
+
+    Ids and deltas are ints produced here, never user input, so they are
+    written inline and the statement stays within any bound-parameter limit.
+    """
+    ids = sorted(batch)
+    assignments = []
+    for field in FIELDS:
+        cases = ' '.join(f"WHEN {int(article_id)} THEN {int(batch[article_id][field])}"
+                         for article_id in ids if batch[article_id][field])
+        if cases:
+            assignments.append(f"{field} = COALESCE({field}, 0) + CASE id {cases} ELSE 0 END")
+    return (f"UPDATE {KnowledgeBase.__tablename__} SET {', '.join(assignments)} "
+            f"WHERE id IN ({', '.join(str(int(article_id)) for article_id in ids)})")
+
+
+class CounterAggregator:
+    """Per-process view and like increments, flushed in batches"""
+
+    def __init__(self, flush_seconds=FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._app = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.stop)
+
+    def increment(self, article_id, field, amount=1):
+        """Count a view or like in memory; never touches the database"""
+        if field not in FIELDS:
+            raise ValueError(f"field must be one of {', '.join(FIELDS)}")
+        with self._lock:
+            counts = self._pending.setdefault(article_id, dict.fromkeys(FIELDS, 0))
+            counts[field] += amount
+            # Started on first use rather than at import, so every forked worker gets its own thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def pending(self, article_id):
+        """Increments of an article not yet flushed by this process"""
+        with self._lock:
+            return dict(self._pending.get(article_id) or dict.fromkeys(FIELDS, 0))
+
+    def _restore(self, counts):
+        with self._lock:
+            for article_id, deltas in counts.items():
+                current = self._pending.setdefault(article_id, dict.fromkeys(FIELDS, 0))
+                for field in FIELDS:
+                    current[field] += deltas[field]
+
+    def flush(self):
+        """Write every pending increment; returns the number of articles updated"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = self._pending, {}
+            if not counts:
+                return 0
+            article_ids = sorted(counts)
+            try:
+                with self._app.app_context(), db.engine.begin() as connection:
+                    for offset in range(0, len(article_ids), FLUSH_BATCH):
+                        batch = {article_id: counts[article_id]
+                                 for article_id in article_ids[offset:offset + FLUSH_BATCH]}
+                        connection.exec_driver_sql(update_sql(batch))
+            except Exception as e:
+                # Nothing was committed; keep the increments for the next flush
+                self._restore(counts)
+                # The DBAPI error alone; the statement lists every pending article
+                print(f"⚠️ Could not flush counters of {len(counts):,} articles: {str(getattr(e, 'orig', e))}")
+                return 0
+            return len(counts)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_seconds):
+            self.flush()
+
+    def stop(self):
+        """Flush what is left; called on worker exit"""
+        self._stopped.set()
+        if self._app is not None:
+            self.flush()
+
+
+knowledge_counters = CounterAggregator()
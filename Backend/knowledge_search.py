@@ -0,0 +1,424 @@
+"""
+Knowledge Base Search
+For Agriculture Advisory System
+
+Full-text search over published knowledge_base articles, ranked with BM25
+over title, tags and content (weighted by FIELD_WEIGHTS), filtered by
+category, language, difficulty and tag, with tag and category facets
+counted over every match rather than just the page.
+
+Backends, picked from the database in use:
+- SQLite with FTS5: the knowledge_base_fts virtual table, ranked by bm25()
+- PostgreSQL: knowledge_search, one weighted tsvector per article under a
+  GIN index, ranked by ts_rank_cd with length normalization (PostgreSQL has
+  no built-in BM25; this is its closest ranking)
+- anything else: an in-memory inverted index scored with BM25 in Python,
+  one per process, rebuilt every MEMORY_REFRESH_SECONDS so other processes'
+  saves are picked up
+
+Words are tokens in any script, NFKC-normalized and case-folded, so Hindi
+and other Indic articles are searchable as well as English ones. A query
+matches articles containing every one of its words.
+
+The index is maintained incrementally. Articles saved through the ORM are
+re-indexed within the same transaction (session events below), and only
+when a searchable field changed, so view and like counters cost nothing.
+
+Usage:
+    python knowledge_search.py --rebuild
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from flask_models import db, KnowledgeBase
+
+FTS_TABLE = 'knowledge_base_fts'
+TSVECTOR_TABLE = 'knowledge_search'
+# Changes to any other column (views, likes) leave the index alone
+SEARCHABLE_FIELDS = ('title', 'content', 'tags', 'category', 'language', 'difficulty_level', 'is_published')
+FIELD_WEIGHTS = {'title': 4.0, 'tags': 2.0, 'content': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PER_PAGE = 10
+MAX_PER_PAGE = 50
+FACET_LIMIT = 20
+SUMMARY_CHARS = 200
+INDEX_BATCH = 500
+MEMORY_REFRESH_SECONDS = 300
+
+CATEGORIES = KnowledgeBase.__table__.c.category.type.enums
+DIFFICULTIES = KnowledgeBase.__table__.c.difficulty_level.type.enums
+
+# \w misses Indic vowel signs and viramas (combining marks), so those blocks are added whole
+TOKEN = re.compile(r'[\w\u0900-\u0dff]+')
+
+
+def tokenize(text):
+    return TOKEN.findall(unicodedata.normalize('NFKC', text or '').casefold())
+
+
+def _tags(value):
+    """Tags of an article; tolerates a plain comma-separated string"""
+    if not value:
+        return []
+    try:
+        tags = json.loads(value)
+    except ValueError:
+        tags = value.split(',')
+    return [str(tag).strip() for tag in (tags if isinstance(tags, list) else [tags]) if str(tag).strip()]
+
+
+class InvertedIndex:
+    """BM25 over field-weighted term frequencies, for databases without full-text search"""
+
+    def __init__(self):
+        self.postings = {}  # token -> {article_id: weighted term frequency}
+        self.lengths = {}
+        self.meta = {}  # article_id -> (category, language, difficulty_level, tags)
+        self._terms = {}
+        self._total_length = 0.0
+
+    def add(self, article_id, fields, meta):
+        self.remove(article_id)
+        frequencies = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields[field]):
+                frequencies[token] += weight
+        for token, frequency in frequencies.items():
+            self.postings.setdefault(token, {})[article_id] = frequency
+        self._terms[article_id] = list(frequencies)
+        self.lengths[article_id] = sum(frequencies.values())
+        self._total_length += self.lengths[article_id]
+        self.meta[article_id] = meta
+
+    def remove(self, article_id):
+        for token in self._terms.pop(article_id, ()):
+            postings = self.postings[token]
+            del postings[article_id]
+            if not postings:
+                del self.postings[token]
+        self._total_length -= self.lengths.pop(article_id, 0.0)
+        self.meta.pop(article_id, None)
+
+    def search(self, tokens):
+        """{article_id: score} of articles containing every token"""
+        postings = [self.postings.get(token) for token in set(tokens)]
+        if not postings or any(posting is None for posting in postings):
+            return {}
+        postings.sort(key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        count, average = len(self.lengths), self._total_length / len(self.lengths)
+        scores = dict.fromkeys(matches, 0.0)
+        for posting in postings:
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for article_id in matches:
+                frequency = posting[article_id]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[article_id] / average)
+                scores[article_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+
+def _documents(session, article_ids):
+    """(id, title, content, tag text, category, language, difficulty, tags) of these published articles"""
+    table = KnowledgeBase.__table__
+    article_ids = sorted(article_ids)
+    for offset in range(0, len(article_ids), INDEX_BATCH):
+        rows = session.execute(select(
+            table.c.id, table.c.title, table.c.content, table.c.tags, table.c.category, table.c.language,
+            table.c.difficulty_level).where(table.c.id.in_(article_ids[offset:offset + INDEX_BATCH]),
+                                            table.c.is_published.is_(True)))
+        for article_id, title, content, tags, category, language, difficulty in rows:
+            tags = _tags(tags)
+            yield article_id, title, content, ' '.join(tags), category, language, difficulty, tags
+
+
+class KnowledgeSearch:
+    """The knowledge base search index on whichever backend the database supports"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+        self._ready = False
+        self._memory = None
+        self._memory_built = 0.0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            dialect = db.engine.dialect.name
+            if dialect == 'postgresql':
+                self._backend = 'tsvector'
+            elif dialect == 'sqlite' and self._has_fts5():
+                self._backend = 'fts5'
+            else:
+                self._backend = 'python'
+        return self._backend
+
+    @staticmethod
+    def _has_fts5():
+        # A temp table lives in the probing connection only, so this never waits on writers
+        try:
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)")
+                connection.exec_driver_sql("DROP TABLE temp.fts5_probe")
+            return True
+        except OperationalError:
+            return False
+
+    def ensure(self):
+        """Create and fill the index if missing; returns the backend in use"""
+        backend, created = self._ensure(db.session)
+        if created:
+            db.session.commit()
+        return backend
+
+    def _ensure(self, session):
+        """(backend, whether the index was created in the session's transaction)"""
+        backend, created = self.backend, False
+        if backend == 'python':
+            with self._lock:
+                if self._memory is None or time.monotonic() - self._memory_built > MEMORY_REFRESH_SECONDS:
+                    self._memory = self._build_memory(session)
+                    self._memory_built = time.monotonic()
+        elif not self._ready:
+            connection = session.connection()
+            if backend == 'fts5':
+                exists = connection.exec_driver_sql(
+                    f"SELECT 1 FROM sqlite_master WHERE name = '{FTS_TABLE}'").first() is not None
+            else:
+                exists = connection.exec_driver_sql(f"SELECT to_regclass('{TSVECTOR_TABLE}')").scalar() is not None
+            if not exists:
+                self._create(connection)
+                self._write(session, [article_id for article_id, in session.query(KnowledgeBase.id)])
+                created = True
+            self._ready = True
+        return backend, created
+
+    def _create(self, connection):
+        if self.backend == 'fts5':
+            connection.exec_driver_sql(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, tags, "
+                                       f"tokenize = 'unicode61 remove_diacritics 2')")
+        else:
+            connection.exec_driver_sql(f"CREATE TABLE {TSVECTOR_TABLE} (article_id INTEGER PRIMARY KEY "
+                                       f"REFERENCES knowledge_base(id) ON DELETE CASCADE, document TSVECTOR NOT NULL)")
+            connection.exec_driver_sql(f"CREATE INDEX idx_{TSVECTOR_TABLE}_document ON {TSVECTOR_TABLE} "
+                                       f"USING GIN (document)")
+
+    def _build_memory(self, session):
+        index = InvertedIndex()
+        for document in _documents(session, [article_id for article_id, in session.query(KnowledgeBase.id)]):
+            self._add_memory(index, document)
+        return index
+
+    @staticmethod
+    def _add_memory(index, document):
+        article_id, title, content, tag_text, category, language, difficulty, tags = document
+        index.add(article_id, {'title': title, 'content': content, 'tags': tag_text},
+                  (category, language, difficulty, tags))
+
+    def _write(self, session, article_ids):
+        """Replace the index rows of these articles in the session's transaction"""
+        connection = session.connection()
+        placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+        article_ids = sorted(article_ids)
+        for offset in range(0, len(article_ids), INDEX_BATCH):
+            batch = article_ids[offset:offset + INDEX_BATCH]
+            id_list = ', '.join([placeholder] * len(batch))
+            if self.backend == 'fts5':
+                connection.exec_driver_sql(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({id_list})", tuple(batch))
+                sql = f"INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES ({', '.join([placeholder] * 4)})"
+            else:
+                connection.exec_driver_sql(f"DELETE FROM {TSVECTOR_TABLE} WHERE article_id IN ({id_list})",
+                                           tuple(batch))
+                sql = (f"INSERT INTO {TSVECTOR_TABLE} (article_id, document) VALUES ({placeholder}, "
+                       f"setweight(to_tsvector('simple', {placeholder}), 'A') || "
+                       f"setweight(to_tsvector('simple', {placeholder}), 'C') || "
+                       f"setweight(to_tsvector('simple', {placeholder}), 'B'))")
+            rows = [document[:4] for document in _documents(session, batch)]
+            if rows:
+                connection.exec_driver_sql(sql, rows)
+
+    def update(self, session, article_ids):
+        """Re-index these articles (saved, unpublished or deleted) in the session's transaction
+
+        The in-memory index cannot roll back, so its changes are staged here
+        and applied after the commit.
+        """
+        if self._ensure(session)[0] == 'python':
+            session.info['knowledge_documents'] = (set(article_ids), list(_documents(session, article_ids)))
+        else:
+            self._write(session, article_ids)
+
+    def apply_staged(self, staged):
+        article_ids, documents = staged
+        with self._lock:
+            if self._memory is None:
+                return
+            for article_id in article_ids:
+                self._memory.remove(article_id)
+            for document in documents:
+                self._add_memory(self._memory, document)
+
+    def rebuild(self):
+        """Recompute the whole index from knowledge_base; returns the articles indexed"""
+        backend = self.ensure()
+        if backend == 'python':
+            with self._lock:
+                self._memory = self._build_memory(db.session)
+                self._memory_built = time.monotonic()
+            return len(self._memory.lengths)
+        db.session.connection().exec_driver_sql(f"DELETE FROM {FTS_TABLE if backend == 'fts5' else TSVECTOR_TABLE}")
+        self._write(db.session, [article_id for article_id, in db.session.query(KnowledgeBase.id)])
+        db.session.commit()
+        return db.session.query(KnowledgeBase).filter(KnowledgeBase.is_published.is_(True)).count()
+
+    def _matches(self, tokens, filters):
+        """[(article_id, score, category, tags)] of every match passing the filters"""
+        backend = self.ensure()
+        if backend == 'python':
+            with self._lock:
+                scores = self._memory.search(tokens)
+                meta = {article_id: self._memory.meta[article_id] for article_id in scores}
+            return [(article_id, score, meta[article_id][0], meta[article_id][3]) for article_id, score in
+                    scores.items() if all(meta[article_id][position] == value for position, value in filters)]
+
+        connection = db.session.connection()
+        placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+        columns = ('category', 'language', 'difficulty_level')
+        conditions = ''.join(f" AND kb.{columns[position]} = {placeholder}" for position, _ in filters)
+        values = tuple(value for _, value in filters)
+        if backend == 'fts5':
+            # Each word quoted as a phrase, so user input never reaches FTS5 query syntax
+            query = ' '.join('"' + token.replace('"', '""') + '"' for token in tokens)
+            weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in ('title', 'content', 'tags'))
+            rows = connection.exec_driver_sql(
+                f"SELECT kb.id, -bm25({FTS_TABLE}, {weights}), kb.category, kb.tags FROM {FTS_TABLE} "
+                f"JOIN knowledge_base kb ON kb.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH {placeholder}{conditions}", (query,) + values)
+        else:
+            rows = connection.exec_driver_sql(
+                f"SELECT kb.id, ts_rank_cd(ks.document, query, 1), kb.category, kb.tags FROM {TSVECTOR_TABLE} ks "
+                f"JOIN knowledge_base kb ON kb.id = ks.article_id, plainto_tsquery('simple', {placeholder}) query "
+                f"WHERE ks.document @@ query{conditions}", (' '.join(tokens),) + values)
+        return [(article_id, float(score), category, _tags(tags)) for article_id, score, category, tags in rows]
+
+    def search(self, query, category=None, language=None, difficulty=None, tag=None, page=1, per_page=PER_PAGE):
+        """One page of matching articles, best first, with facets; raises ValueError for bad input"""
+        tokens = tokenize(query)
+        if not tokens:
+            raise ValueError('Enter at least one word to search for')
+        if category and category not in CATEGORIES:
+            raise ValueError(f"category must be one of {', '.join(CATEGORIES)}")
+        if difficulty and difficulty not in DIFFICULTIES:
+            raise ValueError(f"difficulty must be one of {', '.join(DIFFICULTIES)}")
+        page, per_page = max(page, 1), min(max(per_page, 1), MAX_PER_PAGE)
+
+        started = time.perf_counter()
+        filters = [(position, value) for position, value in enumerate((category, language, difficulty)) if value]
+        matches = self._matches(tokens, filters)
+        if tag:
+            wanted = tag.strip().casefold()
+            matches = [match for match in matches if wanted in {name.casefold() for name in match[3]}]
+        matches.sort(key=lambda match: (-match[1], match[0]))
+
+        shown = matches[(page - 1) * per_page:page * per_page]
+        articles = {article.id: article for article in
+                    KnowledgeBase.query.filter(KnowledgeBase.id.in_([match[0] for match in shown]))}
+        return {
+            'query': query,
+            'total': len(matches),
+            'page': page,
+            'per_page': per_page,
+            'results': [dict(article_summary(articles[article_id]), score=float(f'{score:.4g}'))
+                        for article_id, score, _, _ in shown if article_id in articles],
+            'facets': {
+                'tags': [{'tag': name, 'count': count} for name, count in
+                         Counter(name for match in matches for name in match[3]).most_common(FACET_LIMIT)],
+                'category': [{'category': name, 'count': count} for name, count in
+                             Counter(match[2] for match in matches).most_common()]
+            },
+            'backend': self.backend,
+            'seconds': round(time.perf_counter() - started, 4)
+        }
+
+
+def article_summary(article):
+    return {
+        'id': article.id,
+        'title': article.title,
+        'summary': article.content[:SUMMARY_CHARS],
+        'category': article.category,
+        'tags': _tags(article.tags),
+        'author': article.author,
+        'difficulty_level': article.difficulty_level,
+        'language': article.language,
+        'views_count': article.views_count,
+        'likes_count': article.likes_count,
+        'published_date': article.published_date.strftime('%Y-%m-%d') if article.published_date else None
+    }
+
+
+knowledge_search = KnowledgeSearch()
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_article_changes(session, flush_context):
+    changed = {obj.id for obj in session.new if isinstance(obj, KnowledgeBase)}
+    changed.update(obj.id for obj in session.deleted if isinstance(obj, KnowledgeBase))
+    changed.update(obj.id for obj in session.dirty if isinstance(obj, KnowledgeBase) and any(
+        inspect(obj).attrs[field].history.has_changes() for field in SEARCHABLE_FIELDS))
+    if changed:
+        session.info.setdefault('knowledge_articles', set()).update(changed)
+
+
+@event.listens_for(Session, 'before_commit')
+def _index_on_commit(session):
+    session.flush()
+    article_ids = session.info.pop('knowledge_articles', None)
+    if article_ids:
+        knowledge_search.update(session, article_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_on_commit(session):
+    staged = session.info.pop('knowledge_documents', None)
+    if staged:
+        knowledge_search.apply_staged(staged)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('knowledge_articles', None)
+    session.info.pop('knowledge_documents', None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the knowledge base search index')
+    parser.add_argument('--rebuild', action='store_true', help='Re-index every article')
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        indexed = knowledge_search.rebuild()
+        print(f"✅ Indexed {indexed:,} articles ({knowledge_search.backend})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Nearest-Location Index
+For Agriculture Advisory System
+
+In-memory spatial index over locations.latitude/longitude, used to:
+- reuse an existing location in the same district for a new farm within
+  LOCATION_REUSE_KM
+- fall back to the nearest location with weather (within
+  WEATHER_FALLBACK_KM) when a location has none of its own
+
+Points are stored as unit vectors in a scipy cKDTree, so straight-line
+(chord) distance orders neighbours exactly like great-circle distance, with
+no trouble at the antimeridian or the poles. Distances are reported in km.
+
+A KD-tree cannot take inserts, so new points go to a small pending buffer
+that is searched by brute force. The tree is rebuilt from scratch only once
+the buffer outgrows max(MIN_PENDING, sqrt(points)).
+
+The index catches up on every use. Every commit that adds or deletes a
+location, moves its coordinates, or inserts weather bumps the locations or
+weather_data data version (data_versions.py), including raw writes by
+weather_ingest, populate and the location merge. Refresh compares the two
+versions in one query and rebuilds what changed from scratch, so rows added,
+edited or removed by other processes are picked up whatever order their ids
+were committed in. It reads through its own connection, so it only ever
+sees committed rows; weather_sources looks up the coordinates of
+locations it has not seen yet through the caller's session.
+"""
+
+import numpy as np
+import threading
+
+from scipy.spatial import cKDTree
+from sqlalchemy import Float, select, type_coerce
+
+from data_versions import track, version_of
+from flask_models import db, Location, WeatherData
+from weather_rollups import LOCATION_BATCH
+
+EARTH_RADIUS_KM = 6371.0
+LOCATION_REUSE_KM = 2.0
+WEATHER_FALLBACK_KM = 50.0
+MIN_PENDING = 256
+LOCATIONS_VERSION = 'locations'
+WEATHER_VERSION = 'weather_data'
+
+
+def unit_vectors(latitudes, longitudes):
+    latitudes, longitudes = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack([np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes),
+                            np.sin(latitudes)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class SpatialIndex:
+    """k-nearest search over (id, latitude, longitude) points, with cheap inserts"""
+
+    def __init__(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._tree = None
+        self._pending_ids = []
+        self._pending_points = []
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending_ids)
+
+    def add(self, ids, latitudes, longitudes):
+        if not len(ids):
+            return
+        self._pending_ids.extend(int(point_id) for point_id in ids)
+        self._pending_points.extend(unit_vectors(latitudes, longitudes))
+        if len(self._pending_ids) > max(MIN_PENDING, np.sqrt(len(self))):
+            self._rebuild()
+
+    def _rebuild(self):
+        points = self._pending_points if self._tree is None else np.concatenate([self._tree.data,
+                                                                                 self._pending_points])
+        self._ids = np.concatenate([self._ids, np.array(self._pending_ids, dtype=np.int64)])
+        self._tree = cKDTree(np.asarray(points))
+        self._pending_ids, self._pending_points = [], []
+
+    def nearest(self, latitude, longitude, k=1, max_km=None):
+        """Up to k (id, distance_km) pairs, nearest first"""
+        query = unit_vectors([latitude], [longitude])[0]
+        bound = km_to_chord(max_km) if max_km is not None else np.inf
+        ids, chords = [], []
+        if self._tree is not None:
+            found, positions = self._tree.query(query, k=min(k, len(self._ids)), distance_upper_bound=bound)
+            found, positions = np.atleast_1d(found), np.atleast_1d(positions)
+            hit = np.isfinite(found)
+            ids.append(self._ids[positions[hit]])
+            chords.append(found[hit])
+        if self._pending_ids:
+            found = np.linalg.norm(np.asarray(self._pending_points) - query, axis=1)
+            hit = found <= bound
+            ids.append(np.array(self._pending_ids)[hit])
+            chords.append(found[hit])
+        if not ids:
+            return []
+        ids, chords = np.concatenate(ids), np.concatenate(chords)
+        order = np.argsort(chords, kind='stable')[:k]
+        return [(int(point_id), round(float(km), 3)) for point_id, km in zip(ids[order], chord_to_km(chords[order]))]
+
+
+class LocationIndex:
+    """Located locations, and the subset with weather data, kept current with the database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.locations = SpatialIndex()
+        self.weather = SpatialIndex()
+        self._coordinates = {}
+        self._weather_ids = set()
+        self._signature = None
+
+    def refresh(self):
+        """Rebuild from the database if locations or weather changed since the last call"""
+        table, weather = Location.__table__, WeatherData.__table__
+        with self._lock, db.engine.connect() as connection:
+            signature = tuple(connection.execute(select(version_of(LOCATIONS_VERSION),
+                                                        version_of(WEATHER_VERSION))).one())
+            if signature == self._signature:
+                return len(self.locations)
+            locations_changed = self._signature is None or signature[0] != self._signature[0]
+
+            if locations_changed:
+                located = connection.execute(select(
+                    table.c.id, type_coerce(table.c.latitude, Float), type_coerce(table.c.longitude, Float)).where(
+                    table.c.latitude.isnot(None), table.c.longitude.isnot(None))).fetchall()
+                self.locations = SpatialIndex()
+                if located:
+                    self.locations.add(*zip(*located))
+                self._coordinates = {location_id: (latitude, longitude)
+                                     for location_id, latitude, longitude in located}
+
+            self._weather_ids = {row[0] for row in connection.execute(select(weather.c.location_id).distinct())}
+            with_weather = [location_id for location_id in self._weather_ids if location_id in self._coordinates]
+            self.weather = SpatialIndex()
+            if with_weather:
+                self.weather.add(with_weather, *zip(*[self._coordinates[location_id] for location_id in with_weather]))
+            self._signature = signature
+        return len(self.locations)
+
+    def nearest(self, latitude, longitude, k=1, with_weather=False, max_km=None):
+        """Up to k (location_id, distance_km) pairs, nearest first; only locations with weather if with_weather"""
+        self.refresh()
+        index = self.weather if with_weather else self.locations
+        with self._lock:
+            return index.nearest(latitude, longitude, k, max_km)
+
+    def weather_sources(self, location_ids, max_km=WEATHER_FALLBACK_KM):
+        """location_id -> (location_id, distance_km) whose weather serves it, or None
+
+        The location itself when it has weather, else the nearest one within
+        max_km that does.
+        """
+        self.refresh()
+        # Locations not committed yet (e.g. a farm being added) are read through the caller's session
+        unknown = [location_id for location_id in location_ids if location_id not in self._coordinates]
+        table, pending = Location.__table__, {}
+        for offset in range(0, len(unknown), LOCATION_BATCH):
+            pending.update((location_id, (latitude, longitude)) for location_id, latitude, longitude in
+                           db.session.connection().execute(select(
+                               table.c.id, type_coerce(table.c.latitude, Float),
+                               type_coerce(table.c.longitude, Float)).where(
+                               table.c.id.in_(unknown[offset:offset + LOCATION_BATCH]))).fetchall()
+                           if latitude is not None and longitude is not None)
+        sources = {}
+        with self._lock:
+            for location_id in location_ids:
+                coordinates = self._coordinates.get(location_id) or pending.get(location_id)
+                if location_id in self._weather_ids:
+                    sources[location_id] = (location_id, 0.0)
+                elif coordinates is None:
+                    sources[location_id] = None
+                else:
+                    found = self.weather.nearest(*coordinates, k=1, max_km=max_km)
+                    sources[location_id] = found[0] if found else None
+        return sources
+
+    def weather_source(self, location_id, max_km=WEATHER_FALLBACK_KM):
+        return self.weather_sources([location_id], max_km)[location_id]
+
+
+location_index = LocationIndex()
+
+track(LOCATIONS_VERSION, Location, fields=('latitude', 'longitude'))
+track(WEATHER_VERSION, WeatherData, fields=('location_id',))
@@ -0,0 +1,351 @@
+"""
+Canonical Locations
+For Agriculture Advisory System
+
+One locations row per real place. Every location carries a canonical_key,
+its normalized (country, state, district, city, pincode), under a unique
+index, and resolve_location reuses the row with the same key instead of
+creating another. Weather ingestion, rollups and alerts then scale with the
+number of places rather than the number of farms.
+
+Normalization lower-cases and collapses whitespace; pincodes also drop
+inner spaces. Keys are set on every ORM insert and update of a Location
+(mapper events below); bulk writers that bypass the ORM, such as the
+synthetic generator in populate_database, compute them with canonical_key.
+
+Databases from before canonical keys hold one location per farm and lack
+the canonical_key column, which create_all does not add to an existing
+table. Warmup adds the bare column (ensure_canonical_key_column) so the app
+runs; the one-off merge_duplicate_locations migration then, in one
+transaction, adds it if still missing, keeps the lowest id of each key,
+repoints farms, farm_features, weather_data, market_prices and
+notifications to it, backfills every key and only then creates the unique
+index:
+- a weather day or market price already present at the kept location (or
+  at a lower-numbered duplicate) wins over the duplicate's copy
+- weather rollups and price forecasts of merged locations are dropped; the
+  kept locations' rollups are rebuilt, and forecasts are refit by the
+  nightly price_forecast.py run
+
+Usage:
+    python location_resolver.py --stats
+    python location_resolver.py --merge [--dry-run]
+"""
+
+import argparse
+import os
+import time
+
+from sqlalchemy import Float, event, func, inspect, type_coerce
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from data_versions import mark_changed
+from flask_models import db, Farm, Location, WeatherData
+from location_index import LOCATION_REUSE_KM, location_index
+from metrics import registry
+from weather_rollups import LOCATION_BATCH
+
+KEY_FIELDS = ('country', 'state', 'district', 'city', 'pincode')
+# Unique index created by the migration on databases whose locations table predates canonical_key
+KEY_INDEX = 'idx_locations_canonical_key'
+
+# Tables whose location_id is repointed, and the columns that must stay unique alongside it
+REPOINTED_TABLES = {
+    'farms': None,
+    'weather_data': ('date',),
+    'market_prices': ('crop_id', 'market_name', 'date', 'quality_grade'),
+    'notifications': None
+}
+# Nearest locations within LOCATION_REUSE_KM checked for one in the same district
+NEARBY_CANDIDATES = 5
+# Derived per-location tables: dropped for merged locations and recomputed
+DERIVED_TABLES = ('weather_rollups', 'price_forecasts')
+
+LOCATION_RESOLUTIONS = registry.counter(
+    'agri_location_resolutions_total', 'Locations resolved for new farms, by how they were found', ('result',))
+
+
+def _normalise(value):
+    return ' '.join(str(value).split()).lower() if value is not None else ''
+
+
+def canonical_key(country, state, district, city=None, pincode=None):
+    """Normalized identity of a place: equal for the same place however it was typed"""
+    pincode = ''.join(str(pincode).split()) if pincode is not None else ''
+    return '|'.join([_normalise(country), _normalise(state), _normalise(district), _normalise(city), pincode])
+
+
+def _region(country, state, district):
+    return _normalise(country), _normalise(state), _normalise(district)
+
+
+def location_key(location):
+    return canonical_key(*(getattr(location, field) for field in KEY_FIELDS))
+
+
+@event.listens_for(Location, 'before_insert')
+@event.listens_for(Location, 'before_update')
+def _set_canonical_key(mapper, connection, target):
+    target.canonical_key = location_key(target)
+
+
+def _has_key_column(connection):
+    return any(column['name'] == 'canonical_key' for column in inspect(connection).get_columns('locations'))
+
+
+def _has_unique_key(connection):
+    inspector = inspect(connection)
+    return (any(index.get('unique') and index['column_names'] == ['canonical_key']
+                for index in inspector.get_indexes('locations'))
+            or any(constraint['column_names'] == ['canonical_key']
+                   for constraint in inspector.get_unique_constraints('locations')))
+
+
+def _add_key_column(connection):
+    """Add the bare canonical_key column if missing; returns True when added"""
+    if _has_key_column(connection):
+        return False
+    connection.exec_driver_sql("ALTER TABLE locations ADD COLUMN canonical_key VARCHAR(255)")
+    return True
+
+
+def ensure_canonical_key_column():
+    """Add canonical_key (without its unique index) to a locations table created before it
+
+    Run at warmup, so Location queries work before the merge migration; a
+    worker racing another to add it finds the column already there.
+    """
+    try:
+        with db.engine.begin() as connection:
+            return _add_key_column(connection)
+    except (OperationalError, ProgrammingError):
+        with db.engine.connect() as connection:
+            if _has_key_column(connection):
+                return False
+        raise
+
+
+def resolve_location(country, state, district, city=None, pincode=None, latitude=None, longitude=None):
+    """The canonical location for a place, created only when none exists; the caller commits
+
+    Looks up the place's canonical key first, then (with coordinates) any
+    location within LOCATION_REUSE_KM in the same country, state and
+    district. A location created concurrently by
+    another request wins the unique index, and its row is returned.
+    """
+    key = canonical_key(country, state, district, city, pincode)
+    location = Location.query.filter_by(canonical_key=key).first()
+    if location is not None:
+        LOCATION_RESOLUTIONS.inc(result='key')
+        if location.latitude is None and latitude is not None and longitude is not None:
+            location.latitude, location.longitude = latitude, longitude
+        return location
+
+    if latitude is not None and longitude is not None:
+        # Only within the same district: a neighbour across a border would file the farm under the wrong
+        # state and district. Weather is borrowed across borders by the fallback in location_index instead.
+        region = _region(country, state, district)
+        for location_id, _ in location_index.nearest(latitude, longitude, NEARBY_CANDIDATES, max_km=LOCATION_REUSE_KM):
+            location = db.session.get(Location, location_id)
+            if location is not None and _region(location.country, location.state, location.district) == region:
+                LOCATION_RESOLUTIONS.inc(result='nearby')
+                return location
+
+    location = Location(country=country, state=state, district=district, city=city, pincode=pincode,
+                        latitude=latitude, longitude=longitude)
+    try:
+        with db.session.begin_nested():
+            db.session.add(location)
+    except IntegrityError:
+        LOCATION_RESOLUTIONS.inc(result='key')
+        return Location.query.filter_by(canonical_key=key).one()
+    LOCATION_RESOLUTIONS.inc(result='created')
+    return location
+
+
+def location_stats():
+    """Locations, distinct places among them, and how many of each carry farms and weather"""
+    rows = db.session.query(Location.id, *(getattr(Location, field) for field in KEY_FIELDS)).all()
+    keys = {location_id: canonical_key(*fields) for location_id, *fields in rows}
+    farmed = {location_id for location_id, in db.session.query(Farm.location_id).distinct()}
+    weathered = {location_id for location_id, in db.session.query(WeatherData.location_id).distinct()}
+    return {
+        'locations': len(keys),
+        'places': len(set(keys.values())),
+        'locations_with_farms': len(farmed),
+        'places_with_farms': len({keys[location_id] for location_id in farmed if location_id in keys}),
+        'locations_with_weather': len(weathered),
+        'farms': db.session.query(func.count(Farm.id)).scalar()
+    }
+
+
+def plan_merge():
+    """(duplicate id -> kept id, kept id -> key) over every location"""
+    kept, merges = {}, {}
+    rows = db.session.query(Location.id, *(getattr(Location, field) for field in KEY_FIELDS)).order_by(Location.id)
+    for location_id, *fields in rows:
+        key = canonical_key(*fields)
+        if key in kept:
+            merges[location_id] = kept[key]
+        else:
+            kept[key] = location_id
+    return merges, {location_id: key for key, location_id in kept.items()}
+
+
+def _drop_collisions(connection, table, columns):
+    """Delete duplicates' rows that would break a unique constraint once repointed
+
+    A row survives when neither the kept location nor a lower-numbered
+    duplicate of it has a row with the same values.
+    """
+    same = ' AND '.join(f'k.{column} = d.{column}' for column in columns)
+    return connection.exec_driver_sql(
+        f"DELETE FROM {table} WHERE id IN ("
+        f"SELECT d.id FROM {table} d JOIN location_merge m ON m.old_id = d.location_id "
+        f"WHERE EXISTS (SELECT 1 FROM {table} k WHERE k.location_id = m.new_id AND {same}) "
+        f"OR EXISTS (SELECT 1 FROM {table} k JOIN location_merge km ON km.old_id = k.location_id "
+        f"WHERE km.new_id = m.new_id AND k.id < d.id AND {same}))").rowcount
+
+
+def _repoint(connection, table, column='location_id'):
+    return connection.exec_driver_sql(
+        f"UPDATE {table} SET {column} = (SELECT new_id FROM location_merge WHERE old_id = {table}.{column}) "
+        f"WHERE {column} IN (SELECT old_id FROM location_merge)").rowcount
+
+
+def merge_duplicate_locations(dry_run=False):
+    """Merge locations sharing a canonical key into the lowest id; returns a report
+
+    Runs in one transaction and commits at the end (unless dry_run).
+    """
+    started = time.perf_counter()
+    before = location_stats()
+    merges, kept = plan_merge()
+    report = {'before': before, 'merged_locations': len(merges), 'repointed': {}, 'dropped': {}}
+    if dry_run:
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        return report
+
+    try:
+        _merge(merges, kept, report)
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.expire_all()
+
+    report['after'] = location_stats()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def _merge(merges, kept, report):
+    from farm_features import update_farm_weather
+    from weather_rollups import rebuild_rollups
+
+    connection = db.session.connection()
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    report['added_column'] = _add_key_column(connection)
+    touched = sorted(set(merges.values()))
+    if merges:
+        connection.exec_driver_sql(
+            "CREATE TEMPORARY TABLE location_merge (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+        connection.exec_driver_sql("CREATE INDEX idx_location_merge_new ON location_merge (new_id)")
+        connection.exec_driver_sql(f"INSERT INTO location_merge (old_id, new_id) VALUES ({placeholder}, {placeholder})",
+                                   list(merges.items()))
+
+        for table, unique_columns in REPOINTED_TABLES.items():
+            if unique_columns:
+                report['dropped'][table] = _drop_collisions(connection, table, unique_columns)
+            report['repointed'][table] = _repoint(connection, table)
+        report['repointed']['farm_features'] = _repoint(connection, 'farm_features') + _repoint(
+            connection, 'farm_features', 'weather_location_id')
+        for table in DERIVED_TABLES:
+            report['dropped'][table] = connection.exec_driver_sql(
+                f"DELETE FROM {table} WHERE location_id IN (SELECT old_id FROM location_merge)").rowcount
+
+        # Kept locations without coordinates take the first a duplicate has
+        located, duplicates = Location.__table__, sorted(merges)
+        coordinates = {}
+        for offset in range(0, len(duplicates), LOCATION_BATCH):
+            batch = duplicates[offset:offset + LOCATION_BATCH]
+            rows = db.session.query(located.c.id, type_coerce(located.c.latitude, Float),
+                                    type_coerce(located.c.longitude, Float)).filter(
+                located.c.id.in_(batch), located.c.latitude.isnot(None), located.c.longitude.isnot(None))
+            for location_id, latitude, longitude in rows.order_by(located.c.id):
+                coordinates.setdefault(merges[location_id], (latitude, longitude, merges[location_id]))
+        if coordinates:
+            connection.exec_driver_sql(
+                f"UPDATE locations SET latitude = {placeholder}, longitude = {placeholder} "
+                f"WHERE id = {placeholder} AND latitude IS NULL", list(coordinates.values()))
+
+        connection.exec_driver_sql("DELETE FROM locations WHERE id IN (SELECT old_id FROM location_merge)")
+        connection.exec_driver_sql("DROP TABLE location_merge")
+        mark_changed(db.session, 'locations', *REPOINTED_TABLES)
+
+    # Duplicates are gone, so every remaining key is unique; this also backfills keys never set
+    stored = dict(db.session.query(Location.id, Location.canonical_key))
+    stale = [(key, location_id) for location_id, key in kept.items() if stored.get(location_id) != key]
+    if stale:
+        connection.exec_driver_sql(f"UPDATE locations SET canonical_key = {placeholder} WHERE id = {placeholder}",
+                                   stale)
+    report['backfilled_keys'] = len(stale)
+    if not _has_unique_key(connection):
+        connection.exec_driver_sql(f"CREATE UNIQUE INDEX {KEY_INDEX} ON locations (canonical_key)")
+        report['created_index'] = KEY_INDEX
+
+    if touched:
+        # Kept locations now hold their duplicates' weather; re-aggregate what is derived from it
+        update_farm_weather(touched)
+        rebuild_rollups(touched)  # commits the whole merge
+    db.session.commit()
+
+
+def _print_stats(label, stats):
+    print(f"{label}: {stats['locations']:,} locations for {stats['places']:,} places; "
+          f"{stats['locations_with_farms']:,} locations with farms ({stats['farms']:,} farms), "
+          f"{stats['locations_with_weather']:,} with weather")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report on and merge duplicate locations')
+    parser.add_argument('--stats', action='store_true', help='Show locations against distinct places')
+    parser.add_argument('--merge', action='store_true', help='Merge locations that share a canonical key')
+    parser.add_argument('--dry-run', action='store_true', help='With --merge, only report what would be merged')
+    args = parser.parse_args()
+    if not (args.stats or args.merge):
+        parser.print_help()
+        return
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        if args.stats:
+            _print_stats('📍 Locations', location_stats())
+        if args.merge:
+            report = merge_duplicate_locations(dry_run=args.dry_run)
+            _print_stats('📍 Before', report['before'])
+            if args.dry_run:
+                print(f"📍 Would merge {report['merged_locations']:,} duplicate locations")
+                return
+            _print_stats('📍 After', report['after'])
+            before, after = report['before']['locations'], report['after']['locations']
+            print(f"✅ Merged {report['merged_locations']:,} duplicate locations in {report['seconds']}s "
+                  f"({before:,} → {after:,}, {1 - after / before:.0%} fewer)" if before else
+                  "✅ No locations to merge")
+            for table, rows in report['repointed'].items():
+                print(f"   {table}: {rows:,} rows repointed")
+            for table, rows in report['dropped'].items():
+                if rows:
+                    print(f"   {table}: {rows:,} duplicate rows dropped")
+            if report['added_column']:
+                print("   locations: canonical_key column added")
+            print(f"   locations: {report['backfilled_keys']:,} canonical keys set")
+            if report.get('created_index'):
+                print(f"   locations: unique index {report['created_index']} created")
+            if report['merged_locations']:
+                print("⚠️ Restart running app workers so their location index forgets merged locations")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Market Price Analytics
+For Agriculture Advisory System
+
+Rolling averages, volatility, ranges and inter-market spreads for every
+(crop, location) price series in one vectorized pass. Prices from the last
+LOOKBACK_DAYS are pivoted into a date x series matrix, and each statistic is
+then a single pandas operation over all columns at once.
+
+Results are cached per process until prices change. Every commit that
+inserts, edits or deletes market prices bumps the market_prices data
+version (data_versions.py), through the ORM or market_import, so the
+version and MAX(id), two index lookups, tell whether the cache is stale.
+"""
+
+import numpy as np
+import pandas as pd
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import Float, String, func, select, type_coerce
+
+from data_versions import track, version_of
+from flask_models import db, Crop, Location, MarketPrice
+from metrics import record_cache
+
+PRICES_VERSION = 'market_prices'
+
+LOOKBACK_DAYS = 120
+SHORT_WINDOW = 7
+LONG_WINDOW = 30
+# A market's price counts towards today's spread if it traded within this many days
+SPREAD_WINDOW_DAYS = 7
+
+
+def _number(value, digits=2):
+    return None if value is None or pd.isna(value) else round(float(value), digits)
+
+
+def load_prices(lookback_days=LOOKBACK_DAYS):
+    """(as_of date, DataFrame of crop_id, location_id, market_name, date, price) for the lookback window"""
+    as_of = db.session.query(func.max(MarketPrice.date)).scalar()
+    columns = ['crop_id', 'location_id', 'market_name', 'date', 'price']
+    if as_of is None:
+        return None, pd.DataFrame(columns=columns)
+    table = MarketPrice.__table__
+    # Raw dates and float prices; Date and Numeric would build a Python object per value
+    query = select(table.c.crop_id, table.c.location_id, table.c.market_name, type_coerce(table.c.date, String),
+                   type_coerce(table.c.price_per_quintal, Float)).where(
+        table.c.date > as_of - timedelta(days=lookback_days))
+    prices = pd.DataFrame(db.session.connection().execute(query).fetchall(), columns=columns)
+    prices['date'] = pd.to_datetime(prices['date'], format='ISO8601')
+    prices['price'] = prices['price'].astype(float)
+    return pd.Timestamp(as_of), prices
+
+
+class MarketAnalytics:
+    """Analytics computed from one snapshot of market_prices"""
+
+    def __init__(self, as_of, series, spreads, history):
+        self.generated_at = datetime.utcnow()
+        self.as_of = as_of
+        self.series = series
+        self.spreads = spreads
+        self._history = history  # date x (statistic, crop_id, location_id) matrix
+
+    def to_dict(self, crop_id=None, location_id=None):
+        series = [s for s in self.series
+                  if (crop_id is None or s['crop_id'] == crop_id) and (location_id is None or s['location_id'] == location_id)]
+        spreads = [s for s in self.spreads if crop_id is None or s['crop_id'] == crop_id]
+        result = {
+            'generated_at': self.generated_at.isoformat(),
+            'as_of': self.as_of.strftime('%Y-%m-%d') if self.as_of is not None else None,
+            'series': series,
+            'spreads': spreads
+        }
+        if crop_id is not None and location_id is not None:
+            result['history'] = self.history(crop_id, location_id)
+        return result
+
+    def history(self, crop_id, location_id):
+        """Daily price with its 7- and 30-day rolling means, for one series"""
+        key = (crop_id, location_id)
+        if self._history is None or key not in self._history['price'].columns:
+            return []
+        frame = pd.DataFrame({name: self._history[name][key] for name in ('price', 'mean_7d', 'mean_30d')}).round(2)
+        frame = frame[frame['mean_7d'].notna()]
+        frame.insert(0, 'date', frame.index.strftime('%Y-%m-%d'))
+        return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def price_matrix(prices, as_of, periods):
+    """Date x (crop_id, location_id) matrix of daily prices, NaN on days without trading
+
+    A series' daily price is the mean over its markets and grades.
+    """
+    daily = prices.groupby(['date', 'crop_id', 'location_id'])['price'].mean()
+    return daily.unstack(['crop_id', 'location_id']).reindex(pd.date_range(end=as_of, periods=periods, freq='D'))
+
+
+def _series_stats(prices, as_of, crop_names, location_names):
+    """Per-series statistics and rolling-mean history from the date x series price matrix"""
+    matrix = price_matrix(prices, as_of, LOOKBACK_DAYS)
+    days = matrix.index
+
+    # Rolling means skip days without trading; volatility uses the last traded price
+    mean_short = matrix.rolling(SHORT_WINDOW, min_periods=1).mean()
+    mean_long = matrix.rolling(LONG_WINDOW, min_periods=1).mean()
+    recent = matrix.iloc[-LONG_WINDOW:]
+    returns = matrix.ffill().iloc[-(LONG_WINDOW + 1):].pct_change(fill_method=None).iloc[1:]
+
+    observed = matrix.notna().to_numpy()
+    last_position = np.where(observed, np.arange(len(days))[:, None], -1).max(axis=0)
+    values = matrix.to_numpy()
+    table = pd.DataFrame({
+        'crop_id': matrix.columns.get_level_values(0),
+        'location_id': matrix.columns.get_level_values(1),
+        'latest_date': days[last_position].strftime('%Y-%m-%d'),
+        'latest_price': values[last_position, np.arange(values.shape[1])],
+        'mean_7d': mean_short.iloc[-1].to_numpy(),
+        'mean_30d': mean_long.iloc[-1].to_numpy(),
+        'min_30d': recent.min().to_numpy(),
+        'max_30d': recent.max().to_numpy(),
+        'volatility_30d_pct': (returns.std() * 100).round(3).to_numpy(),
+        'trading_days_30d': recent.count().to_numpy()
+    })
+
+    table.insert(1, 'crop_name', table['crop_id'].map(crop_names))
+    table.insert(3, 'location', table['location_id'].map(location_names))
+    table = table.round(dict.fromkeys(['latest_price', 'mean_7d', 'mean_30d', 'min_30d', 'max_30d'], 2))
+    series = table.astype(object).where(table.notna(), None).to_dict('records')
+    history = pd.concat({'price': matrix, 'mean_7d': mean_short, 'mean_30d': mean_long}, axis=1)
+    return series, history
+
+
+def _spreads(prices, as_of, crop_names, location_names):
+    """Cheapest and dearest market per crop among markets that traded recently"""
+    recent = prices[prices['date'] > as_of - pd.Timedelta(days=SPREAD_WINDOW_DAYS)]
+    if not len(recent):
+        return []
+    # Each market's latest day, averaged over grades
+    by_day = recent.groupby(['crop_id', 'location_id', 'market_name', 'date'], dropna=False)['price'].mean().reset_index()
+    latest = by_day.sort_values('date').groupby(['crop_id', 'location_id', 'market_name'], dropna=False).tail(1)
+    grouped = latest.groupby('crop_id')['price']
+    low = latest.loc[grouped.idxmin()].set_index('crop_id')
+    high = latest.loc[grouped.idxmax()].set_index('crop_id')
+    markets = grouped.count()
+
+    spreads = []
+    for crop_id in markets.index:
+        low_price, high_price = low.at[crop_id, 'price'], high.at[crop_id, 'price']
+        spreads.append({
+            'crop_id': int(crop_id),
+            'crop_name': crop_names.get(crop_id),
+            'markets': int(markets[crop_id]),
+            'min_price': _number(low_price),
+            'min_market': low.at[crop_id, 'market_name'],
+            'min_location': location_names.get(low.at[crop_id, 'location_id']),
+            'max_price': _number(high_price),
+            'max_market': high.at[crop_id, 'market_name'],
+            'max_location': location_names.get(high.at[crop_id, 'location_id']),
+            'spread': _number(high_price - low_price),
+            'spread_pct': _number((high_price - low_price) / low_price * 100 if low_price else None)
+        })
+    return spreads
+
+
+def compute_market_analytics():
+    """Load the lookback window and compute every statistic"""
+    as_of, prices = load_prices()
+    if as_of is None or not len(prices):
+        return MarketAnalytics(as_of, [], [], None)
+    crop_names = dict(db.session.query(Crop.id, Crop.crop_name))
+    location_names = {location_id: f"{district}, {state}" for location_id, district, state in
+                      db.session.query(Location.id, Location.district, Location.state).filter(
+                          Location.id.in_(prices['location_id'].unique().tolist()))}
+    series, history = _series_stats(prices, as_of, crop_names, location_names)
+    return MarketAnalytics(as_of, series, _spreads(prices, as_of, crop_names, location_names), history)
+
+
+class MarketAnalyticsCache:
+    """Per-process cache of MarketAnalytics, recomputed when prices change"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature = None
+        self._analytics = None
+
+    def get(self):
+        signature = tuple(db.session.execute(select(
+            version_of(PRICES_VERSION), select(func.max(MarketPrice.id)).scalar_subquery())).one())
+        with self._lock:
+            hit = self._analytics is not None and signature == self._signature
+            record_cache('market_analytics', hit)
+            if not hit:
+                self._analytics = compute_market_analytics()
+                self._signature = signature
+            return self._analytics
+
+
+market_analytics = MarketAnalyticsCache()
+
+track(PRICES_VERSION, MarketPrice)
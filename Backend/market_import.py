@@ -0,0 +1,292 @@
+"""
+Bulk Market Price Import
+For Agriculture Advisory System
+
+Streams daily mandi price files (CSV or NDJSON, e.g. Agmarknet exports) into
+market_prices. Crop and location names are resolved to ids through
+dictionaries built once per run. Each chunk only looks up its distinct
+names, not every row. Rows are deduplicated on (crop, location, market,
+date, grade): within a chunk with pandas, and against rows already stored
+through the unique_market_price index with ON CONFLICT DO NOTHING. Each
+chunk is written with one executemany.
+
+Accepted columns (case-insensitive, Agmarknet names in brackets):
+    crop (commodity), location_id or state + district, market_name (market),
+    date (arrival_date), price_per_quintal (modal_price), quality_grade (grade),
+    market_type, demand_level, supply_level
+
+Usage:
+    python market_import.py mandi_prices.csv
+    python market_import.py --dedupe-existing   # one-off, before the unique index exists
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+
+from data_versions import mark_changed
+from flask_models import db, Crop, Location, MarketPrice
+from metrics import registry
+from weather_ingest import DEFAULT_CHUNK_SIZE, IngestStats, detect_format, read_chunks
+
+DEDUP_KEY = ('crop_id', 'location_id', 'market_name', 'date', 'quality_grade')
+INSERT_COLUMNS = DEDUP_KEY + ('price_per_quintal', 'market_type', 'demand_level', 'supply_level', 'created_at')
+
+COLUMN_ALIASES = {
+    'commodity': 'crop',
+    'crop_name': 'crop',
+    'market': 'market_name',
+    'arrival_date': 'date',
+    'price_date': 'date',
+    'modal_price': 'price_per_quintal',
+    'price': 'price_per_quintal',
+    'grade': 'quality_grade'
+}
+
+# Common mandi commodity names -> crop_name in the crops table (lowercase)
+CROP_ALIASES = {
+    'paddy': 'rice',
+    'paddy(dhan)(common)': 'rice',
+    'paddy(dhan)(basmati)': 'rice',
+    'bengal gram(gram)(whole)': 'chickpea',
+    'bengal gram': 'chickpea',
+    'gram': 'chickpea',
+    'soyabean': 'soybean',
+    'cotton(unginned)': 'cotton',
+    'kapas': 'cotton',
+    'maize(makka)': 'maize',
+    'wheat(atta)': 'wheat'
+}
+
+# Column -> (allowed values, default for missing)
+CATEGORICAL_COLUMNS = {
+    'quality_grade': (('A', 'B', 'C', 'FAQ'), 'FAQ'),
+    'market_type': (('wholesale', 'retail', 'government', 'online'), 'wholesale'),
+    'demand_level': (('low', 'medium', 'high'), 'medium'),
+    'supply_level': (('low', 'medium', 'high'), 'medium')
+}
+MAX_PRICE_PER_QUINTAL = 1000000
+
+MARKET_ROWS_IMPORTED = registry.counter(
+    'agri_market_import_rows_total', 'Mandi price rows by import result', ('result',))
+
+
+def _normalise(value):
+    return ' '.join(str(value).split()).lower()
+
+
+def build_lookups():
+    """Name -> id dictionaries for crops and (state, district) locations"""
+    crops = {}
+    for crop_id, name, scientific_name in db.session.query(Crop.id, Crop.crop_name, Crop.scientific_name):
+        crops[_normalise(name)] = crop_id
+        if scientific_name:
+            crops.setdefault(_normalise(scientific_name), crop_id)
+    for alias, name in CROP_ALIASES.items():
+        if name in crops:
+            crops.setdefault(alias, crops[name])
+
+    locations = {}
+    location_ids = set()
+    for location_id, state, district in db.session.query(Location.id, Location.state, Location.district).order_by(Location.id):
+        locations.setdefault(f'{_normalise(state)}|{_normalise(district)}', location_id)
+        location_ids.add(location_id)
+    return crops, locations, location_ids
+
+
+def _resolve(series, lookup):
+    """Map values through lookup, normalising each distinct value only once"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    resolved = np.array([lookup.get(_normalise(value), -1) for value in uniques] + [-1], dtype=np.int64)
+    return pd.Series(resolved[codes], index=series.index)
+
+
+def _parse_dates(raw):
+    """ISO dates, falling back to the dd/mm/yyyy format used by Agmarknet
+
+    A chunk covers few distinct days, so only the unique values are parsed.
+    """
+    codes, uniques = pd.factorize(raw, use_na_sentinel=True)
+    values = pd.Series(uniques, dtype=object)
+    parsed = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    retry = parsed.isna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], errors='coerce', format='%d/%m/%Y')
+    formatted = np.append(parsed.dt.strftime('%Y-%m-%d').to_numpy(dtype=object), None)
+    return pd.Series(formatted[codes], index=raw.index)
+
+
+def _market_names(raw):
+    """Stripped, length-limited market names, None where missing"""
+    codes, uniques = pd.factorize(raw, use_na_sentinel=True)
+    names = np.array([str(value).strip()[:100] for value in uniques] + [None], dtype=object)
+    return pd.Series(names[codes], index=raw.index)
+
+
+def validate_chunk(chunk, lookups, stats):
+    """Resolve names to ids and check values; return valid, chunk-deduplicated rows"""
+    crops, locations, location_ids = lookups
+    chunk = chunk.rename(columns=lambda name: '_'.join(str(name).strip().lower().split()))
+    chunk = chunk.rename(columns=lambda name: COLUMN_ALIASES.get(name, name))
+    missing = {'crop', 'market_name', 'date', 'price_per_quintal'} - set(chunk.columns)
+    if 'location_id' not in chunk.columns and not {'state', 'district'} <= set(chunk.columns):
+        missing.add('location_id or state/district')
+    if missing:
+        raise ValueError(f"Feed is missing required columns: {', '.join(sorted(missing))}")
+
+    frame = pd.DataFrame(index=chunk.index)
+    frame['crop_id'] = _resolve(chunk['crop'], crops)
+    if 'location_id' in chunk.columns:
+        ids = pd.to_numeric(chunk['location_id'], errors='coerce')
+        frame['location_id'] = ids.where(ids.isin(location_ids), -1).fillna(-1).astype(np.int64)
+    else:
+        frame['location_id'] = _resolve(chunk['state'].astype(str) + '|' + chunk['district'].astype(str), locations)
+    frame['market_name'] = _market_names(chunk['market_name'])
+    frame['date'] = _parse_dates(chunk['date'])
+    frame['price_per_quintal'] = pd.to_numeric(chunk['price_per_quintal'], errors='coerce').round(2)
+
+    keep = pd.Series(True, index=chunk.index)
+    checks = (
+        ('unknown_crop', frame['crop_id'] < 0),
+        ('unknown_location', frame['location_id'] < 0),
+        ('missing_market', frame['market_name'].isna() | (frame['market_name'] == '')),
+        ('invalid_date', frame['date'].isna()),
+        ('invalid_price', ~frame['price_per_quintal'].between(0, MAX_PRICE_PER_QUINTAL, inclusive='neither'))
+    )
+    for reason, failed in checks:
+        stats.reject(reason, chunk[keep & failed])
+        keep &= ~failed
+
+    for column, (allowed, default) in CATEGORICAL_COLUMNS.items():
+        if column not in chunk.columns:
+            frame[column] = default
+            continue
+        values = chunk[column].where(chunk[column].notna(), default).astype(str).str.strip()
+        if column != 'quality_grade':
+            values = values.str.lower()
+        invalid = keep & ~values.isin(allowed)
+        stats.reject(f'invalid_{column}', chunk[invalid])
+        keep &= ~invalid
+        frame[column] = values
+
+    valid = frame[keep]
+    deduplicated = valid.drop_duplicates(list(DEDUP_KEY), keep='last')
+    stats.rows_duplicate += len(valid) - len(deduplicated)
+    # Inserting in index order keeps unique_market_price page writes local
+    return deduplicated.sort_values(list(DEDUP_KEY), kind='stable')
+
+
+def insert_sql(dialect_name, paramstyle):
+    """Batched insert that silently skips rows already stored under the dedup key"""
+    placeholders = ', '.join(['?' if paramstyle == 'qmark' else '%s'] * len(INSERT_COLUMNS))
+    columns = ', '.join(INSERT_COLUMNS)
+    table = MarketPrice.__tablename__
+    if dialect_name == 'sqlite' and sqlite3.sqlite_version_info < (3, 24, 0):
+        return f"INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})"
+    return (f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT ({', '.join(DEDUP_KEY)}) DO NOTHING")
+
+
+def ensure_dedup_index():
+    """Create unique_market_price on databases created before it was added to the model"""
+    key = ', '.join(DEDUP_KEY)
+    db.session.connection().exec_driver_sql(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS unique_market_price ON {MarketPrice.__tablename__} ({key})")
+    db.session.commit()
+
+
+def remove_existing_duplicates():
+    """Delete stored duplicates under the dedup key, keeping the oldest row of each"""
+    key = ', '.join(DEDUP_KEY)
+    table = MarketPrice.__tablename__
+    result = db.session.connection().exec_driver_sql(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {key})")
+    mark_changed(db.session, table)
+    db.session.commit()
+    return result.rowcount
+
+
+def print_progress(stats):
+    print(f"💰 {stats.rows_read:,} rows read, {stats.rows_written:,} inserted, {stats.rows_duplicate:,} duplicate, "
+          f"{stats.rows_rejected:,} rejected ({stats.rows_per_sec:,.0f} rows/s)")
+
+
+def import_market_prices(source, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=print_progress, on_chunk=None,
+                         compression='infer'):
+    """Stream a mandi price feed into market_prices and return an IngestStats
+
+    Each chunk commits on its own; re-importing a file inserts nothing new.
+    on_chunk(frame) is called with each committed frame of valid rows.
+    """
+    fmt = fmt or detect_format(source if isinstance(source, str) else getattr(source, 'name', ''))
+    try:
+        ensure_dedup_index()
+    except Exception as e:
+        db.session.rollback()
+        raise ValueError(f"Could not create unique_market_price ({str(e)}); run with --dedupe-existing first")
+    stats = IngestStats()
+    lookups = build_lookups()
+    connection = db.session.connection()
+    sql = insert_sql(connection.dialect.name, connection.dialect.paramstyle)
+    created_at = datetime.utcnow().isoformat(' ')
+
+    for chunk in read_chunks(source, fmt, chunk_size, compression):
+        stats.rows_read += len(chunk)
+        stats.chunks += 1
+        valid = validate_chunk(chunk, lookups, stats)
+        if len(valid):
+            rows = list(zip(*[valid[column].tolist() for column in INSERT_COLUMNS[:-1]], [created_at] * len(valid)))
+            try:
+                result = db.session.connection().exec_driver_sql(sql, rows)
+                mark_changed(db.session, MarketPrice.__tablename__)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            inserted = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+            stats.rows_written += inserted
+            stats.rows_duplicate += len(rows) - inserted
+            if on_chunk is not None:
+                on_chunk(valid)
+        if progress is not None:
+            progress(stats)
+
+    MARKET_ROWS_IMPORTED.inc(stats.rows_written, result='inserted')
+    MARKET_ROWS_IMPORTED.inc(stats.rows_duplicate, result='duplicate')
+    MARKET_ROWS_IMPORTED.inc(stats.rows_rejected, result='rejected')
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a mandi price feed into market_prices')
+    parser.add_argument('feed', nargs='?', help='CSV or NDJSON file (optionally .gz)')
+    parser.add_argument('--format', choices=('csv', 'ndjson'))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--dedupe-existing', action='store_true',
+                        help='Delete stored duplicates and create the unique index, then exit unless a feed is given')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        if args.dedupe_existing:
+            removed = remove_existing_duplicates()
+            ensure_dedup_index()
+            print(f"✅ Removed {removed:,} duplicate market prices; unique_market_price index in place")
+        if not args.feed:
+            return
+        stats = import_market_prices(args.feed, args.format, args.chunk_size)
+
+    summary = stats.to_dict()
+    print(f"✅ Imported {summary['rows_written']:,} rows in {summary['seconds']}s ({summary['rows_per_sec']:,.0f} rows/s), "
+          f"{summary['rows_duplicate']:,} duplicate, {summary['rows_rejected']:,} rejected")
+    for reason, count in sorted(summary['reject_reasons'].items()):
+        print(f"   • {reason}: {count:,}")
+
+
+if __name__ == '__main__':
+    main()
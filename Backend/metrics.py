@@ -0,0 +1,278 @@
+"""
+Request and Inference Metrics
+For Agriculture Advisory System
+
+Minimal Prometheus-compatible counters, gauges and histograms with no
+external dependency. Each observation costs one lock and one bisect, which
+is cheap enough to leave on in production. Metrics are per process. Under
+gunicorn each worker exposes its own /metrics, and the scraper aggregates
+them by instance.
+"""
+
+from bisect import bisect_left
+from functools import wraps
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self.samples().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    metric_type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed durations"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            return {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total, count) in sorted(self.samples().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class _Timer:
+    """Context manager observing elapsed wall time into a histogram"""
+
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """Register a callable run just before rendering, to refresh derived gauges"""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    'agri_http_request_duration_seconds', 'Request duration by Flask endpoint',
+    ('endpoint', 'method', 'status'))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    'agri_http_requests_in_flight', 'Requests currently being served by endpoint', ('endpoint',))
+INFERENCE_DURATION = registry.histogram(
+    'agri_inference_duration_seconds', 'Duration of prediction helpers', ('function',))
+EXTERNAL_CALL_DURATION = registry.histogram(
+    'agri_external_call_duration_seconds', 'Duration of VoiceAssistant calls to external services',
+    ('service', 'operation'), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+TEMPLATE_RENDER_DURATION = registry.histogram(
+    'agri_template_render_duration_seconds', 'Jinja template rendering time', ('template',))
+CACHE_REQUESTS = registry.counter(
+    'agri_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+CACHE_HIT_RATIO = registry.gauge(
+    'agri_cache_hit_ratio', 'Fraction of cache lookups served from cache', ('cache',))
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def _refresh_cache_hit_ratio():
+    totals = {}
+    for (cache, result), count in CACHE_REQUESTS.samples().items():
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result == 'hit' else 0), lookups + count)
+    for cache, (hits, lookups) in totals.items():
+        CACHE_HIT_RATIO.set(hits / lookups if lookups else 0.0, cache=cache)
+
+
+registry.add_collector(_refresh_cache_hit_ratio)
+
+
+def timed(histogram, **labels):
+    """Decorator observing each call's duration into histogram"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Install per-request timing hooks and the /metrics endpoint on a Flask app"""
+    from flask import Response, g, request, before_render_template, template_rendered
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_endpoint = request.endpoint or 'unmatched'
+        g._metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc(endpoint=g._metrics_endpoint)
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _observe_request(exc):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return
+        endpoint = g.pop('_metrics_endpoint', 'unmatched')
+        status = g.pop('_metrics_status', 500 if exc is not None else 200)
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_DURATION.observe(time.perf_counter() - started,
+                                 endpoint=endpoint, method=request.method, status=status)
+
+    def _start_render_timer(sender, template, context, **extra):
+        g._metrics_render_started = time.perf_counter()
+
+    def _observe_render(sender, template, context, **extra):
+        started = g.pop('_metrics_render_started', None)
+        if started is not None:
+            TEMPLATE_RENDER_DURATION.observe(time.perf_counter() - started, template=template.name or 'string')
+
+    before_render_template.connect(_start_render_timer, app, weak=False)
+    template_rendered.connect(_observe_render, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
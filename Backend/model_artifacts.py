@@ -0,0 +1,281 @@
+"""
+Memory-Mappable Model Artifacts
+For Agriculture Advisory System
+
+Stores trained random forests and their scalers as raw NumPy buffers plus a
+small JSON manifest, instead of pickled sklearn objects. Workers open the
+buffers with np.load(mmap_mode='r'), so every process shares the same pages
+through the OS page cache and a cold load takes milliseconds.
+
+Layout on disk:
+    models/<name>/LATEST                 -> name of the current version directory
+    models/<name>/<model_version>/manifest.json
+    models/<name>/<model_version>/*.npy
+"""
+
+import numpy as np
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+LATEST_FILE = 'LATEST'
+
+# Flat node arrays shared by every tree of the forest
+FOREST_ARRAYS = ['children_left', 'children_right', 'feature', 'threshold', 'leaf_proba', 'tree_offsets']
+SCALER_ARRAYS = ['scaler_mean', 'scaler_scale']
+
+
+class ArtifactError(Exception):
+    """Raised when an artifact is missing, incomplete or fails its checksum"""
+
+
+def _file_checksum(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _flatten_forest(forest):
+    """Concatenate the node arrays of every tree, rebasing child indices"""
+    children_left, children_right, features, thresholds, leaf_proba = [], [], [], [], []
+    tree_offsets = []
+    offset = 0
+
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        left = tree.children_left.astype(np.int64)
+        right = tree.children_right.astype(np.int64)
+        is_leaf = left == -1
+
+        children_left.append(np.where(is_leaf, -1, left + offset))
+        children_right.append(np.where(is_leaf, -1, right + offset))
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+
+        # Normalise node class counts to probabilities, as predict_proba does
+        values = tree.value[:, 0, :].astype(np.float64)
+        totals = values.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        leaf_proba.append(values / totals)
+
+        tree_offsets.append(offset)
+        offset += n_nodes
+
+    return {
+        'children_left': np.concatenate(children_left).astype(np.int32),
+        'children_right': np.concatenate(children_right).astype(np.int32),
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'leaf_proba': np.concatenate(leaf_proba).astype(np.float64),
+        'tree_offsets': np.asarray(tree_offsets, dtype=np.int32)
+    }
+
+
+def save_forest_artifact(artifact_root, model, scaler, label_encoder, feature_names, model_version=None, metadata=None):
+    """Write a fitted RandomForestClassifier + StandardScaler as a versioned artifact
+
+    Returns the path of the new version directory. Buffers are written to a
+    temporary directory that is renamed into place, and an existing version
+    is never overwritten, since running workers may have its buffers mapped.
+    The LATEST pointer is replaced atomically once the version is in place.
+    """
+    model_version = model_version or datetime.now().strftime('%Y%m%d%H%M%S')
+    version_dir = os.path.join(artifact_root, model_version)
+    if os.path.exists(version_dir):
+        raise ArtifactError(f"Artifact version already exists: {version_dir}")
+    os.makedirs(artifact_root, exist_ok=True)
+    staging_dir = os.path.join(artifact_root, f'.{model_version}.tmp-{os.getpid()}')
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    try:
+        _write_forest_files(staging_dir, model, scaler, label_encoder, feature_names, model_version, metadata)
+        # Fails rather than replacing a version another process finished first
+        os.rename(staging_dir, version_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    latest_tmp = os.path.join(artifact_root, LATEST_FILE + '.tmp')
+    with open(latest_tmp, 'w') as f:
+        f.write(model_version)
+    os.replace(latest_tmp, os.path.join(artifact_root, LATEST_FILE))
+
+    return version_dir
+
+
+def _write_forest_files(version_dir, model, scaler, label_encoder, feature_names, model_version, metadata):
+    """Write the buffers and manifest of one version into version_dir"""
+    arrays = _flatten_forest(model)
+    arrays['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+    arrays['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    files = {}
+    for name, array in arrays.items():
+        path = os.path.join(version_dir, f'{name}.npy')
+        np.save(path, np.ascontiguousarray(array))
+        files[name] = {
+            'file': f'{name}.npy',
+            'dtype': str(array.dtype),
+            'shape': list(array.shape),
+            'sha256': _file_checksum(path)
+        }
+
+    manifest = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'model_type': 'random_forest_classifier',
+        'model_version': model_version,
+        'feature_order': list(feature_names),
+        'classes': [str(c) for c in label_encoder.classes_],
+        'n_trees': len(model.estimators_),
+        'created_at': datetime.now().isoformat(),
+        'files': files,
+        'metadata': metadata or {}
+    }
+    # The manifest checksum covers the per-file checksums, so one value identifies the artifact
+    manifest['checksum'] = hashlib.sha256(
+        json.dumps(files, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def latest_artifact_version(artifact_root):
+    """Return the version named by the LATEST pointer, or None if there is none"""
+    latest_path = os.path.join(artifact_root, LATEST_FILE)
+    if not os.path.exists(latest_path):
+        return None
+    with open(latest_path) as f:
+        return f.read().strip() or None
+
+
+def verify_artifact(version_dir, manifest):
+    """Recompute every buffer checksum and compare it with the manifest"""
+    for name, entry in manifest['files'].items():
+        path = os.path.join(version_dir, entry['file'])
+        if not os.path.exists(path):
+            raise ArtifactError(f"Missing artifact buffer: {path}")
+        if _file_checksum(path) != entry['sha256']:
+            raise ArtifactError(f"Checksum mismatch for {path}")
+
+
+class ForestArtifact:
+    """Read-only random forest backed by memory-mapped NumPy buffers"""
+
+    def __init__(self, version_dir, manifest, arrays):
+        self.version_dir = version_dir
+        self.manifest = manifest
+        self.model_version = manifest['model_version']
+        self.feature_order = manifest['feature_order']
+        self.classes = np.asarray(manifest['classes'])
+        self.checksum = manifest['checksum']
+
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.leaf_proba = arrays['leaf_proba']
+        self.tree_offsets = arrays['tree_offsets']
+        self.scaler_mean = arrays['scaler_mean']
+        self.scaler_scale = arrays['scaler_scale']
+
+    def transform(self, input_data):
+        """Apply the stored StandardScaler parameters"""
+        return (np.asarray(input_data, dtype=np.float64) - self.scaler_mean) / self.scaler_scale
+
+    def predict_proba_scaled(self, input_scaled):
+        """Average leaf probabilities over all trees for already-scaled rows"""
+        input_scaled = np.atleast_2d(input_scaled)
+        n_samples = input_scaled.shape[0]
+        rows = np.arange(n_samples)[:, None]
+
+        # Walk every tree for every sample at once, one depth level per iteration
+        nodes = np.broadcast_to(self.tree_offsets, (n_samples, len(self.tree_offsets))).copy()
+        while True:
+            left = self.children_left[nodes]
+            active = left != -1
+            if not active.any():
+                break
+            go_left = input_scaled[rows, self.feature[nodes]] <= self.threshold[nodes]
+            next_nodes = np.where(go_left, left, self.children_right[nodes])
+            nodes = np.where(active, next_nodes, nodes)
+
+        return self.leaf_proba[nodes].mean(axis=1)
+
+    def predict_proba(self, input_data):
+        """Scale raw feature rows and return class probabilities"""
+        return self.predict_proba_scaled(self.transform(input_data))
+
+
+def load_forest_artifact(artifact_root, model_version=None, verify=False):
+    """Memory-map a forest artifact; defaults to the version named by LATEST
+
+    Checksums are only recomputed when verify=True, because that reads every
+    page of every buffer and defeats the lazy mapping.
+    """
+    model_version = model_version or latest_artifact_version(artifact_root)
+    if not model_version:
+        raise ArtifactError(f"No artifact version found under {artifact_root}")
+
+    version_dir = os.path.join(artifact_root, model_version)
+    manifest_path = os.path.join(version_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise ArtifactError(f"Missing manifest: {manifest_path}")
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ArtifactError(f"Unsupported artifact format: {manifest.get('format_version')}")
+
+    if verify:
+        verify_artifact(version_dir, manifest)
+
+    arrays = {}
+    for name in FOREST_ARRAYS + SCALER_ARRAYS:
+        entry = manifest['files'].get(name)
+        if entry is None:
+            raise ArtifactError(f"Manifest is missing buffer '{name}'")
+        arrays[name] = np.load(os.path.join(version_dir, entry['file']), mmap_mode='r')
+
+    return ForestArtifact(version_dir, manifest, arrays)
+
+
+class PickledModelBundle:
+    """Adapter giving legacy pickled {'model', 'scaler', 'label_encoder'} dicts the artifact interface"""
+
+    def __init__(self, model_data, model_version='pickle'):
+        self.model = model_data['model']
+        self.scaler = model_data['scaler']
+        self.label_encoder = model_data['label_encoder']
+        self.model_version = model_version
+        self.classes = np.asarray(self.label_encoder.classes_)
+        self.feature_order = None
+
+    def transform(self, input_data):
+        return self.scaler.transform(input_data)
+
+    def predict_proba_scaled(self, input_scaled):
+        return self.model.predict_proba(input_scaled)
+
+    def predict_proba(self, input_data):
+        return self.predict_proba_scaled(self.transform(input_data))
+
+
+def load_model_bundle(artifact_dir, pickle_path):
+    """Load a model from its memory-mapped artifact, falling back to the legacy pickle"""
+    if latest_artifact_version(artifact_dir):
+        return load_forest_artifact(artifact_dir)
+    if os.path.exists(pickle_path):
+        with open(pickle_path, 'rb') as f:
+            return PickledModelBundle(pickle.load(f))
+    return None
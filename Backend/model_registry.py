@@ -0,0 +1,153 @@
+"""
+Model Registry with Hot Reload
+For Agriculture Advisory System
+
+Holds the current version of every model and swaps in new artifacts written
+by train_models.py without restarting the app. A background watcher polls
+each artifact's LATEST pointer. A new version is loaded off the request path,
+checksum-verified and smoke-tested, and only then replaces the old one with
+a single reference assignment.
+
+Models installed with set(..., pinned=True), such as the RemoteModel proxies
+of the model server, are never replaced here; the server reloads its own.
+
+Callers take one snapshot per request (model = registry.get('crop')) and use
+it for scaling, prediction and version recording. Requests already in flight
+keep the old object and finish on the old version.
+"""
+
+import numpy as np
+import os
+import threading
+import time
+
+from model_artifacts import latest_artifact_version, load_forest_artifact, load_model_bundle
+
+# name -> (artifact dir, legacy pickle, smoke-test input row) relative to the models directory
+MODEL_SOURCES = {
+    'crop': ('crop_recommendation', 'crop_recommendation_model.pkl',
+             [50.0, 40.0, 40.0, 25.0, 70.0, 6.5, 100.0]),
+    'fertilizer': ('fertilizer_recommendation', 'fertilizer_recommendation_model.pkl',
+                   [25.0, 60.0, 40.0, 2.0, 1.0, 20.0, 20.0, 20.0])
+}
+
+
+class ModelValidationError(Exception):
+    """Raised when a candidate model fails its smoke prediction"""
+
+
+class ModelRegistry:
+    """Thread-safe holder of the live model for each name"""
+
+    def __init__(self, models_dir='models', poll_interval=30.0):
+        self.models_dir = models_dir
+        self.poll_interval = poll_interval
+        self._models = {}
+        self._lock = threading.Lock()
+        self._reloading = set()
+        self._rejected = {}
+        self._pinned = set()
+        self._watcher = None
+        self.reload_count = 0
+
+    def _paths(self, name):
+        artifact_dir, pickle_file, _ = MODEL_SOURCES[name]
+        return os.path.join(self.models_dir, artifact_dir), os.path.join(self.models_dir, pickle_file)
+
+    def get(self, name):
+        """Return the live model for name (or None); take one snapshot per request"""
+        return self._models.get(name)
+
+    def set(self, name, model, pinned=False):
+        """Install a model directly; pinned models (e.g. a RemoteModel proxy) are left alone by reloads"""
+        with self._lock:
+            self._models[name] = model
+            if pinned:
+                self._pinned.add(name)
+            else:
+                self._pinned.discard(name)
+
+    def pinned(self):
+        return sorted(self._pinned)
+
+    def versions(self):
+        return {name: getattr(model, 'model_version', None) for name, model in self._models.items()}
+
+    def smoke_test(self, name, model):
+        """Run one prediction and check the probabilities are well formed"""
+        smoke_input = np.array([MODEL_SOURCES[name][2]])
+        probabilities = np.asarray(model.predict_proba(smoke_input))
+        if probabilities.shape != (1, len(model.classes)):
+            raise ModelValidationError(f"{name}: unexpected output shape {probabilities.shape}")
+        if not np.all(np.isfinite(probabilities)) or abs(float(probabilities.sum()) - 1.0) > 1e-6:
+            raise ModelValidationError(f"{name}: smoke prediction is not a probability distribution")
+
+    def load_all(self):
+        """Load every known model synchronously (used during warmup)"""
+        for name in MODEL_SOURCES:
+            artifact_dir, pickle_path = self._paths(name)
+            model = load_model_bundle(artifact_dir, pickle_path)
+            if model is not None:
+                self.smoke_test(name, model)
+                self.set(name, model)
+        return self.versions()
+
+    def check_for_updates(self, background=True):
+        """Start a reload for every model whose LATEST pointer names a new version"""
+        started = []
+        for name in MODEL_SOURCES:
+            if name in self._pinned:
+                continue
+            artifact_dir, _ = self._paths(name)
+            latest = latest_artifact_version(artifact_dir)
+            current = self.get(name)
+            if not latest or latest == getattr(current, 'model_version', None):
+                continue
+            if latest == self._rejected.get(name):
+                continue
+            with self._lock:
+                if name in self._reloading:
+                    continue
+                self._reloading.add(name)
+            started.append((name, latest))
+            if background:
+                threading.Thread(target=self._reload, args=(name, latest), daemon=True).start()
+            else:
+                self._reload(name, latest)
+        return started
+
+    def _reload(self, name, version):
+        """Load, verify and smoke-test a version, then swap it in atomically"""
+        try:
+            artifact_dir, _ = self._paths(name)
+            candidate = load_forest_artifact(artifact_dir, version, verify=True)
+            self.smoke_test(name, candidate)
+            with self._lock:
+                if name in self._pinned:
+                    return
+                previous = getattr(self._models.get(name), 'model_version', None)
+                self._models[name] = candidate
+                self.reload_count += 1
+            print(f"✅ Reloaded {name} model: {previous} -> {version}")
+        except Exception as e:
+            self._rejected[name] = version
+            print(f"⚠️ Rejected {name} model version {version}: {str(e)}")
+        finally:
+            with self._lock:
+                self._reloading.discard(name)
+
+    def start_watcher(self):
+        """Poll the models directory for new versions in a daemon thread"""
+        if self._watcher is not None or not self.poll_interval:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self.check_for_updates(background=False)
+                except Exception as e:
+                    print(f"⚠️ Model watcher error: {str(e)}")
+
+        self._watcher = threading.Thread(target=watch, daemon=True)
+        self._watcher.start()
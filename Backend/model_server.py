@@ -0,0 +1,451 @@
+"""
+Local Model Server
+For Agriculture Advisory System
+
+An optional sidecar process that loads each model once and serves every
+gunicorn worker over a Unix domain socket. Concurrent requests from all
+workers are merged into micro-batches, so one predict_proba call answers
+many requests.
+
+Wire protocol (all integers big-endian):
+    frame    = u32 body_length, body
+    request  = u32 request_id, u8 op, u8 model_code, u16 n_rows, u16 n_cols, float64[n_rows * n_cols]
+    response = u32 request_id, u8 status, u16 n_rows, u16 n_cols, payload
+For OP_PREDICT the payload is u32 labels_length, UTF-8 JSON labels
+({model_version, classes} of the model that scored the batch), then the
+float64 probabilities. It is UTF-8 JSON for OP_DESCRIBE and for any response
+whose status is not STATUS_OK.
+
+n_rows is a u16, so the client splits larger inputs into requests of at
+most MAX_REQUEST_ROWS rows.
+
+Usage:
+    python model_server.py --socket /tmp/agri-models.sock --models-dir models
+    MODEL_SERVER_SOCKET=/tmp/agri-models.sock gunicorn app:app
+"""
+
+import numpy as np
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from model_registry import ModelRegistry
+
+REQUEST_HEADER = struct.Struct('!IBBHH')
+RESPONSE_HEADER = struct.Struct('!IBHH')
+FRAME_LENGTH = struct.Struct('!I')
+LABELS_LENGTH = struct.Struct('!I')
+MAX_REQUEST_ROWS = 0xFFFF
+
+OP_PREDICT = 1
+OP_DESCRIBE = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+MODEL_CODES = {'crop': 1, 'fertilizer': 2}
+MODEL_NAMES = {code: name for name, code in MODEL_CODES.items()}
+
+
+class ModelServerError(Exception):
+    """Raised by the client when the model server is unreachable or reports an error"""
+
+
+def _recv_exact(sock, size):
+    """Read exactly size bytes from a socket, or raise on a closed connection"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            raise ConnectionError("Model server connection closed")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send_frame(sock, body):
+    sock.sendall(FRAME_LENGTH.pack(len(body)) + body)
+
+
+def _recv_frame(sock):
+    (length,) = FRAME_LENGTH.unpack(_recv_exact(sock, FRAME_LENGTH.size))
+    return _recv_exact(sock, length)
+
+
+class _PendingRequest:
+    """One caller's rows waiting in a micro-batch"""
+
+    __slots__ = ('rows', 'event', 'model', 'result', 'error')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.event = threading.Event()
+        self.model = None
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Merges concurrent predict calls for one model into batched predict_proba calls
+
+    get_model is called once per batch, so a hot-reloaded model takes effect
+    at the next batch boundary.
+    """
+
+    def __init__(self, get_model, max_batch_rows=256, max_wait_ms=2.0):
+        self.get_model = get_model
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def predict_proba(self, rows):
+        """Queue rows for the next batch; blocks until ready and returns (model, probabilities)"""
+        pending = _PendingRequest(rows)
+        self.queue.put(pending)
+        pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.model, pending.result
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window closes"""
+        batch = [self.queue.get()]
+        n_rows = len(batch[0].rows)
+        deadline = time.monotonic() + self.max_wait
+        while n_rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            n_rows += len(pending.rows)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                model = self.get_model()
+                probabilities = model.predict_proba(np.vstack([p.rows for p in batch]))
+                start = 0
+                for pending in batch:
+                    end = start + len(pending.rows)
+                    pending.model = model
+                    pending.result = np.asarray(probabilities[start:end], dtype=np.float64)
+                    start = end
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            self.batches += 1
+            self.rows += sum(len(p.rows) for p in batch)
+            for pending in batch:
+                pending.event.set()
+
+
+class _ModelRequestHandler(socketserver.BaseRequestHandler):
+    """Serves framed requests on one worker connection until it closes"""
+
+    def handle(self):
+        while True:
+            try:
+                body = _recv_frame(self.request)
+            except ConnectionError:
+                return
+            _send_frame(self.request, self.server.dispatch(body))
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding one copy of each model in a ModelRegistry"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, registry, max_batch_rows=256, max_wait_ms=2.0):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.registry = registry
+        self.batchers = {
+            name: MicroBatcher(lambda name=name: registry.get(name),
+                               max_batch_rows=max_batch_rows, max_wait_ms=max_wait_ms)
+            for name in MODEL_CODES
+        }
+        super().__init__(socket_path, _ModelRequestHandler)
+
+    def dispatch(self, body):
+        """Decode one request body and return the encoded response body"""
+        request_id, op, model_code, n_rows, n_cols = REQUEST_HEADER.unpack_from(body)
+        try:
+            name = MODEL_NAMES.get(model_code)
+            model = self.registry.get(name) if name else None
+            if model is None:
+                raise ModelServerError(f"Model not loaded: {model_code}")
+
+            if op == OP_DESCRIBE:
+                payload = json.dumps({
+                    'model': name,
+                    'model_version': model.model_version,
+                    'classes': [str(c) for c in model.classes],
+                    'feature_order': model.feature_order,
+                    'batches': self.batchers[name].batches,
+                    'rows': self.batchers[name].rows
+                }).encode('utf-8')
+                return RESPONSE_HEADER.pack(request_id, STATUS_OK, 0, 0) + payload
+
+            if op == OP_PREDICT:
+                feature_order = model.feature_order
+                if feature_order and n_cols != len(feature_order):
+                    raise ModelServerError(f"Expected {len(feature_order)} features, got {n_cols}")
+                rows = np.frombuffer(body, dtype='>f8', offset=REQUEST_HEADER.size,
+                                     count=n_rows * n_cols).reshape(n_rows, n_cols).astype(np.float64)
+                # Labels of the model that actually scored the batch, which a reload may have replaced
+                scored_by, probabilities = self.batchers[name].predict_proba(rows)
+                labels = json.dumps({'model_version': scored_by.model_version,
+                                     'classes': [str(c) for c in scored_by.classes]}).encode('utf-8')
+                out_rows, out_cols = probabilities.shape
+                return (RESPONSE_HEADER.pack(request_id, STATUS_OK, out_rows, out_cols)
+                        + LABELS_LENGTH.pack(len(labels)) + labels + probabilities.astype('>f8').tobytes())
+
+            raise ModelServerError(f"Unknown op: {op}")
+
+        except Exception as e:
+            message = json.dumps({'error': str(e)}).encode('utf-8')
+            return RESPONSE_HEADER.pack(request_id, STATUS_ERROR, 0, 0) + message
+
+
+def load_server_models(models_dir='models', poll_interval=0):
+    """Build a registry holding every model found under models_dir"""
+    registry = ModelRegistry(models_dir, poll_interval=poll_interval)
+    registry.load_all()
+    registry.start_watcher()
+    return registry
+
+
+class ModelServerClient:
+    """Client for the model server; keeps one persistent connection per thread"""
+
+    def __init__(self, socket_path, timeout=2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._request_ids = itertools.count(1)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _call(self, op, model_name, rows=None):
+        if model_name not in MODEL_CODES:
+            raise ModelServerError(f"Unknown model: {model_name}")
+        request_id = next(self._request_ids) & 0xFFFFFFFF
+        if rows is None:
+            body = REQUEST_HEADER.pack(request_id, op, MODEL_CODES[model_name], 0, 0)
+        else:
+            rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+            body = (REQUEST_HEADER.pack(request_id, op, MODEL_CODES[model_name], rows.shape[0], rows.shape[1])
+                    + rows.astype('>f8').tobytes())
+        try:
+            conn = self._connection()
+            _send_frame(conn, body)
+            response = _recv_frame(conn)
+        except (OSError, ConnectionError) as e:
+            self.close()
+            raise ModelServerError(f"Model server unavailable: {str(e)}")
+
+        response_id, status, n_rows, n_cols = RESPONSE_HEADER.unpack_from(response)
+        payload = response[RESPONSE_HEADER.size:]
+        if response_id != request_id:
+            self.close()
+            raise ModelServerError("Model server response out of order")
+        if status != STATUS_OK:
+            raise ModelServerError(json.loads(payload.decode('utf-8')).get('error', 'Unknown error'))
+        return n_rows, n_cols, payload
+
+    def _predict_request(self, model_name, rows):
+        n_rows, n_cols, payload = self._call(OP_PREDICT, model_name, rows)
+        (labels_length,) = LABELS_LENGTH.unpack_from(payload)
+        labels = json.loads(payload[LABELS_LENGTH.size:LABELS_LENGTH.size + labels_length].decode('utf-8'))
+        probabilities = np.frombuffer(payload, dtype='>f8', offset=LABELS_LENGTH.size + labels_length)
+        return probabilities.reshape(n_rows, n_cols).astype(np.float64), labels
+
+    def predict(self, model_name, rows, attempts=2):
+        """(probabilities, {model_version, classes}) of the model version that scored every row
+
+        Inputs over MAX_REQUEST_ROWS rows are sent as several requests; if a
+        reload lands between them, the whole input is scored again.
+        """
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        if rows.shape[1] > 0xFFFF:
+            raise ModelServerError(f"Too many features: {rows.shape[1]}")
+        for _ in range(attempts):
+            parts = [self._predict_request(model_name, rows[start:start + MAX_REQUEST_ROWS])
+                     for start in range(0, max(len(rows), 1), MAX_REQUEST_ROWS)]
+            labels = parts[0][1]
+            if all(part_labels == labels for _, part_labels in parts):
+                return np.vstack([probabilities for probabilities, _ in parts]), labels
+        raise ModelServerError("Model version changed while scoring; retry")
+
+    def predict_proba(self, model_name, rows):
+        return self.predict(model_name, rows)[0]
+
+    def describe(self, model_name):
+        _, _, payload = self._call(OP_DESCRIBE, model_name)
+        return json.loads(payload.decode('utf-8'))
+
+
+class RemoteModel:
+    """Model proxy with the same predict_proba/classes interface as a local artifact
+
+    classes and model_version read right after predict_proba (within
+    describe_ttl, in the same thread) are those of the model that produced
+    the probabilities, so a reload in the server between the two calls
+    cannot mislabel them.
+
+    If the server cannot be reached and a fallback_loader is given, the model
+    is loaded in-process and used until the next retry of the server, after
+    a backoff that doubles from retry_seconds up to max_retry_seconds. Once
+    the server answers again the in-process copy is dropped.
+    """
+
+    def __init__(self, client, model_name, fallback_loader=None, describe_ttl=5.0,
+                 retry_seconds=1.0, max_retry_seconds=60.0):
+        self.client = client
+        self.model_name = model_name
+        self.fallback_loader = fallback_loader
+        self.describe_ttl = describe_ttl
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._description = None
+        self._described_at = 0.0
+        self._fallback = None
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._last_labels = threading.local()
+
+    def _fallback_active(self):
+        """The in-process model while the server is backing off, else None"""
+        if self._fallback is not None and time.monotonic() < self._retry_at:
+            return self._fallback
+        return None
+
+    def _local_model(self, error):
+        with self._lock:
+            self._backoff = min(max(self._backoff * 2, self.retry_seconds), self.max_retry_seconds)
+            self._retry_at = time.monotonic() + self._backoff
+            if self._fallback is None:
+                if self.fallback_loader is None:
+                    raise error
+                print(f"⚠️ {str(error)}; using in-process {self.model_name} model for {self._backoff:g}s")
+                self._fallback = self.fallback_loader()
+                if self._fallback is None:
+                    raise error
+            return self._fallback
+
+    def _server_answered(self):
+        if self._fallback is not None or self._backoff:
+            with self._lock:
+                if self._fallback is not None:
+                    print(f"✅ Model server is back; dropping in-process {self.model_name} model")
+                self._fallback = None
+                self._backoff = 0.0
+
+    def _describe(self):
+        # Re-describe periodically so a hot reload in the server shows up in model_version
+        if self._description is None or time.monotonic() - self._described_at > self.describe_ttl:
+            self._description = self.client.describe(self.model_name)
+            self._described_at = time.monotonic()
+        return self._description
+
+    def _attribute(self, key):
+        labels, labelled_at = getattr(self._last_labels, 'value', (None, 0.0))
+        if labels is not None and key in labels and time.monotonic() - labelled_at <= self.describe_ttl:
+            return labels[key]
+        fallback = self._fallback_active()
+        if fallback is not None:
+            return getattr(fallback, key)
+        try:
+            return self._describe()[key]
+        except ModelServerError as e:
+            return getattr(self._local_model(e), key)
+
+    @property
+    def classes(self):
+        return np.asarray(self._attribute('classes'))
+
+    @property
+    def model_version(self):
+        return self._attribute('model_version')
+
+    @property
+    def feature_order(self):
+        return self._attribute('feature_order')
+
+    def predict_proba(self, input_data):
+        model = self._fallback_active()
+        if model is None:
+            try:
+                probabilities, labels = self.client.predict(self.model_name, input_data)
+                self._server_answered()
+                self._last_labels.value = (labels, time.monotonic())
+                return probabilities
+            except ModelServerError as e:
+                model = self._local_model(e)
+        self._last_labels.value = ({'model_version': model.model_version, 'classes': list(model.classes)},
+                                   time.monotonic())
+        return model.predict_proba(input_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve ML models to web workers over a Unix socket')
+    parser.add_argument('--socket', default=os.environ.get('MODEL_SERVER_SOCKET', '/tmp/agri-models.sock'))
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--max-batch-rows', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--reload-interval', type=float, default=30.0,
+                        help='Seconds between checks for new model versions (0 disables hot reload)')
+    args = parser.parse_args()
+
+    registry = load_server_models(args.models_dir, poll_interval=args.reload_interval)
+    versions = registry.versions()
+    if not versions:
+        print(f"⚠️ No models found in {args.models_dir}")
+        return
+
+    server = ModelServer(args.socket, registry, max_batch_rows=args.max_batch_rows, max_wait_ms=args.max_wait_ms)
+    print(f"✅ Serving {', '.join(f'{n}@{v}' for n, v in sorted(versions.items()))} on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
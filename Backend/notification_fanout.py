@@ -0,0 +1,219 @@
+"""
+Regional Notification Fan-out
+For Agriculture Advisory System
+
+Sends one notification to every farmer with a farm in a region:
+- a state:                 {"state": "Punjab"}
+- a district:              {"state": "Punjab", "district": "Ludhiana"} (state optional)
+- a radius around a point: {"latitude": 30.9, "longitude": 75.85, "radius_km": 50}
+
+Recipients are resolved and written by the database itself, with
+INSERT ... SELECT over farms joined to locations, so no recipient rows pass
+through Python. Farmers with several farms in the region get one
+notification, pinned to their lowest-numbered location there.
+
+The insert runs in FANOUT_BATCH-wide ranges of user ids, one transaction
+each, so no single statement holds the write lock for long.
+
+Open notification streams are woken with one broadcast once the batches
+are written.
+
+Every notification carries an idempotency key, unique per user. A fan-out
+repeated with the same key reaches only farmers who did not get it yet, so
+a retried or double-submitted alert is never delivered twice. Without an
+explicit key, one is derived from the content, the region and the date, so
+the same alert is sent at most once a day.
+
+Databases from before idempotency keys lack the column and its indexes,
+which create_all does not add to an existing table; warmup adds them
+(ensure_notification_keys). Existing notifications keep a NULL key, which
+the unique index does not compare.
+
+Usage:
+    python notification_fanout.py --state Punjab --title "Heavy Rain Alert" --message "..." --priority high
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from datetime import date, datetime
+
+from sqlalchemy import and_, exists, func, insert, inspect, literal, select
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from flask_models import db, Farm, Location, Notification
+from notification_stream import broadcast
+
+FANOUT_BATCH = 20000
+KM_PER_DEGREE = 111.195
+MAX_RADIUS_KM = 1000
+
+NOTIFICATION_TYPES = Notification.__table__.c.notification_type.type.enums
+PRIORITIES = Notification.__table__.c.priority.type.enums
+
+
+def _has_key_column(connection):
+    return any(column['name'] == 'idempotency_key' for column in inspect(connection).get_columns('notifications'))
+
+
+def _has_unique_key(connection):
+    # SQLite backs the model's UniqueConstraint with an unnamed autoindex, so look for the columns, not the name
+    inspector, columns = inspect(connection), ['user_id', 'idempotency_key']
+    return (any(index.get('unique') and index['column_names'] == columns
+                for index in inspector.get_indexes('notifications'))
+            or any(constraint['column_names'] == columns
+                   for constraint in inspector.get_unique_constraints('notifications')))
+
+
+def ensure_notification_keys():
+    """Add idempotency_key and the notification indexes to a notifications table created before them
+
+    Run at warmup, like ensure_canonical_key_column; a worker racing another
+    to add the column finds it already there. Returns True when the column
+    was added.
+    """
+    try:
+        with db.engine.begin() as connection:
+            added = not _has_key_column(connection)
+            if added:
+                connection.exec_driver_sql("ALTER TABLE notifications ADD COLUMN idempotency_key VARCHAR(64)")
+    except (OperationalError, ProgrammingError):
+        with db.engine.connect() as connection:
+            if not _has_key_column(connection):
+                raise
+        added = False
+    with db.engine.begin() as connection:
+        if not _has_unique_key(connection):
+            connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS unique_notification_key "
+                                       "ON notifications (user_id, idempotency_key)")
+        connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_notifications_location_type "
+                                   "ON notifications (location_id, notification_type, expiry_date)")
+    return added
+
+
+def region_filter(target):
+    """SQL condition on locations for a target dict; raises ValueError for an unusable target"""
+    if target.get('radius_km') not in (None, ''):
+        try:
+            latitude, longitude = float(target['latitude']), float(target['longitude'])
+            radius = float(target['radius_km'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('A radius target needs numeric latitude, longitude and radius_km')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius <= MAX_RADIUS_KM:
+            raise ValueError(f'Coordinates out of range or radius_km not in (0, {MAX_RADIUS_KM}]')
+        # Equirectangular distance in degrees: plain arithmetic, so it runs on any database
+        reach = radius / KM_PER_DEGREE
+        scale = max(math.cos(math.radians(latitude)), 1e-6)
+        dy = Location.latitude - latitude
+        dx = (Location.longitude - longitude) * scale
+        return and_(Location.latitude.between(latitude - reach, latitude + reach),
+                    Location.longitude.between(longitude - reach / scale, longitude + reach / scale),
+                    dx * dx + dy * dy <= reach * reach)
+
+    conditions = [func.lower(getattr(Location, field)) == str(target[field]).strip().lower()
+                  for field in ('state', 'district') if target.get(field)]
+    if not conditions:
+        raise ValueError('Target a state, a district or a radius (latitude, longitude, radius_km)')
+    return and_(*conditions)
+
+
+def idempotency_key(target, notification_type, title, message, day=None):
+    """Key for an alert sent without one: the same content to the same region once per day"""
+    region = [str(target.get(field) or '').strip().lower() for field in ('state', 'district')]
+    if target.get('radius_km') not in (None, ''):
+        region = [round(float(target[field]), 6) for field in ('latitude', 'longitude', 'radius_km')]
+    content = json.dumps([region, notification_type, title, message, (day or date.today()).isoformat()])
+    return 'auto:' + hashlib.sha256(content.encode('utf-8')).hexdigest()[:59]
+
+
+def fan_out(target, notification_type, title, message, priority='medium', action_required=False, expiry_date=None,
+            key=None, batch_size=FANOUT_BATCH):
+    """Notify every farmer in the region once per key; returns a summary of the send"""
+    if notification_type not in NOTIFICATION_TYPES:
+        raise ValueError(f"notification_type must be one of {', '.join(NOTIFICATION_TYPES)}")
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+    if not title or not message:
+        raise ValueError('title and message are required')
+    region = region_filter(target)
+    key = key or idempotency_key(target, notification_type, title, message)
+    if len(key) > 64:
+        raise ValueError('idempotency_key must be at most 64 characters')
+
+    started = time.perf_counter()
+    first, last, count = db.session.execute(
+        select(func.min(Farm.user_id), func.max(Farm.user_id), func.count(func.distinct(Farm.user_id))).join(
+            Location, Location.id == Farm.location_id).where(region)).one()
+
+    table = Notification.__table__
+    columns = ('user_id', 'location_id', 'notification_type', 'title', 'message', 'priority', 'is_read',
+               'action_required', 'expiry_date', 'location_specific', 'idempotency_key', 'created_at')
+    already_sent = exists().where(table.c.user_id == Farm.user_id, table.c.idempotency_key == key)
+    created_at = datetime.utcnow()
+    inserted = 0
+    try:
+        for lower in range(first, last + 1, batch_size) if count else ():
+            # Literal values are bound parameters, so user text never reaches the SQL
+            rows = select(Farm.user_id, func.min(Farm.location_id), literal(notification_type), literal(title),
+                          literal(message), literal(priority), literal(False), literal(bool(action_required)),
+                          literal(expiry_date, table.c.expiry_date.type), literal(True), literal(key),
+                          literal(created_at, table.c.created_at.type)).join(
+                Location, Location.id == Farm.location_id).where(
+                region, Farm.user_id >= lower, Farm.user_id < lower + batch_size, ~already_sent).group_by(Farm.user_id)
+            try:
+                result = db.session.execute(insert(table).from_select(columns, rows))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            inserted += result.rowcount
+    finally:
+        # One wake-up for every open stream rather than one per recipient
+        if inserted:
+            broadcast()
+
+    return {
+        'idempotency_key': key,
+        'recipients': count,
+        'sent': inserted,
+        'suppressed': count - inserted,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send a notification to every farmer in a region')
+    parser.add_argument('--state')
+    parser.add_argument('--district')
+    parser.add_argument('--latitude', type=float)
+    parser.add_argument('--longitude', type=float)
+    parser.add_argument('--radius-km', type=float)
+    parser.add_argument('--type', default='weather_alert', choices=NOTIFICATION_TYPES)
+    parser.add_argument('--title', required=True)
+    parser.add_argument('--message', required=True)
+    parser.add_argument('--priority', default='medium', choices=PRIORITIES)
+    parser.add_argument('--key', help='Idempotency key; defaults to one derived from the content, region and date')
+    args = parser.parse_args()
+    target = {name: value for name, value in (('state', args.state), ('district', args.district),
+                                               ('latitude', args.latitude), ('longitude', args.longitude),
+                                               ('radius_km', args.radius_km)) if value is not None}
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        ensure_notification_keys()
+        try:
+            summary = fan_out(target, args.type, args.title, args.message, args.priority, key=args.key)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            return
+    print(f"✅ Sent to {summary['sent']:,} of {summary['recipients']:,} farmers in {summary['seconds']}s "
+          f"({summary['suppressed']:,} already had it; key {summary['idempotency_key']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""
+Notification Stream
+For Agriculture Advisory System
+
+Per-user pub/sub that wakes /api/notifications/stream connections when new
+notifications are committed, so dashboards no longer reload to see them.
+
+Messages are wake-ups, not payloads. A woken stream reads its user's
+notifications newer than the last one it sent, in one indexed query, so
+nothing is lost across reconnects (the SSE Last-Event-ID is the
+notification id). A bulk fan-out wakes every open stream with a single
+broadcast instead of one message per recipient.
+
+While idle, a stream waits on its own queue with a timeout and sends a
+keepalive comment every KEEPALIVE_SECONDS. It holds no database session and
+never polls.
+
+Brokers:
+- InMemoryBroker: subscribers and publishers in one process
+- RedisBroker: publishes on a Redis channel; one listener thread per
+  process hands messages to the local subscribers, so any worker's commit
+  wakes streams served by every other worker
+
+create_broker picks RedisBroker when REDIS_URL is set and redis is
+installed, and falls back to InMemoryBroker otherwise.
+
+A stream occupies its request handler for as long as it is open, so it is
+only enabled (NOTIFICATION_STREAM=1) under threaded gunicorn workers
+(gthread, as in the Dockerfile): there a stream holds one thread rather than
+a whole worker, and the worker keeps its heartbeat. Streams also end well
+before gunicorn's --timeout. Each worker serves at most stream_slots.limit
+streams at once (NOTIFICATION_STREAM_MAX, well below --threads), so open
+dashboards never take every thread; past it the endpoint answers 503 and
+the page polls the unread count until it tries the stream again.
+
+Publishing is automatic for notifications committed through the ORM (see
+the session events below). Bulk inserts that bypass it call publish or
+broadcast after committing.
+"""
+
+from itertools import chain
+import json
+import queue
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from flask_models import db, Notification
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+KEEPALIVE_SECONDS = 25
+# Streams end after this long, below gunicorn's --timeout (120s); browsers reconnect with Last-Event-ID
+STREAM_MAX_SECONDS = 90
+CLIENT_RETRY_MS = 5000
+# Wake-ups queued per subscriber; one pending wake-up is enough to trigger a read
+SUBSCRIBER_QUEUE_SIZE = 1
+CHANNEL = 'notifications'
+BROADCAST = '*'
+# Notifications sent per read; a longer backlog is sent in several reads
+READ_LIMIT = 50
+# User ids per Redis message
+PUBLISH_BATCH = 1000
+RECONNECT_SECONDS = 1.0
+# Streams per worker when not configured; leaves most of the Dockerfile's 16 threads for requests
+MAX_STREAMS = 6
+
+
+class Subscription:
+    """One stream's wake-up queue"""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self._queue = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def notify(self):
+        try:
+            self._queue.put_nowait(True)
+        except queue.Full:
+            pass  # a wake-up is already pending; the next read picks up everything
+
+    def wait(self, timeout):
+        """Block until woken (True) or until timeout (False)"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Wake-ups delivered within this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _deliver(self, user_ids):
+        with self._lock:
+            if user_ids is None:
+                targets = list(chain.from_iterable(self._subscribers.values()))
+            else:
+                targets = list(chain.from_iterable(self._subscribers.get(user_id, ()) for user_id in user_ids))
+        for subscription in targets:
+            subscription.notify()
+
+    def publish(self, user_ids):
+        """Wake the streams of these users"""
+        self._deliver(set(user_ids))
+
+    def broadcast(self):
+        """Wake every stream, e.g. after a bulk fan-out"""
+        self._deliver(None)
+
+
+class RedisBroker(InMemoryBroker):
+    """Wake-ups shared between processes through Redis pub/sub"""
+
+    def __init__(self, url):
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, user_id):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, daemon=True)
+                    self._listener.start()
+        return super().subscribe(user_id)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Anything published while disconnected was missed; let every stream re-read
+                self._deliver(None)
+                for message in pubsub.listen():
+                    data = message['data'].decode('utf-8')
+                    if data == BROADCAST:
+                        self._deliver(None)
+                    else:
+                        self._deliver({int(user_id) for user_id in data.split(',')})
+            except redis.RedisError as e:
+                print(f"⚠️ Notification listener lost Redis: {str(e)}; retrying")
+                time.sleep(RECONNECT_SECONDS)
+
+    def _send(self, data):
+        try:
+            self._redis.publish(CHANNEL, data)
+        except redis.RedisError as e:
+            # The notification is committed; streams still see it on their next wake-up or reconnect
+            print(f"⚠️ Could not publish notification wake-up: {str(e)}")
+
+    def publish(self, user_ids):
+        # Messages carry comma-separated user ids, so thousands of recipients cost a few messages
+        user_ids = sorted(set(user_ids))
+        for offset in range(0, len(user_ids), PUBLISH_BATCH):
+            self._send(','.join(map(str, user_ids[offset:offset + PUBLISH_BATCH])))
+
+    def broadcast(self):
+        self._send(BROADCAST)
+
+
+def create_broker(redis_url=None):
+    if redis_url and redis is not None:
+        return RedisBroker(redis_url)
+    if redis_url:
+        print("⚠️ REDIS_URL is set but redis is not installed; notification streams are per process")
+    return InMemoryBroker()
+
+
+broker = InMemoryBroker()
+
+
+def set_broker(new_broker):
+    global broker
+    broker = new_broker
+
+
+class StreamSlots:
+    """Count of open streams in this process, capped at limit"""
+
+    def __init__(self, limit=MAX_STREAMS):
+        self.limit = limit
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot; False when limit streams are already open"""
+        with self._lock:
+            if self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+stream_slots = StreamSlots()
+
+
+def publish(user_ids):
+    broker.publish(user_ids)
+
+
+def broadcast():
+    broker.broadcast()
+
+
+def to_dict(notification):
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'priority': notification.priority,
+        'action_required': bool(notification.action_required),
+        'location_id': notification.location_id,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None
+    }
+
+
+def format_event(data, event_name=None, event_id=None):
+    """One SSE frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event_name:
+        lines.append(f'event: {event_name}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def unread_count(user_id):
+    """Unread notifications of a user; one count over idx_notifications_user_read"""
+    return db.session.query(func.count(Notification.id)).filter(
+        Notification.user_id == user_id, Notification.is_read.is_(False)).scalar()
+
+
+def _read(app, user_id, after_id):
+    """(notifications newer than after_id, unread count, newest id), in a short-lived app context
+
+    The context's teardown returns the session's connection to the pool, so
+    nothing is held between reads.
+    """
+    with app.app_context():
+        if after_id is None:
+            after_id = db.session.query(func.max(Notification.id)).filter(
+                Notification.user_id == user_id).scalar() or 0
+        notifications = [to_dict(notification) for notification in Notification.query.filter(
+            Notification.user_id == user_id, Notification.id > after_id).order_by(Notification.id).limit(READ_LIMIT)]
+        return notifications, unread_count(user_id), notifications[-1]['id'] if notifications else after_id
+
+
+def event_stream(app, user_id, last_event_id=None, max_seconds=STREAM_MAX_SECONDS):
+    """SSE frames for one user's stream
+
+    Sends the unread count first, then every notification after
+    last_event_id (or only new ones when None), each followed by the new
+    unread count. Ends after max_seconds; the browser reconnects.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        deadline = time.monotonic() + max_seconds
+        yield f'retry: {CLIENT_RETRY_MS}\n\n'
+        woken = True
+        while True:
+            if woken:
+                # Subscribed before reading, so a commit between the two still wakes us
+                while True:
+                    notifications, unread, last_event_id = _read(app, user_id, last_event_id)
+                    for notification in notifications:
+                        yield format_event(notification, event_id=notification['id'])
+                    if len(notifications) < READ_LIMIT:
+                        break
+                yield format_event({'count': unread}, 'unread')
+            else:
+                yield ': keepalive\n\n'
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            woken = subscription.wait(min(KEEPALIVE_SECONDS, remaining))
+    finally:
+        subscription.close()
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_new_notifications(session, flush_context):
+    user_ids = {obj.user_id for obj in chain(session.new, session.dirty) if isinstance(obj, Notification)}
+    if user_ids:
+        session.info.setdefault('notification_users', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_on_commit(session):
+    user_ids = session.info.pop('notification_users', None)
+    if user_ids:
+        publish(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('notification_users', None)
@@ -5,8 +5,17 @@ Populates the agriculture advisory system database with sample data
 
 from flask_models import *
 from datetime import datetime, date, timedelta
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+from weather_rollups import rebuild_rollups
+from farm_features import rebuild_farm_features
+from data_versions import mark_changed
+from location_resolver import canonical_key
+import csv
+import io
 import json
 import random
+import time
 import numpy as np
 
 def populate_sample_data():
@@ -191,10 +200,22 @@ def populate_sample_data():
     # 9. Create disease/pest data
     print("🐛 Creating disease/pest data...")
     diseases_data = [
-        {"name": "Late Blight", "type": "disease", "scientific_name": "Phytophthora infestans", "symptoms": "Brown spots on leaves, white mold on undersides", "severity_level": "high"},
-        {"name": "Aphids", "type": "pest", "scientific_name": "Aphidoidea", "symptoms": "Small green insects on leaves and stems", "severity_level": "medium"},
-        {"name": "Blast", "type": "disease", "scientific_name": "Magnaporthe oryzae", "symptoms": "Diamond-shaped lesions on leaves", "severity_level": "high"},
-        {"name": "Stem Borer", "type": "pest", "scientific_name": "Chilo suppressalis", "symptoms": "Dead hearts, white ears in rice", "severity_level": "high"}
+        {"name": "Late Blight", "type": "disease", "scientific_name": "Phytophthora infestans", "symptoms": "Brown spots on leaves, white mold on undersides", "severity_level": "high",
+         "affected_crops": json.dumps(["Potato", "Tomato"]),
+         "favorable_conditions": json.dumps({"temperature": {"min": 10, "max": 25}, "humidity": {"min": 90}, "min_days": 2, "window_days": 5}),
+         "prevention_methods": "Spray mancozeb preventively and remove infected foliage"},
+        {"name": "Aphids", "type": "pest", "scientific_name": "Aphidoidea", "symptoms": "Small green insects on leaves and stems", "severity_level": "medium",
+         "affected_crops": json.dumps(["Wheat", "Cotton", "Chickpea", "Potato"]),
+         "favorable_conditions": json.dumps({"temperature": {"min": 15, "max": 28}, "rainfall": {"max": 2}, "min_days": 5, "window_days": 7}),
+         "prevention_methods": "Scout undersides of leaves and spray neem oil at first colonies"},
+        {"name": "Blast", "type": "disease", "scientific_name": "Magnaporthe oryzae", "symptoms": "Diamond-shaped lesions on leaves", "severity_level": "high",
+         "affected_crops": json.dumps(["Rice"]),
+         "favorable_conditions": json.dumps({"temperature": {"min": 20, "max": 30}, "humidity": {"min": 90}, "min_days": 3, "window_days": 7}),
+         "prevention_methods": "Avoid excess nitrogen and keep fields flooded evenly"},
+        {"name": "Stem Borer", "type": "pest", "scientific_name": "Chilo suppressalis", "symptoms": "Dead hearts, white ears in rice", "severity_level": "high",
+         "affected_crops": json.dumps(["Rice", "Maize", "Sugarcane"]),
+         "favorable_conditions": json.dumps({"temperature": {"min": 25, "max": 35}, "humidity": {"min": 70}, "min_days": 5, "window_days": 7}),
+         "prevention_methods": "Install pheromone traps and clip egg masses at transplanting"}
     ]
 
     diseases = []
@@ -340,6 +361,7 @@ def populate_sample_data():
     # Commit all changes
     try:
         db.session.commit()
+        rebuild_rollups([location.id for location in locations])
         print("\n" + "=" * 50)
         print("🎉 DATABASE POPULATION COMPLETED SUCCESSFULLY!")
         print("=" * 50)
@@ -351,7 +373,7 @@ def populate_sample_data():
         print(f"   • {len(fertilizers)} Fertilizers")
         print(f"   • {len(pesticides)} Pesticides")
         print(f"   • {len(diseases)} Diseases/Pests")
-        print(f"   • Weather data for 30 days")
+        print(f"   • Weather data for 30 days, with weekly, monthly and seasonal rollups")
         print(f"   • Market prices for major crops")
         print(f"   • Sample recommendations")
         print(f"   • User notifications")
@@ -363,7 +385,393 @@ def populate_sample_data():
         print(f"❌ Error during database population: {str(e)}")
         raise
 
+# Synthetic load-test data
+DEFAULT_BATCH_SIZE = 50000
+
+# Per unit of scale; every row count grows linearly with the scale factor
+SYNTHETIC_LOCATIONS_PER_SCALE = 100
+SYNTHETIC_FARMERS_PER_SCALE = 1000
+MARKET_LOCATION_FRACTION = 0.25
+
+# State -> (latitude, longitude) centre around which synthetic villages are placed
+SYNTHETIC_STATES = {
+    'Punjab': (30.9, 75.8), 'Haryana': (29.1, 76.1), 'Uttar Pradesh': (26.8, 80.9),
+    'Maharashtra': (19.7, 75.7), 'Karnataka': (15.3, 75.7), 'Tamil Nadu': (11.1, 78.7),
+    'Andhra Pradesh': (15.9, 79.7), 'Rajasthan': (27.0, 74.2), 'Madhya Pradesh': (23.5, 77.9),
+    'Gujarat': (22.3, 71.2), 'Bihar': (25.1, 85.3), 'West Bengal': (22.9, 87.9)
+}
+
+# Typical mandi price (Rs/quintal) and yield (quintals/acre) per crop
+CROP_ECONOMICS = {
+    'Rice': (2200, 22), 'Wheat': (2275, 18), 'Maize': (2090, 20), 'Cotton': (6620, 8),
+    'Sugarcane': (315, 320), 'Soybean': (4600, 9), 'Chickpea': (5440, 8), 'Tomato': (1500, 100),
+    'Potato': (1200, 90), 'Onion': (1800, 80)
+}
+DEFAULT_CROP_ECONOMICS = (2500, 15)
+
+# Season -> (month, day) on which sowing starts
+SEASON_STARTS = {'kharif': (6, 15), 'rabi': (11, 1)}
+
+# Activity type -> (mean count per season, earliest day, latest day, cost per acre, description)
+SEASON_ACTIVITIES = {
+    'sowing': (1.0, 0, 10, 1500, 'Sowing of seed'),
+    'irrigation': (4.0, 10, 100, 400, 'Scheduled irrigation'),
+    'fertilizer_application': (2.0, 15, 70, 1800, 'Top dressing with fertilizer'),
+    'pesticide_spray': (1.0, 30, 90, 1200, 'Pesticide spray'),
+    'weeding': (1.5, 20, 60, 900, 'Manual weeding'),
+    'harvesting': (1.0, 100, 130, 2500, 'Harvesting of crop'),
+    'soil_testing': (0.2, 0, 5, 300, 'Soil sample sent for testing'),
+    'other': (0.5, 0, 120, 500, 'General farm maintenance')
+}
+
+
+def _bulk_write(table, columns, rows, counts):
+    """Write rows (tuples in column order) with COPY on PostgreSQL, a driver-level executemany elsewhere
+
+    Dates and timestamps are passed as ISO strings, so the rows skip
+    SQLAlchemy's per-parameter type processing, which would otherwise
+    dominate the load time.
+    """
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+    else:
+        placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+        connection.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})", rows)
+    # Caches built from this table refresh once the rows are committed
+    mark_changed(db.session, table.name)
+    counts[table.name] = counts.get(table.name, 0) + len(rows)
+
+
+def _new_ids(model, after_id):
+    return [row[0] for row in db.session.query(model.id).filter(model.id > after_id).order_by(model.id)]
+
+
+def _max_id(model):
+    return db.session.query(func.max(model.id)).scalar() or 0
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), max(1, size)):
+        yield items[start:start + size]
+
+
+def _generate_locations(rng, count, created_at, counts):
+    states = list(SYNTHETIC_STATES)
+    state_index = rng.randint(len(states), size=count)
+    centres = np.array([SYNTHETIC_STATES[state] for state in states])[state_index]
+    coordinates = np.round(centres + rng.normal(0, 1.2, size=(count, 2)), 6)
+    first_id = _max_id(Location)
+    columns = ('country', 'state', 'district', 'city', 'pincode', 'latitude', 'longitude', 'canonical_key',
+               'created_at')
+    rows = [('India', states[s], f'District {d}', f'Village {first_id + i + 1}', str(pin), lat, lon,
+             canonical_key('India', states[s], f'District {d}', f'Village {first_id + i + 1}', str(pin)), created_at)
+            for i, (s, d, pin, (lat, lon)) in enumerate(zip(state_index.tolist(), rng.randint(1, 40, size=count).tolist(),
+                                                           rng.randint(110000, 860000, size=count).tolist(),
+                                                           coordinates.tolist()))]
+    _bulk_write(Location.__table__, columns, rows, counts)
+    ids = _new_ids(Location, first_id)
+    return ids, coordinates[:, 0]
+
+
+def _generate_farmers(rng, count, location_ids, created_at, counts, batch_size):
+    """Farmers own one to four smallholdings with lognormally distributed area"""
+    password_hash = generate_password_hash('password123')
+    first_user_id = _max_id(User)
+    user_columns = ('username', 'email', 'password_hash', 'first_name', 'last_name', 'phone', 'user_type',
+                    'created_at', 'updated_at')
+    first_names = ['Rajesh', 'Priya', 'Suresh', 'Anita', 'Gurpreet', 'Lakshmi', 'Ramesh', 'Sunita', 'Arjun', 'Kavita']
+    last_names = ['Kumar', 'Sharma', 'Patel', 'Singh', 'Reddy', 'Yadav', 'Gowda', 'Das', 'Jadhav', 'Nair']
+    for chunk in _chunks(range(first_user_id + 1, first_user_id + count + 1), batch_size):
+        _bulk_write(User.__table__, user_columns, [
+            (f'farmer_{n}', f'farmer_{n}@example.com', password_hash, first_names[n % 10], last_names[(n // 10) % 10],
+             f'9{n:09d}'[:10], 'farmer', created_at, created_at) for n in chunk], counts)
+    user_ids = np.array(_new_ids(User, first_user_id))
+
+    farms_per_user = np.minimum(rng.geometric(0.6, size=len(user_ids)), 4)
+    owners = np.repeat(user_ids, farms_per_user)
+    n_farms = len(owners)
+    areas = np.round(np.clip(rng.lognormal(np.log(2.5), 0.8, size=n_farms), 0.2, 200), 2)
+    farm_types = np.array(['conventional', 'organic', 'mixed'])[rng.choice(3, size=n_farms, p=[0.75, 0.1, 0.15])]
+    irrigation = np.array(['drip', 'sprinkler', 'flood', 'rain_fed', 'mixed'])[
+        rng.choice(5, size=n_farms, p=[0.1, 0.1, 0.35, 0.4, 0.05])]
+    soils = np.array(['Loamy', 'Clay', 'Sandy', 'Black', 'Red', 'Alluvial'])[rng.randint(6, size=n_farms)]
+    farm_locations = np.array(location_ids)[rng.randint(len(location_ids), size=n_farms)]
+
+    first_farm_id = _max_id(Farm)
+    farm_columns = ('user_id', 'farm_name', 'location_id', 'total_area', 'farm_type', 'irrigation_type', 'soil_type',
+                    'created_at')
+    farm_rows = [(user_id, f'Farm {first_farm_id + i + 1}', location_id, area, farm_type, irrigation_type, soil, created_at)
+                 for i, (user_id, location_id, area, farm_type, irrigation_type, soil) in enumerate(zip(
+                     owners.tolist(), farm_locations.tolist(), areas.tolist(), farm_types.tolist(),
+                     irrigation.tolist(), soils.tolist()))]
+    for chunk in _chunks(farm_rows, batch_size):
+        _bulk_write(Farm.__table__, farm_columns, chunk, counts)
+    farm_ids = np.array(_new_ids(Farm, first_farm_id))
+
+    # One recent soil test per farm
+    today = date.today()
+    soil_columns = ('farm_id', 'nitrogen_content', 'phosphorus_content', 'potassium_content', 'ph_level',
+                    'organic_carbon', 'moisture_content', 'test_date', 'tested_by', 'lab_name', 'created_at')
+    soil_values = zip(farm_ids.tolist(),
+                      np.round(np.clip(rng.normal(60, 25, n_farms), 0, 140), 2).tolist(),
+                      np.round(np.clip(rng.normal(45, 20, n_farms), 5, 145), 2).tolist(),
+                      np.round(np.clip(rng.normal(50, 30, n_farms), 5, 205), 2).tolist(),
+                      np.round(np.clip(rng.normal(6.8, 0.7, n_farms), 4.0, 9.5), 1).tolist(),
+                      np.round(np.clip(rng.lognormal(np.log(0.7), 0.4, n_farms), 0.1, 3.0), 2).tolist(),
+                      np.round(rng.uniform(10, 40, n_farms), 2).tolist(),
+                      rng.randint(1, 365, size=n_farms).tolist())
+    soil_rows = [(farm_id, n, p, k, ph, oc, moisture, (today - timedelta(days=age)).isoformat(), 'Soil Testing Laboratory',
+                  'AgriTest Labs', created_at) for farm_id, n, p, k, ph, oc, moisture, age in soil_values]
+    for chunk in _chunks(soil_rows, batch_size):
+        _bulk_write(SoilData.__table__, soil_columns, chunk, counts)
+
+    return farm_ids, areas
+
+
+def _generate_weather(rng, location_ids, latitudes, start_date, days, created_at, counts, batch_size):
+    """Daily weather with a latitude-dependent seasonal cycle and a June-September monsoon"""
+    day_of_year = np.array([(start_date + timedelta(days=i)).timetuple().tm_yday for i in range(days)])
+    dates = [(start_date + timedelta(days=i)).isoformat() for i in range(days)]
+    seasonal = np.sin(2 * np.pi * (day_of_year - 49) / 365.0)  # hottest in mid-May
+    monsoon = (day_of_year >= 160) & (day_of_year <= 275)
+    columns = ('location_id', 'date', 'temperature_max', 'temperature_min', 'temperature_avg', 'humidity', 'rainfall',
+               'wind_speed', 'evapotranspiration', 'pressure', 'cloud_cover', 'created_at')
+
+    per_chunk = max(1, batch_size // days)
+    for start in range(0, len(location_ids), per_chunk):
+        ids = location_ids[start:start + per_chunk]
+        lat = latitudes[start:start + per_chunk, None]
+        shape = (len(ids), days)
+        average = 31 - 0.35 * (lat - 10) + (2 + 0.3 * (lat - 10)) * seasonal + rng.normal(0, 1.5, shape)
+        spread = rng.uniform(4, 8, shape)
+        wet = rng.random_sample(shape) < np.where(monsoon, 0.55, 0.07)
+        rainfall = np.where(wet, rng.gamma(0.9, np.where(monsoon, 18.0, 7.0), shape), 0.0)
+        humidity = np.clip(50 + 30 * monsoon + 15 * wet + rng.normal(0, 8, shape), 15, 100)
+        # Hargreaves reference evapotranspiration with a fixed radiation term
+        evapotranspiration = np.clip(0.0023 * 12.0 * (average + 17.8) * np.sqrt(2 * spread), 0, None)
+        columns_data = [np.round(values, 2).ravel().tolist() for values in (
+            average + spread, average - spread, average, humidity, rainfall, rng.gamma(2.0, 4.0, shape),
+            evapotranspiration, rng.normal(1008, 4, shape), np.clip(20 + 60 * wet + rng.normal(0, 15, shape), 0, 100))]
+        location_column = np.repeat(ids, days).tolist()
+        rows = [(location_id, day, *values, created_at)
+                for location_id, day, values in zip(location_column, dates * len(ids), zip(*columns_data))]
+        _bulk_write(WeatherData.__table__, columns, rows, counts)
+
+
+def _generate_market_prices(rng, market_location_ids, market_names, crops, start_date, days, created_at, counts,
+                            batch_size):
+    """Daily mandi prices: crop base price, post-harvest seasonal dip, random walk and a local premium"""
+    day_of_year = np.array([(start_date + timedelta(days=i)).timetuple().tm_yday for i in range(days)])
+    dates = [(start_date + timedelta(days=i)).isoformat() for i in range(days)]
+    base_prices = np.array([CROP_ECONOMICS.get(crop.crop_name, DEFAULT_CROP_ECONOMICS)[0] for crop in crops])
+    crop_ids = [crop.id for crop in crops]
+    grades = np.array(['FAQ', 'A', 'B', 'C'])
+    levels = np.array(['low', 'medium', 'high'])
+    columns = ('crop_id', 'location_id', 'market_name', 'price_per_quintal', 'date', 'quality_grade', 'market_type',
+               'demand_level', 'supply_level', 'created_at')
+
+    per_chunk = max(1, batch_size // (days * len(crops)))
+    for start in range(0, len(market_location_ids), per_chunk):
+        ids = market_location_ids[start:start + per_chunk]
+        shape = (len(ids), len(crops), days)
+        walk = np.cumsum(rng.normal(0, 0.006, shape), axis=2)
+        premium = rng.normal(0, 0.05, (len(ids), len(crops), 1))
+        seasonal = 0.08 * np.sin(2 * np.pi * (day_of_year - 20) / 365.0)
+        prices = np.round(base_prices[None, :, None] * np.exp(walk + premium + seasonal), 2)
+        n = prices.size
+        rows = [(crop_id, location_id, market_names[location_id], price, day, grade, 'wholesale', demand, supply,
+                 created_at)
+                for location_id, crop_id, day, price, grade, demand, supply in zip(
+                    np.repeat(ids, len(crops) * days).tolist(),
+                    np.tile(np.repeat(crop_ids, days), len(ids)).tolist(),
+                    dates * (len(ids) * len(crops)),
+                    prices.ravel().tolist(),
+                    grades[rng.choice(4, size=n, p=[0.55, 0.2, 0.15, 0.1])].tolist(),
+                    levels[rng.randint(3, size=n)].tolist(),
+                    levels[rng.randint(3, size=n)].tolist())]
+        _bulk_write(MarketPrice.__table__, columns, rows, counts)
+
+
+def _season_starts(years):
+    """(season, start date) for every kharif and rabi season that started in the last `years` years"""
+    today = date.today()
+    starts = []
+    for year in range(today.year - years, today.year + 1):
+        for season, (month, day) in SEASON_STARTS.items():
+            start = date(year, month, day)
+            if today - timedelta(days=365 * years) <= start < today:
+                starts.append((season, start))
+    return starts
+
+
+def _generate_farm_history(rng, farm_ids, areas, crops, years, created_at, counts, batch_size):
+    """Per farm and season: one crop, its field activities and (once harvested) a yield record"""
+    today_ordinal = date.today().toordinal()
+    crop_pool = {season: [crop for crop in crops if crop.growing_season == season] or crops
+                 for season in SEASON_STARTS}
+    activity_columns = ('farm_id', 'crop_id', 'activity_type', 'activity_description', 'activity_date', 'area_covered',
+                        'cost_incurred', 'labor_hours', 'created_at')
+    yield_columns = ('farm_id', 'crop_id', 'harvest_date', 'area_harvested', 'total_yield', 'yield_per_acre',
+                     'quality_grade', 'total_cost', 'selling_price_per_quintal', 'total_revenue', 'net_profit',
+                     'profit_per_acre', 'season', 'year', 'created_at')
+    grades = np.array(['FAQ', 'A', 'B', 'C'])
+
+    per_chunk = max(1, batch_size // 12)
+    for season, start in _season_starts(years):
+        pool = crop_pool[season]
+        pool_ids = np.array([crop.id for crop in pool])
+        pool_maturity = np.array([crop.maturity_period or 110 for crop in pool])
+        pool_economics = np.array([CROP_ECONOMICS.get(crop.crop_name, DEFAULT_CROP_ECONOMICS) for crop in pool])
+
+        for chunk_start in range(0, len(farm_ids), per_chunk):
+            farms = farm_ids[chunk_start:chunk_start + per_chunk]
+            farm_area = areas[chunk_start:chunk_start + per_chunk]
+            n = len(farms)
+            choice = rng.randint(len(pool), size=n)
+
+            activity_rows = []
+            for activity_type, (mean_count, earliest, latest, cost_per_acre, description) in SEASON_ACTIVITIES.items():
+                per_farm = rng.poisson(mean_count, size=n) if mean_count != 1.0 else np.ones(n, dtype=int)
+                index = np.repeat(np.arange(n), per_farm)
+                ordinals = start.toordinal() + rng.randint(earliest, latest + 1, size=len(index))
+                keep = ordinals < today_ordinal
+                index, ordinals = index[keep], ordinals[keep]
+                covered = np.round(farm_area[index] * rng.uniform(0.3, 1.0, size=len(index)), 2)
+                cost = np.round(covered * cost_per_acre * rng.lognormal(0, 0.2, size=len(index)), 2)
+                hours = np.round(rng.gamma(2.0, 2.0, size=len(index)) * np.maximum(covered, 0.5), 2)
+                activity_rows.extend(
+                    (farm_id, crop_id, activity_type, description, date.fromordinal(ordinal).isoformat(), area, c, h,
+                     created_at)
+                    for farm_id, crop_id, ordinal, area, c, h in zip(
+                        farms[index].tolist(), pool_ids[choice[index]].tolist(), ordinals.tolist(),
+                        covered.tolist(), cost.tolist(), hours.tolist()))
+            _bulk_write(FarmActivity.__table__, activity_columns, activity_rows, counts)
+
+            harvest = start.toordinal() + pool_maturity[choice] + rng.randint(-7, 8, size=n)
+            harvested = harvest < today_ordinal
+            if not harvested.any():
+                continue
+            idx = np.flatnonzero(harvested)
+            price, base_yield = pool_economics[choice[idx], 0], pool_economics[choice[idx], 1]
+            area = np.round(farm_area[idx] * rng.uniform(0.5, 1.0, size=len(idx)), 2)
+            per_acre = np.round(base_yield * rng.lognormal(0, 0.25, size=len(idx)), 2)
+            total = np.round(per_acre * area, 2)
+            selling = np.round(price * rng.lognormal(0, 0.1, size=len(idx)), 2)
+            cost = np.round(area * price * base_yield * rng.uniform(0.35, 0.6, size=len(idx)), 2)
+            revenue = np.round(total * selling, 2)
+            profit = np.round(revenue - cost, 2)
+            profit_per_acre = np.round(profit / np.maximum(area, 0.01), 2)
+            _bulk_write(YieldRecord.__table__, yield_columns, [
+                (farm_id, crop_id, date.fromordinal(ordinal).isoformat(), a, t, pa, grade, c, s, r, p, ppa, season, start.year,
+                 created_at)
+                for farm_id, crop_id, ordinal, a, t, pa, grade, c, s, r, p, ppa in zip(
+                    farms[idx].tolist(), pool_ids[choice[idx]].tolist(), harvest[idx].tolist(), area.tolist(),
+                    total.tolist(), per_acre.tolist(), grades[rng.choice(4, size=len(idx), p=[0.5, 0.2, 0.2, 0.1])].tolist(),
+                    cost.tolist(), selling.tolist(), revenue.tolist(), profit.tolist(), profit_per_acre.tolist())
+            ], counts)
+
+
+def generate_synthetic_data(scale=1.0, seed=42, years=3, batch_size=DEFAULT_BATCH_SIZE):
+    """Generate a load-test dataset whose size grows linearly with scale
+
+    Builds on populate_sample_data() for the master data (crops, fertilizers,
+    pesticides), then adds synthetic villages, farmers, farms, soil tests,
+    daily weather and mandi prices, farm activities and yield records. The
+    output is deterministic for a given seed. Rows go in with COPY on
+    PostgreSQL and a driver-level executemany elsewhere. Scale 1 is about
+    500k rows with the default 3 years of history, and scale 20 about 10
+    million.
+    """
+    print(f"🌱 Generating synthetic data (scale={scale}, seed={seed}, years={years})...")
+    started = time.perf_counter()
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = np.random.RandomState(seed)
+    created_at = datetime.utcnow().isoformat(' ')
+    counts = {}
+
+    if Crop.query.count() == 0:
+        populate_sample_data()
+    crops = Crop.query.order_by(Crop.id).all()
+
+    connection = db.session.connection()
+    is_sqlite = connection.dialect.name == 'sqlite'
+    if is_sqlite:
+        previous_synchronous = connection.exec_driver_sql('PRAGMA synchronous').scalar()
+        connection.exec_driver_sql('PRAGMA synchronous = OFF')
+
+    try:
+        location_ids, latitudes = _generate_locations(
+            rng, max(1, int(SYNTHETIC_LOCATIONS_PER_SCALE * scale)), created_at, counts)
+        market_ids = sorted(rng.choice(location_ids, size=max(1, int(len(location_ids) * MARKET_LOCATION_FRACTION)),
+                                       replace=False).tolist())
+        market_names = {location.id: f"{location.city} Mandi"
+                        for location in Location.query.filter(Location.id.in_(market_ids))}
+        farm_ids, areas = _generate_farmers(
+            rng, max(1, int(SYNTHETIC_FARMERS_PER_SCALE * scale)), location_ids, created_at, counts, batch_size)
+        db.session.commit()
+        print(f"✅ Created {counts.get('locations', 0)} locations, {counts.get('users', 0)} farmers, "
+              f"{counts.get('farms', 0)} farms")
+
+        days = 365 * years
+        start_date = date.today() - timedelta(days=days)
+        _generate_weather(rng, location_ids, latitudes, start_date, days, created_at, counts, batch_size)
+        db.session.commit()
+        counts['weather_rollups'] = rebuild_rollups(location_ids)
+        counts['farm_features'] = rebuild_farm_features()
+        print(f"✅ Created {counts.get('weather_data', 0)} weather rows, {counts['weather_rollups']} rollups, "
+              f"{counts['farm_features']} farm feature vectors")
+
+        _generate_market_prices(rng, market_ids, market_names, crops, start_date, days, created_at, counts, batch_size)
+        db.session.commit()
+        print(f"✅ Created {counts.get('market_prices', 0)} market prices")
+
+        _generate_farm_history(rng, farm_ids, areas, crops, years, created_at, counts, batch_size)
+        db.session.commit()
+        print(f"✅ Created {counts.get('farm_activities', 0)} farm activities, "
+              f"{counts.get('yield_records', 0)} yield records")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error during synthetic data generation: {str(e)}")
+        raise
+    finally:
+        if is_sqlite:
+            db.session.connection().exec_driver_sql(f'PRAGMA synchronous = {previous_synchronous}')
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"🎉 Generated {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    return counts
+
+
 if __name__ == "__main__":
-    # This would be run within Flask app context
-    print("⚠️ This script should be run within Flask application context")
-    print("Usage: flask shell -> exec(open('populate_database.py').read())")
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description='Populate the database with sample or synthetic load-test data')
+    parser.add_argument('--scale', type=float, help='Generate synthetic data at this scale factor (1 is about 500k rows)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--years', type=int, default=3, help='Years of daily weather and price history')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        db.create_all()
+        if args.scale:
+            generate_synthetic_data(args.scale, seed=args.seed, years=args.years, batch_size=args.batch_size)
+        else:
+            populate_sample_data()
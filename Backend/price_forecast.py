@@ -0,0 +1,239 @@
+"""
+Batch Price Forecasting
+For Agriculture Advisory System
+
+Forecasts the next HORIZON_DAYS of mandi prices for every (crop, location)
+series in one batch. All series are fitted together with NumPy. Each
+candidate model's state is an array with one column per series and one row
+per parameter setting, so a day of history is a single array update for
+every series and setting at once.
+
+Candidate models:
+- simple exponential smoothing, over a grid of alphas
+- damped-trend Holt smoothing, over a grid of (alpha, beta)
+- seasonal naive with a 7-day period (weekly market days)
+
+For each series, the model with the lowest MAE on the last HORIZON_DAYS of
+history (held out while fitting) is refitted on the full history and used.
+Its one-step-ahead RMSE, widened by sqrt(horizon), sets an approximate 95%
+interval.
+
+The forecasts replace the previous run in price_forecasts in a single
+transaction and are served from there, so requests never fit anything. Run
+it nightly, after the day's mandi import:
+
+    python price_forecast.py --horizon 14
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import time
+from datetime import datetime
+
+from flask_models import db, PriceForecast
+from market_analytics import load_prices, price_matrix
+
+HORIZON_DAYS = 14
+HISTORY_DAYS = 180
+MIN_OBSERVATIONS = 30
+SEASON_LENGTH = 7
+DAMPING = 0.9
+INTERVAL_Z = 1.96
+
+# (alpha, beta) settings; beta 0 with a zero starting trend is simple exponential smoothing
+SMOOTHING_GRID = [(alpha, 0.0) for alpha in (0.1, 0.3, 0.5, 0.8)] + \
+                 [(alpha, beta) for alpha in (0.3, 0.6) for beta in (0.05, 0.2)]
+
+INSERT_COLUMNS = ('crop_id', 'location_id', 'forecast_date', 'horizon_days', 'price_per_quintal', 'lower_bound',
+                  'upper_bound', 'model', 'holdout_mae', 'generated_at')
+
+
+def _model_name(index):
+    if index == len(SMOOTHING_GRID):
+        return 'seasonal_naive'
+    alpha, beta = SMOOTHING_GRID[index]
+    return f'ses({alpha})' if beta == 0 else f'holt({alpha},{beta})'
+
+
+def _damped_steps(horizon):
+    """Cumulative damped trend multipliers phi + phi^2 + ... for h = 1..horizon"""
+    return np.cumsum(DAMPING ** np.arange(1, horizon + 1))
+
+
+def smooth(values, holdout_start):
+    """Run every SMOOTHING_GRID setting over a days x series matrix
+
+    Returns (state at holdout_start, final state, one-step RMSE), the states
+    being (level, trend) pairs of grid x series arrays. Missing days advance
+    the state without an update.
+    """
+    alphas = np.array([alpha for alpha, _ in SMOOTHING_GRID])[:, None]
+    betas = np.array([beta for _, beta in SMOOTHING_GRID])[:, None]
+    first = pd.DataFrame(values).bfill().to_numpy()[0]
+    level = np.tile(first, (len(SMOOTHING_GRID), 1))
+    trend = np.zeros_like(level)
+    snapshot = (level, trend)
+    squared_error = np.zeros_like(level)
+    observations = np.zeros(values.shape[1])
+
+    for day in range(values.shape[0]):
+        if day == holdout_start:
+            snapshot = (level.copy(), trend.copy())
+        observed = values[day]
+        has_value = ~np.isnan(observed)
+        expected = level + DAMPING * trend
+        if day:
+            squared_error += np.where(has_value, observed - expected, 0.0) ** 2
+            observations += has_value
+        new_level = alphas * observed + (1 - alphas) * expected
+        new_trend = betas * (new_level - level) + (1 - betas) * DAMPING * trend
+        level = np.where(has_value, new_level, expected)
+        trend = np.where(has_value, new_trend, DAMPING * trend)
+    return snapshot, (level, trend), np.sqrt(squared_error / np.maximum(observations, 1))
+
+
+def seasonal_naive(filled, end, horizon):
+    """Repeat the last SEASON_LENGTH (forward-filled) days before row `end`"""
+    last_season = filled[end - SEASON_LENGTH:end]
+    return last_season[np.arange(horizon) % SEASON_LENGTH]
+
+
+def fit_forecasts(matrix, horizon=HORIZON_DAYS):
+    """Choose and apply a model for every usable series of a date x series price matrix
+
+    Returns a DataFrame with one row per (series, horizon day) and the
+    number of series skipped for too little history.
+    """
+    values = matrix.to_numpy(dtype=float)
+    days, _ = values.shape
+    holdout_start = days - horizon
+    usable = (np.isfinite(values[:holdout_start]).sum(axis=0) >= MIN_OBSERVATIONS) & \
+             np.isfinite(values[holdout_start:]).any(axis=0)
+    values = values[:, usable]
+    columns = matrix.columns[usable]
+    filled = pd.DataFrame(values).ffill().bfill().to_numpy()
+    actual = values[holdout_start:]
+
+    # Holdout errors: grid settings from the snapshot state, seasonal naive from the week before
+    (level, trend), final, one_step = smooth(values, holdout_start)
+    steps = _damped_steps(horizon)
+    smoothed = level[:, None, :] + steps[None, :, None] * trend[:, None, :]
+    naive = seasonal_naive(filled, holdout_start, horizon)
+    candidates = np.concatenate([smoothed, naive[None]], axis=0)
+    errors = candidates - actual[None]
+    mae = np.nanmean(np.abs(errors), axis=1)
+    best = np.argmin(mae, axis=0)
+    series = np.arange(values.shape[1])
+
+    # Refit on the full history with the chosen model
+    level, trend = final
+    forecasts = np.concatenate([level[:, None, :] + steps[None, :, None] * trend[:, None, :],
+                                seasonal_naive(filled, days, horizon)[None]], axis=0)[best, :, series]
+    # Interval from the one-step-ahead RMSE, widening like a random walk's
+    seasonal_error = np.sqrt(np.nanmean((values[SEASON_LENGTH:] - filled[:-SEASON_LENGTH]) ** 2, axis=0))
+    sigma = np.concatenate([one_step, seasonal_error[None]], axis=0)[best, series]
+    band = INTERVAL_Z * sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))[None]
+
+    dates = pd.date_range(matrix.index[-1] + pd.Timedelta(days=1), periods=horizon, freq='D')
+    count = len(series) * horizon
+    frame = pd.DataFrame({
+        'crop_id': np.repeat(columns.get_level_values(0).to_numpy(), horizon),
+        'location_id': np.repeat(columns.get_level_values(1).to_numpy(), horizon),
+        'forecast_date': np.tile(dates.strftime('%Y-%m-%d').to_numpy(), len(series)),
+        'horizon_days': np.tile(np.arange(1, horizon + 1), len(series)),
+        'price_per_quintal': forecasts.reshape(count),
+        'lower_bound': np.maximum(forecasts - band, 0).reshape(count),
+        'upper_bound': (forecasts + band).reshape(count),
+        'model': np.repeat([_model_name(index) for index in best], horizon),
+        'holdout_mae': np.repeat(mae[best, series], horizon)
+    })
+    return frame, int((~usable).sum())
+
+
+def store_forecasts(frame, generated_at):
+    """Replace the stored forecasts with this run's rows in one transaction"""
+    frame = frame.round({'price_per_quintal': 2, 'lower_bound': 2, 'upper_bound': 2, 'holdout_mae': 2})
+    frame['generated_at'] = generated_at.isoformat(' ')
+    rows = list(zip(*[frame[column].tolist() for column in INSERT_COLUMNS]))
+    connection = db.session.connection()
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    try:
+        db.session.query(PriceForecast).delete(synchronize_session=False)
+        if rows:
+            connection.exec_driver_sql(
+                f"INSERT INTO {PriceForecast.__tablename__} ({', '.join(INSERT_COLUMNS)}) "
+                f"VALUES ({', '.join([placeholder] * len(INSERT_COLUMNS))})", rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def generate_forecasts(horizon=HORIZON_DAYS, history_days=HISTORY_DAYS):
+    """Fit, forecast and store every series; returns a summary of the run"""
+    started = time.perf_counter()
+    generated_at = datetime.utcnow()
+    as_of, prices = load_prices(history_days)
+    if as_of is None:
+        return {'series': 0, 'skipped': 0, 'rows': 0, 'seconds': 0.0}
+    matrix = price_matrix(prices, as_of, history_days)
+    frame, skipped = fit_forecasts(matrix, horizon)
+    rows = store_forecasts(frame, generated_at)
+    return {
+        'as_of': as_of.strftime('%Y-%m-%d'),
+        'generated_at': generated_at.isoformat(),
+        'series': rows // horizon,
+        'skipped': skipped,
+        'rows': rows,
+        'models': frame.drop_duplicates(['crop_id', 'location_id'])['model'].value_counts().to_dict(),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def get_forecasts(crop_id, location_id=None):
+    """Stored forecasts for a crop, grouped per location"""
+    query = PriceForecast.query.filter_by(crop_id=crop_id)
+    if location_id is not None:
+        query = query.filter_by(location_id=location_id)
+    series = {}
+    for row in query.order_by(PriceForecast.location_id, PriceForecast.forecast_date):
+        entry = series.setdefault(row.location_id, {
+            'crop_id': row.crop_id,
+            'location_id': row.location_id,
+            'model': row.model,
+            'holdout_mae': float(row.holdout_mae) if row.holdout_mae is not None else None,
+            'generated_at': row.generated_at.isoformat(),
+            'forecast': []
+        })
+        entry['forecast'].append({
+            'date': row.forecast_date.strftime('%Y-%m-%d'),
+            'horizon_days': row.horizon_days,
+            'price': float(row.price_per_quintal),
+            'lower': float(row.lower_bound) if row.lower_bound is not None else None,
+            'upper': float(row.upper_bound) if row.upper_bound is not None else None
+        })
+    return list(series.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Forecast mandi prices for every crop/location series')
+    parser.add_argument('--horizon', type=int, default=HORIZON_DAYS, help='Days to forecast')
+    parser.add_argument('--history', type=int, default=HISTORY_DAYS, help='Days of history to fit on')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        summary = generate_forecasts(args.horizon, args.history)
+    print(f"✅ Forecast {summary['series']:,} series ({summary['rows']:,} rows) in {summary['seconds']}s, "
+          f"skipped {summary['skipped']:,} with too little history")
+    for model, count in sorted(summary.get('models', {}).items()):
+        print(f"   • {model}: {count:,}")
+
+
+if __name__ == '__main__':
+    main()
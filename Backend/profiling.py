@@ -0,0 +1,173 @@
+"""
+On-Demand Request Profiler
+For Agriculture Advisory System
+
+Statistical profiler for individual production requests. While a profiled
+request runs, a helper thread samples the request thread's Python stack
+every few milliseconds. The samples are written in folded-stack format
+("frame;frame;frame count"), which flamegraph.pl, speedscope and inferno
+read directly.
+
+A request is profiled when either:
+- it falls in the random PROFILE_SAMPLE_RATE fraction, or
+- an admin sends the X-Profile-Request: 1 header.
+
+Profiles go to logs/profiles/ with route, duration and user type in the file
+name and in index.jsonl. The oldest profiles are pruned to keep the
+directory under PROFILE_MAX_BYTES. When PROFILING_ENABLED is off, no hook is
+installed, so there is no per-request cost.
+"""
+
+from collections import Counter
+from datetime import datetime
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+PROFILE_HEADER = 'X-Profile-Request'
+INDEX_FILE = 'index.jsonl'
+INDEX_MAX_LINES = 5000
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def _safe(value):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '-', str(value))[:60]
+
+
+def prune_profiles(profile_dir, max_bytes):
+    """Delete the oldest profiles until the directory fits in max_bytes"""
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if name.endswith('.folded'):
+            path = os.path.join(profile_dir, name)
+            stat = os.stat(path)
+            profiles.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in profiles)
+    for _, size, path in sorted(profiles):
+        if total <= max_bytes:
+            break
+        os.unlink(path)
+        total -= size
+
+    # Keep the index bounded too: drop the oldest half once it grows past the limit
+    index_path = os.path.join(profile_dir, INDEX_FILE)
+    if os.path.exists(index_path) and os.path.getsize(index_path) > INDEX_MAX_LINES * 256:
+        with open(index_path) as f:
+            lines = f.readlines()
+        if len(lines) > INDEX_MAX_LINES:
+            with open(index_path, 'w') as f:
+                f.writelines(lines[-(INDEX_MAX_LINES // 2):])
+
+
+def write_profile(profile_dir, samples, route, duration_ms, user_type, reason, max_bytes):
+    """Write folded stacks and an index entry, then enforce the disk budget"""
+    os.makedirs(profile_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    filename = f"{timestamp}_{_safe(route)}_{int(duration_ms)}ms_{_safe(user_type)}.folded"
+    path = os.path.join(profile_dir, filename)
+
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    with open(os.path.join(profile_dir, INDEX_FILE), 'a') as f:
+        f.write(json.dumps({
+            'file': filename,
+            'route': route,
+            'duration_ms': round(duration_ms, 2),
+            'user_type': user_type,
+            'reason': reason,
+            'samples': sum(samples.values()),
+            'created_at': datetime.now().isoformat()
+        }) + '\n')
+
+    prune_profiles(profile_dir, max_bytes)
+    return path
+
+
+def init_app(app):
+    """Install the profiling hooks when PROFILING_ENABLED is set"""
+    app.config.setdefault('PROFILING_ENABLED', os.environ.get('PROFILING_ENABLED') == '1')
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0)))
+    app.config.setdefault('PROFILE_INTERVAL_MS', 5)
+    app.config.setdefault('PROFILE_DIR', os.path.join('logs', 'profiles'))
+    app.config.setdefault('PROFILE_MAX_BYTES', 50 * 1024 * 1024)
+
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    from flask import g, request
+    from flask_login import current_user
+
+    def _profile_reason():
+        if request.headers.get(PROFILE_HEADER) == '1':
+            if current_user.is_authenticated and current_user.user_type == 'admin':
+                return 'admin_header'
+        if app.config['PROFILE_SAMPLE_RATE'] and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            return 'sampled'
+        return None
+
+    @app.before_request
+    def _start_profile():
+        reason = _profile_reason()
+        if reason is None:
+            return
+        g._profile_reason = reason
+        g._profile_started = time.perf_counter()
+        g._profile_sampler = StackSampler(threading.get_ident(),
+                                          app.config['PROFILE_INTERVAL_MS'] / 1000.0).start()
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        sampler = g.pop('_profile_sampler', None)
+        if sampler is None:
+            return
+        duration_ms = (time.perf_counter() - g.pop('_profile_started')) * 1000
+        samples = sampler.stop()
+        if not samples:
+            return
+        user_type = current_user.user_type if current_user.is_authenticated else 'anonymous'
+        try:
+            write_profile(app.config['PROFILE_DIR'], samples, request.endpoint or 'unmatched',
+                          duration_ms, user_type, g.pop('_profile_reason'), app.config['PROFILE_MAX_BYTES'])
+        except OSError as e:
+            print(f"⚠️ Could not write profile: {str(e)}")
@@ -0,0 +1,174 @@
+"""
+SQL Query Instrumentation
+For Agriculture Advisory System
+
+Counts and times every statement through SQLAlchemy engine events and
+attributes the statements to the current request. A statement shape that
+repeats within one request (the same SELECT issued once per farm in a loop)
+is flagged as a probable N+1 pattern.
+
+Results are exposed through:
+- the /metrics endpoint (per-endpoint query counts, SQL time and N+1 hits)
+- X-SQL-* response headers when the app runs in debug mode
+- assert_query_budget() for tests:
+
+    with assert_query_budget(3):
+        client.get('/weather-alerts')
+"""
+
+from contextlib import contextmanager
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import registry
+
+SLOWEST_KEPT = 5
+DEFAULT_N_PLUS_ONE_THRESHOLD = 3
+
+SQL_QUERIES_PER_REQUEST = registry.histogram(
+    'agri_sql_queries_per_request', 'SQL statements executed per request', ('endpoint',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250))
+SQL_TIME_PER_REQUEST = registry.histogram(
+    'agri_sql_duration_seconds', 'Total SQL time per request', ('endpoint',))
+SQL_N_PLUS_ONE = registry.counter(
+    'agri_sql_n_plus_one_total', 'Requests with a repeated statement shape (probable N+1)', ('endpoint',))
+
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def statement_shape(statement):
+    """Normalise a statement so the same query with different parameters compares equal"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _LITERALS.sub('?', shape)
+    return _IN_LIST.sub('(?)', shape)
+
+
+class QueryStats:
+    """Statements collected during one request or one budget block"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = {}
+        self.slowest = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if len(self.slowest) < SLOWEST_KEPT or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, shape))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+
+    def repeated_shapes(self, threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+        """Statement shapes executed at least threshold times, most repeated first"""
+        repeated = [(count, shape) for shape, count in self.shapes.items() if count >= threshold]
+        return sorted(repeated, reverse=True)
+
+    def summary(self):
+        lines = [f"{self.count} queries, {self.total_time * 1000:.1f}ms total"]
+        for count, shape in self.repeated_shapes():
+            lines.append(f"  N+1 x{count}: {shape[:200]}")
+        for duration, shape in self.slowest:
+            lines.append(f"  {duration * 1000:.1f}ms: {shape[:200]}")
+        return '\n'.join(lines)
+
+
+_active = threading.local()
+
+
+def _collectors():
+    stack = getattr(_active, 'stack', None)
+    if stack is None:
+        stack = _active.stack = []
+    return stack
+
+
+@contextmanager
+def collect_queries(label=None):
+    """Collect every statement executed on this thread inside the block"""
+    stats = QueryStats(label)
+    stack = _collectors()
+    stack.append(stats)
+    try:
+        yield stats
+    finally:
+        stack.remove(stats)
+
+
+@contextmanager
+def assert_query_budget(max_queries, allow_n_plus_one=False, threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+    """Test helper: fail if the block runs more than max_queries statements or an N+1 pattern"""
+    with collect_queries('budget') as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise AssertionError(f"Query budget exceeded: {stats.count} > {max_queries}\n{stats.summary()}")
+    if not allow_n_plus_one and stats.repeated_shapes(threshold):
+        raise AssertionError(f"Probable N+1 query pattern\n{stats.summary()}")
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_active, 'stack', None):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = getattr(_active, 'stack', None)
+    started = conn.info.get('_query_started')
+    if not stack or not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    for stats in stack:
+        stats.record(statement, duration)
+
+
+def init_app(app):
+    """Attribute SQL statements to Flask requests and report them"""
+    from flask import g, request
+
+    app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+    app.config.setdefault('SQL_DEBUG_HEADERS', app.debug)
+
+    @app.before_request
+    def _start_query_collection():
+        g._sql_collector = collect_queries(request.endpoint or 'unmatched')
+        g._sql_stats = g._sql_collector.__enter__()
+
+    @app.after_request
+    def _add_query_headers(response):
+        stats = g.get('_sql_stats')
+        if stats is not None and (app.config['SQL_DEBUG_HEADERS'] or app.debug):
+            repeated = stats.repeated_shapes(app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+            response.headers['X-SQL-Query-Count'] = str(stats.count)
+            response.headers['X-SQL-Time-Ms'] = f"{stats.total_time * 1000:.2f}"
+            if stats.slowest:
+                response.headers['X-SQL-Slowest'] = f"{stats.slowest[0][0] * 1000:.2f}ms {stats.slowest[0][1][:200]}"
+            if repeated:
+                response.headers['X-SQL-N-Plus-One'] = f"x{repeated[0][0]} {repeated[0][1][:200]}"
+        return response
+
+    @app.teardown_request
+    def _finish_query_collection(exc):
+        collector = g.pop('_sql_collector', None)
+        stats = g.pop('_sql_stats', None)
+        if collector is None:
+            return
+        collector.__exit__(None, None, None)
+        endpoint = stats.label
+        SQL_QUERIES_PER_REQUEST.observe(stats.count, endpoint=endpoint)
+        SQL_TIME_PER_REQUEST.observe(stats.total_time, endpoint=endpoint)
+        if stats.repeated_shapes(app.config['SQL_N_PLUS_ONE_THRESHOLD']):
+            SQL_N_PLUS_ONE.inc(endpoint=endpoint)
+            if app.debug:
+                print(f"⚠️ Probable N+1 in {endpoint}: {stats.summary()}")
@@ -0,0 +1,249 @@
+"""
+Lightweight Request Tracing
+For Agriculture Advisory System
+
+Parent/child timing spans for the stages of a request, exported to a local
+JSON-lines file or kept in an in-memory collector. No external tracing
+service is needed. The current span travels in a contextvar, so nested
+span() blocks and @traced functions link to their parent automatically.
+
+    with tracing.span('voice.translate', target_language='hi'):
+        ...
+
+When no exporter is configured, span() yields a shared no-op span, so an
+instrumented call costs one attribute check.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import json
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed stage of a trace"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_time', 'end_time',
+                 'attributes', 'status', '_started')
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = 'ok'
+        self.start_time = time.time()
+        self.end_time = None
+        self._started = time.perf_counter()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.end_time = self.start_time + (time.perf_counter() - self._started)
+
+    @property
+    def duration_ms(self):
+        return round((self.end_time - self.start_time) * 1000, 3) if self.end_time else None
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+
+class _NoopSpan:
+    """Stand-in yielded when tracing is disabled"""
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class InMemoryCollector:
+    """Keeps the most recent finished spans in memory, for tests and debugging"""
+
+    def __init__(self, max_spans=10000):
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span):
+        self._spans.append(span.to_dict())
+
+    def spans(self, trace_id=None, name=None):
+        return [s for s in list(self._spans)
+                if (trace_id is None or s['trace_id'] == trace_id) and (name is None or s['name'] == name)]
+
+    def clear(self):
+        self._spans.clear()
+
+
+class JsonLinesExporter:
+    """Appends one JSON object per finished span to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', buffering=1)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the configured exporter"""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if self.exporter is None:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent is not None else f'{random.getrandbits(128):032x}'
+        current = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except Exception as e:
+            current.status = 'error'
+            current.attributes['error'] = str(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            current.finish()
+            self.exporter.export(current)
+
+
+tracer = Tracer()
+
+
+def span(name, **attributes):
+    """Open a child of the current span (or a new trace) on the global tracer"""
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def set_attribute(key, value):
+    """Set an attribute on the innermost open span, if any"""
+    active = _current_span.get()
+    if active is not None:
+        active.set_attribute(key, value)
+
+
+def traced(name, **attributes):
+    """Decorator wrapping every call of a function in a span"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer.exporter is None:
+                return func(*args, **kwargs)
+            with tracer.span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configure(exporter):
+    tracer.exporter = exporter
+    return exporter
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    if tracer.exporter is None or _current_span.get() is None:
+        return
+    sql_span = tracer.span('sql.query', statement=' '.join(statement.split())[:300], executemany=executemany)
+    conn.info.setdefault('_trace_spans', []).append((sql_span, sql_span.__enter__()))
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_sql_span(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get('_trace_spans')
+    if not stack:
+        return
+    sql_span, active = stack.pop()
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        active.set_attribute('rowcount', cursor.rowcount)
+    sql_span.__exit__(None, None, None)
+
+
+def init_app(app):
+    """Open a root span per request and configure the exporter from app config
+
+    TRACING_EXPORTER is 'jsonl' (spans go to TRACE_FILE), 'memory' (spans go
+    to an InMemoryCollector at app.extensions['trace_collector']) or unset
+    to disable tracing.
+    """
+    app.config.setdefault('TRACING_EXPORTER', os.environ.get('TRACING_EXPORTER'))
+    app.config.setdefault('TRACE_FILE', os.path.join('logs', 'traces.jsonl'))
+
+    exporter_name = app.config['TRACING_EXPORTER']
+    if exporter_name == 'jsonl':
+        configure(JsonLinesExporter(app.config['TRACE_FILE']))
+    elif exporter_name == 'memory':
+        app.extensions['trace_collector'] = configure(InMemoryCollector())
+    else:
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_span():
+        g._trace_span = tracer.span(f'http {request.endpoint or "unmatched"}',
+                                    method=request.method, path=request.path)
+        g._trace_active = g._trace_span.__enter__()
+
+    @app.after_request
+    def _tag_response(response):
+        active = g.get('_trace_active')
+        if active is not None:
+            active.set_attribute('status_code', response.status_code)
+            response.headers['X-Trace-Id'] = active.trace_id
+        return response
+
+    @app.teardown_request
+    def _finish_request_span(exc):
+        request_span = g.pop('_trace_span', None)
+        g.pop('_trace_active', None)
+        if request_span is not None:
+            if exc is not None:
+                request_span.__exit__(type(exc), exc, exc.__traceback__)
+            else:
+                request_span.__exit__(None, None, None)
@@ -24,8 +24,13 @@ from tensorflow.keras.layers import Dense, Conv2D, MaxPooling2D, Flatten, Dropou
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import os
 import warnings
+from model_artifacts import save_forest_artifact
 warnings.filterwarnings('ignore')
 
+CROP_FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+FERTILIZER_FEATURES = ['Temparature', 'Humidity', 'Moisture', 'Soil Type',
+                       'Crop Type', 'Nitrogen', 'Potassium', 'Phosphorous']
+
 class CropRecommendationModel:
     """Crop Recommendation Model using Random Forest"""
 
@@ -76,7 +81,7 @@ class CropRecommendationModel:
         df = self.prepare_data(csv_file_path)
 
         # Features and target
-        X = df[['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']]
+        X = df[CROP_FEATURES]
         y = df['label']
 
         # Encode labels
@@ -125,8 +130,9 @@ class CropRecommendationModel:
 
         return recommendations
 
-    def save_model(self, model_path='models/crop_recommendation_model.pkl'):
-        """Save the trained model"""
+    def save_model(self, model_path='models/crop_recommendation_model.pkl',
+                   artifact_dir='models/crop_recommendation', model_version=None):
+        """Save the trained model as a pickle and as a memory-mappable artifact"""
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
         model_data = {
             'model': self.model,
@@ -137,6 +143,11 @@ class CropRecommendationModel:
             pickle.dump(model_data, f)
         print(f"✅ Model saved to {model_path}")
 
+        version_dir = save_forest_artifact(artifact_dir, self.model, self.scaler, self.label_encoder,
+                                           CROP_FEATURES, model_version=model_version)
+        print(f"✅ Model artifact saved to {version_dir}")
+        return version_dir
+
 class FertilizerRecommendationModel:
     """Fertilizer Recommendation Model"""
 
@@ -180,8 +191,7 @@ class FertilizerRecommendationModel:
         df_encoded['Crop Type'] = LabelEncoder().fit_transform(df['Crop Type'])
 
         # Features and target
-        X = df_encoded[['Temparature', 'Humidity', 'Moisture', 'Soil Type', 
-                       'Crop Type', 'Nitrogen', 'Potassium', 'Phosphorous']]
+        X = df_encoded[FERTILIZER_FEATURES]
         y = df_encoded['Fertilizer Name']
 
         # Encode target
@@ -206,8 +216,9 @@ class FertilizerRecommendationModel:
 
         return accuracy
 
-    def save_model(self, model_path='models/fertilizer_recommendation_model.pkl'):
-        """Save the trained model"""
+    def save_model(self, model_path='models/fertilizer_recommendation_model.pkl',
+                   artifact_dir='models/fertilizer_recommendation', model_version=None):
+        """Save the trained model as a pickle and as a memory-mappable artifact"""
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
         model_data = {
             'model': self.model,
@@ -218,6 +229,11 @@ class FertilizerRecommendationModel:
             pickle.dump(model_data, f)
         print(f"✅ Model saved to {model_path}")
 
+        version_dir = save_forest_artifact(artifact_dir, self.model, self.scaler, self.label_encoder,
+                                           FERTILIZER_FEATURES, model_version=model_version)
+        print(f"✅ Model artifact saved to {version_dir}")
+        return version_dir
+
 class DiseaseDetectionModel:
     """Disease Detection Model using CNN"""
 
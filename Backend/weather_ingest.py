@@ -0,0 +1,299 @@
+"""
+Bulk Weather Ingestion
+For Agriculture Advisory System
+
+Streams daily weather feeds (CSV or NDJSON, optionally gzipped) into
+weather_data. The feed is read in fixed-size chunks. Each chunk is validated
+column-wise with pandas, and valid rows are upserted on the
+unique_location_date constraint with a single executemany per chunk, so
+memory use does not depend on the file size. The weekly, monthly and
+seasonal rollups a chunk touches, and the weather features of farms at its
+locations, are refreshed in the same transaction.
+
+Upsert SQL:
+- PostgreSQL, and SQLite 3.24+: INSERT ... ON CONFLICT (location_id, date) DO UPDATE
+- older SQLite: INSERT OR REPLACE
+
+POST /api/weather/ingest takes feeds of up to WEATHER_INGEST_MAX_ROWS rows
+(counted before anything is written), so a request finishes well within the
+worker timeout. Bulk feeds of millions of rows go through the command line,
+which has no time limit.
+
+Usage:
+    python weather_ingest.py daily_weather.csv.gz --chunk-size 50000
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import gzip
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from data_versions import mark_changed
+from flask_models import db, Location, WeatherData
+from metrics import registry
+from weather_rollups import update_rollups
+from farm_features import update_farm_weather
+
+DEFAULT_CHUNK_SIZE = 50000
+MAX_REJECT_EXAMPLES = 20
+# Bytes per row allowed when spooling an API feed; bounds a feed of very long lines
+MAX_ROW_BYTES = 1024
+SPOOL_BLOCK = 1024 * 1024
+
+# Column -> (min, max) accepted range; values outside are rejected with the row
+NUMERIC_RANGES = {
+    'temperature_max': (-30, 60),
+    'temperature_min': (-40, 55),
+    'temperature_avg': (-35, 58),
+    'humidity': (0, 100),
+    'rainfall': (0, 1500),
+    'wind_speed': (0, 250),
+    'solar_radiation': (0, 1500),
+    'evapotranspiration': (0, 30),
+    'pressure': (800, 1100),
+    'cloud_cover': (0, 100)
+}
+VALUE_COLUMNS = tuple(NUMERIC_RANGES) + ('wind_direction',)
+UPSERT_COLUMNS = ('location_id', 'date') + VALUE_COLUMNS + ('created_at',)
+
+WEATHER_ROWS_INGESTED = registry.counter(
+    'agri_weather_ingest_rows_total', 'Weather feed rows by ingestion result', ('result',))
+
+
+class FeedTooLargeError(ValueError):
+    """Raised when a feed sent to the API exceeds its row limit"""
+
+
+def spool_feed(source, compression=None, max_rows=None):
+    """Copy a binary feed, decompressed, to a temporary file, counting its rows
+
+    Raises FeedTooLargeError as soon as the feed passes max_rows (plus a CSV
+    header line), before any row is written to the database.
+    """
+    if compression == 'gzip':
+        source = gzip.GzipFile(fileobj=source)
+    spooled = tempfile.TemporaryFile()
+    lines, size = 0, 0
+    try:
+        for block in iter(lambda: source.read(SPOOL_BLOCK), b''):
+            lines += block.count(b'\n')
+            size += len(block)
+            if max_rows is not None and (lines > max_rows + 1 or size > (max_rows + 1) * MAX_ROW_BYTES):
+                raise FeedTooLargeError(f"Feed has more than {max_rows:,} rows; "
+                                        f"ingest it with: python weather_ingest.py <feed>")
+            spooled.write(block)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
+
+
+class IngestStats:
+    """Running totals for one ingestion run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.rows_duplicate = 0
+        self.chunks = 0
+        self.reject_reasons = {}
+        self.reject_examples = []
+
+    def reject(self, reason, rows):
+        count = len(rows)
+        if not count:
+            return
+        self.rows_rejected += count
+        self.reject_reasons[reason] = self.reject_reasons.get(reason, 0) + count
+        room = MAX_REJECT_EXAMPLES - len(self.reject_examples)
+        if room > 0:
+            for record in rows.head(room).to_dict('records'):
+                self.reject_examples.append({'reason': reason, 'row': {k: str(v) for k, v in record.items()}})
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'rows_rejected': self.rows_rejected,
+            'rows_duplicate': self.rows_duplicate,
+            'chunks': self.chunks,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'reject_reasons': self.reject_reasons,
+            'reject_examples': self.reject_examples
+        }
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def read_chunks(source, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE, compression='infer'):
+    """Yield DataFrames of at most chunk_size rows from a path or binary file object"""
+    if fmt == 'ndjson':
+        reader = pd.read_json(source, lines=True, chunksize=chunk_size, dtype=False, compression=compression)
+    else:
+        reader = pd.read_csv(source, chunksize=chunk_size, compression=compression)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def validate_chunk(chunk, known_locations, stats):
+    """Coerce and range-check a raw chunk; return the valid rows, recording rejects in stats"""
+    chunk = chunk.rename(columns=lambda name: str(name).strip().lower())
+    missing = {'location_id', 'date'} - set(chunk.columns)
+    if missing:
+        raise ValueError(f"Feed is missing required columns: {', '.join(sorted(missing))}")
+
+    frame = pd.DataFrame(index=chunk.index)
+    frame['location_id'] = pd.to_numeric(chunk['location_id'], errors='coerce')
+    frame['date'] = pd.to_datetime(chunk['date'], errors='coerce', format='ISO8601').dt.strftime('%Y-%m-%d')
+
+    bad = frame['location_id'].isna() | frame['date'].isna()
+    stats.reject('missing_or_invalid_key', chunk[bad])
+    keep = ~bad
+
+    unknown = keep & ~frame['location_id'].isin(known_locations)
+    stats.reject('unknown_location', chunk[unknown])
+    keep &= ~unknown
+
+    for column, (low, high) in NUMERIC_RANGES.items():
+        if column not in chunk.columns:
+            frame[column] = np.nan
+            continue
+        raw = chunk[column]
+        values = pd.to_numeric(raw, errors='coerce')
+        # Only values that failed to parse need the (slow) string check for blanks
+        suspect = keep & values.isna() & raw.notna()
+        unparseable = suspect & (raw[suspect].astype(str).str.strip() != '').reindex(raw.index, fill_value=False)
+        out_of_range = keep & ((values < low) | (values > high))
+        stats.reject(f'invalid_{column}', chunk[unparseable | out_of_range])
+        keep &= ~(unparseable | out_of_range)
+        frame[column] = values.round(2)
+
+    inverted = keep & (frame['temperature_min'] > frame['temperature_max'])
+    stats.reject('temperature_min_above_max', chunk[inverted])
+    keep &= ~inverted
+
+    frame['wind_direction'] = (chunk['wind_direction'].astype(str).str.strip().str[:10]
+                               .where(chunk['wind_direction'].notna()) if 'wind_direction' in chunk.columns else None)
+
+    valid = frame[keep].copy()
+    valid['location_id'] = valid['location_id'].astype(int)
+    # A feed may repeat a day; the last reading wins, as it would row by row
+    deduplicated = valid.drop_duplicates(['location_id', 'date'], keep='last')
+    stats.rows_duplicate += len(valid) - len(deduplicated)
+    return deduplicated
+
+
+def upsert_sql(dialect_name, paramstyle):
+    """Build the batched upsert statement for this database"""
+    placeholders = ', '.join(['?' if paramstyle == 'qmark' else '%s'] * len(UPSERT_COLUMNS))
+    columns = ', '.join(UPSERT_COLUMNS)
+    table = WeatherData.__tablename__
+    if dialect_name == 'sqlite' and sqlite3.sqlite_version_info < (3, 24, 0):
+        return f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})"
+    updates = ', '.join(f"{column} = excluded.{column}" for column in VALUE_COLUMNS)
+    return (f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (location_id, date) DO UPDATE SET {updates}")
+
+
+def _chunk_rows(frame, created_at):
+    """Turn a validated frame into parameter tuples, with NaN sent as NULL"""
+    columns = [frame['location_id'].tolist(), frame['date'].tolist()]
+    for column in VALUE_COLUMNS:
+        series = frame[column]
+        columns.append(series.astype(object).where(series.notna(), None).tolist())
+    columns.append([created_at] * len(frame))
+    return list(zip(*columns))
+
+
+def print_progress(stats):
+    print(f"🌤️ {stats.rows_read:,} rows read, {stats.rows_written:,} upserted, {stats.rows_duplicate:,} duplicate, "
+          f"{stats.rows_rejected:,} rejected ({stats.rows_per_sec:,.0f} rows/s)")
+
+
+def ingest_weather(source, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=print_progress, on_chunk=None,
+                   compression='infer'):
+    """Stream a weather feed into weather_data and return an IngestStats
+
+    source is a path or a binary file object. Each chunk is committed on its
+    own, so an interrupted run keeps every chunk finished before it, and
+    re-running the same feed is harmless. on_chunk(frame) is called with each
+    committed frame of valid rows.
+    """
+    fmt = fmt or detect_format(source if isinstance(source, str) else getattr(source, 'name', ''))
+    stats = IngestStats()
+    known_locations = [row[0] for row in db.session.query(Location.id)]
+    connection = db.session.connection()
+    sql = upsert_sql(connection.dialect.name, connection.dialect.paramstyle)
+    created_at = datetime.utcnow().isoformat(' ')
+
+    for chunk in read_chunks(source, fmt, chunk_size, compression):
+        stats.rows_read += len(chunk)
+        stats.chunks += 1
+        valid = validate_chunk(chunk, known_locations, stats)
+        if len(valid):
+            try:
+                db.session.connection().exec_driver_sql(sql, _chunk_rows(valid, created_at))
+                mark_changed(db.session, WeatherData.__tablename__)
+                update_rollups(valid)
+                update_farm_weather(valid['location_id'].unique().tolist())
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            stats.rows_written += len(valid)
+            if on_chunk is not None:
+                on_chunk(valid)
+        if progress is not None:
+            progress(stats)
+
+    WEATHER_ROWS_INGESTED.inc(stats.rows_written, result='upserted')
+    WEATHER_ROWS_INGESTED.inc(stats.rows_duplicate, result='duplicate')
+    WEATHER_ROWS_INGESTED.inc(stats.rows_rejected, result='rejected')
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream a daily weather feed into weather_data')
+    parser.add_argument('feed', help='CSV or NDJSON file (optionally .gz)')
+    parser.add_argument('--format', choices=('csv', 'ndjson'))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        stats = ingest_weather(args.feed, args.format, args.chunk_size)
+    summary = stats.to_dict()
+    print(f"✅ Ingested {summary['rows_written']:,} rows in {summary['seconds']}s "
+          f"({summary['rows_per_sec']:,.0f} rows/s), {summary['rows_duplicate']:,} duplicate, "
+          f"rejected {summary['rows_rejected']:,}")
+    for reason, count in sorted(summary['reject_reasons'].items()):
+        print(f"   • {reason}: {count:,}")
+
+
+if __name__ == '__main__':
+    main()
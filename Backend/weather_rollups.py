@@ -0,0 +1,279 @@
+"""
+Weather Rollups
+For Agriculture Advisory System
+
+Weekly, monthly and seasonal (kharif/rabi/zaid) summaries of weather_data per
+location, kept in weather_rollups so trend views over years read a few dozen
+rows instead of every daily reading.
+
+Rollups are maintained incrementally. When daily rows arrive, only the
+periods they fall in are recomputed, from weather_data for the affected
+locations over the enclosing season. Recomputing rather than adding makes a
+corrected reading (an upsert over an existing day) replace its old value.
+
+Seasons follow the Indian cropping calendar:
+- kharif: June-October, labelled by year ("kharif 2025")
+- rabi: November-March, labelled by the years it spans ("rabi 2025-26")
+- zaid: April-May
+
+Usage:
+    python weather_rollups.py --rebuild
+"""
+
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Float, String, select, type_coerce
+
+from flask_models import db, WeatherData, WeatherRollup
+
+PERIODS = ('week', 'month', 'season')
+ROLLUP_COLUMNS = ('location_id', 'period_type', 'period_start', 'period_end', 'label', 'season', 'days',
+                  'temperature_avg', 'temperature_min', 'temperature_max', 'rainfall_total', 'humidity_avg',
+                  'evapotranspiration_total', 'updated_at')
+VALUE_COLUMNS = ROLLUP_COLUMNS[3:]
+DAILY_COLUMNS = ('location_id', 'date', 'temperature_max', 'temperature_min', 'temperature_avg', 'humidity',
+                 'rainfall', 'evapotranspiration')
+
+# Season -> (first month, length in months)
+SEASONS = {'kharif': (6, 5), 'rabi': (11, 5), 'zaid': (4, 2)}
+
+# Period -> range returned by the API when no start date is given
+DEFAULT_RANGE_DAYS = {'week': 182, 'month': 730, 'season': 5 * 365}
+
+# Locations loaded per query, below SQLite's bound-parameter limit
+LOCATION_BATCH = 500
+
+
+def season_of(months):
+    """Season name for each month number"""
+    months = np.asarray(months)
+    return np.where((months >= 11) | (months <= 3), 'rabi', np.where(months >= 6, 'kharif', 'zaid'))
+
+
+def period_starts(dates, period):
+    """First day of the week (Monday), month or season containing each date"""
+    if period == 'week':
+        return dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+    if period == 'month':
+        return dates.dt.to_period('M').dt.start_time
+    months = dates.dt.month.to_numpy()
+    seasons = season_of(months)
+    start_month = np.select([seasons == 'rabi', seasons == 'kharif'], [11, 6], 4)
+    start_year = dates.dt.year.to_numpy() - (months <= 3)
+    return pd.Series(pd.to_datetime(pd.DataFrame({'year': start_year, 'month': start_month, 'day': 1})).to_numpy(),
+                     index=dates.index)
+
+
+def _describe(starts, period):
+    """period_end, label and season for aggregated period starts"""
+    if period == 'week':
+        iso = starts.dt.isocalendar()
+        return starts + pd.Timedelta(days=6), iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2), None
+    if period == 'month':
+        return starts + pd.offsets.MonthEnd(0), starts.dt.strftime('%Y-%m'), None
+    seasons = pd.Series(season_of(starts.dt.month), index=starts.index)
+    ends = starts.copy()
+    for season, (_, length) in SEASONS.items():
+        mask = seasons == season
+        ends[mask] = starts[mask] + pd.DateOffset(months=length) - pd.Timedelta(days=1)
+    years = starts.dt.year
+    labels = seasons + ' ' + years.astype(str)
+    rabi = seasons == 'rabi'
+    labels[rabi] = labels[rabi] + '-' + ((years[rabi] + 1) % 100).map('{:02d}'.format)
+    return ends, labels, seasons
+
+
+def aggregate(daily):
+    """Roll daily rows up into every period type; returns one DataFrame of rollup rows
+
+    daily needs location_id, date (datetime64) and the DAILY_COLUMNS readings.
+    """
+    daily = daily.copy()
+    # Feeds without a daily mean still have a max and min
+    daily['temperature_avg'] = daily['temperature_avg'].fillna((daily['temperature_max'] + daily['temperature_min']) / 2)
+    frames = []
+    for period in PERIODS:
+        daily['period_start'] = period_starts(daily['date'], period)
+        grouped = daily.groupby(['location_id', 'period_start'], sort=True).agg(
+            days=('date', 'count'),
+            temperature_avg=('temperature_avg', 'mean'),
+            temperature_min=('temperature_min', 'min'),
+            temperature_max=('temperature_max', 'max'),
+            rainfall_total=('rainfall', 'sum'),
+            rainfall_days=('rainfall', 'count'),
+            humidity_avg=('humidity', 'mean'),
+            evapotranspiration_total=('evapotranspiration', 'sum'),
+            evapotranspiration_days=('evapotranspiration', 'count')
+        ).reset_index()
+        # A period with no readings at all has an unknown total, not zero
+        for total in ('rainfall', 'evapotranspiration'):
+            grouped[f'{total}_total'] = grouped[f'{total}_total'].where(grouped.pop(f'{total}_days') > 0)
+        grouped['period_end'], grouped['label'], grouped['season'] = _describe(grouped['period_start'], period)
+        grouped['period_type'] = period
+        frames.append(grouped)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _load_daily(location_ids, start, end):
+    """Daily readings for these locations between start and end, inclusive"""
+    table = WeatherData.__table__
+    # Read raw dates and float readings; Date and Numeric would build a Python object per value
+    columns = [table.c.location_id, type_coerce(table.c.date, String)] + [
+        type_coerce(table.c[column], Float) for column in DAILY_COLUMNS[2:]]
+    frames = []
+    ids = sorted(location_ids)
+    for offset in range(0, len(ids), LOCATION_BATCH):
+        query = select(*columns).where(table.c.location_id.in_(ids[offset:offset + LOCATION_BATCH]))
+        if start is not None:
+            query = query.where(table.c.date >= start, table.c.date <= end)
+        frames.append(pd.DataFrame(db.session.connection().execute(query).fetchall(), columns=DAILY_COLUMNS))
+    daily = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=DAILY_COLUMNS)
+    daily['date'] = pd.to_datetime(daily['date'], format='ISO8601')
+    daily[list(DAILY_COLUMNS[2:])] = daily[list(DAILY_COLUMNS[2:])].astype(float)
+    return daily
+
+
+def upsert_sql(dialect_name, paramstyle):
+    """Batched upsert on the (location_id, period_type, period_start) key"""
+    placeholders = ', '.join(['?' if paramstyle == 'qmark' else '%s'] * len(ROLLUP_COLUMNS))
+    columns = ', '.join(ROLLUP_COLUMNS)
+    table = WeatherRollup.__tablename__
+    if dialect_name == 'sqlite' and sqlite3.sqlite_version_info < (3, 24, 0):
+        return f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})"
+    updates = ', '.join(f"{column} = excluded.{column}" for column in VALUE_COLUMNS)
+    return (f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (location_id, period_type, period_start) DO UPDATE SET {updates}")
+
+
+def write_rollups(rollups):
+    """Upsert aggregated rollup rows with one executemany; returns the row count"""
+    if not len(rollups):
+        return 0
+    updated_at = datetime.utcnow().isoformat(' ')
+    columns = []
+    for column in ROLLUP_COLUMNS[:-1]:
+        series = rollups[column]
+        if column in ('period_start', 'period_end'):
+            series = series.dt.strftime('%Y-%m-%d')
+        elif series.dtype.kind == 'f':
+            series = series.round(2)
+        columns.append(series.astype(object).where(series.notna(), None).tolist())
+    columns.append([updated_at] * len(rollups))
+    connection = db.session.connection()
+    connection.exec_driver_sql(upsert_sql(connection.dialect.name, connection.dialect.paramstyle),
+                               list(zip(*columns)))
+    return len(rollups)
+
+
+def _window(start, end):
+    """Dates to load so every week, month and season touching [start, end] is whole"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    bounds = pd.Series([start, end])
+    season_starts = period_starts(bounds, 'season')
+    low = min(period_starts(bounds, 'week')[0], season_starts[0])
+    high = max(end + pd.Timedelta(days=6 - end.weekday()), _describe(season_starts, 'season')[0][1])
+    return low, high
+
+
+def refresh_rollups(location_ids, start, end):
+    """Recompute every period that contains a day between start and end for these locations"""
+    low, high = _window(start, end)
+    rollups = aggregate(_load_daily(location_ids, low.date(), high.date()))
+    # Periods cut off by the loaded window would be aggregated from partial data
+    complete = (rollups['period_start'] >= low) & (rollups['period_end'] <= high)
+    return write_rollups(rollups[complete])
+
+
+def update_rollups(frame):
+    """Refresh the rollups touched by a frame of newly written daily rows
+
+    One load and one aggregation per frame; only the touched periods are
+    written. weather_ingest calls this inside each chunk's transaction, so a
+    chunk and its rollups commit together; the caller commits.
+    """
+    if not len(frame):
+        return 0
+    dates = pd.to_datetime(frame['date'])
+    location_ids = frame['location_id'].to_numpy()
+    low, high = _window(dates.min(), dates.max())
+    daily = _load_daily(set(location_ids.tolist()), low.date(), high.date())
+    touched = pd.concat([pd.DataFrame({'location_id': location_ids, 'period_type': period,
+                                       'period_start': period_starts(dates, period).to_numpy()})
+                         for period in PERIODS]).drop_duplicates()
+    return write_rollups(aggregate(daily).merge(touched, on=['location_id', 'period_type', 'period_start']))
+
+
+def rebuild_rollups(location_ids=None):
+    """Recompute rollups from weather_data for these locations (default all), a batch at a time"""
+    if location_ids is None:
+        location_ids = [row[0] for row in db.session.query(WeatherData.location_id).distinct()]
+    location_ids = sorted(location_ids)
+    written = 0
+    for offset in range(0, len(location_ids), LOCATION_BATCH):
+        batch = location_ids[offset:offset + LOCATION_BATCH]
+        WeatherRollup.query.filter(WeatherRollup.location_id.in_(batch)).delete(synchronize_session=False)
+        written += write_rollups(aggregate(_load_daily(batch, None, None)))
+    db.session.commit()
+    return written
+
+
+def get_rollups(location_id, period, start=None, end=None):
+    """Rollups of one period type overlapping [start, end], oldest first
+
+    Defaults to the DEFAULT_RANGE_DAYS window ending today.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    end = end or date.today()
+    start = start or end - timedelta(days=DEFAULT_RANGE_DAYS[period])
+    if start > end:
+        raise ValueError('start must not be after end')
+
+    rows = WeatherRollup.query.filter(
+        WeatherRollup.location_id == location_id,
+        WeatherRollup.period_type == period,
+        WeatherRollup.period_start <= end,
+        WeatherRollup.period_end >= start
+    ).order_by(WeatherRollup.period_start).all()
+
+    def number(value):
+        return float(value) if value is not None else None
+
+    return [{
+        'period_start': row.period_start.strftime('%Y-%m-%d'),
+        'period_end': row.period_end.strftime('%Y-%m-%d'),
+        'label': row.label,
+        'season': row.season,
+        'days': row.days,
+        'temperature_avg': number(row.temperature_avg),
+        'temperature_min': number(row.temperature_min),
+        'temperature_max': number(row.temperature_max),
+        'rainfall_total': number(row.rainfall_total),
+        'humidity_avg': number(row.humidity_avg),
+        'evapotranspiration_total': number(row.evapotranspiration_total)
+    } for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain weekly, monthly and seasonal weather rollups')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute every rollup from weather_data')
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    os.environ.setdefault('SKIP_WARMUP', '1')
+    from complete_app import app
+
+    with app.app_context():
+        written = rebuild_rollups()
+    print(f"✅ Rebuilt {written:,} weather rollups")
+
+
+if __name__ == '__main__':
+    main()